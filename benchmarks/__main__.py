@@ -0,0 +1,85 @@
+import json
+import platform
+import sys
+import time
+
+from pyrail.utils.cli.cli import Cli
+from benchmarks import (driver, cli, layout, ramp, recorder, routes,
+        server, startup)
+from benchmarks.utils import SimulatorProcess
+
+
+class BenchmarkCli(Cli):
+    """pyrail benchmarks
+
+    Measures the throughput and latency of the DCC++ driver, the dccpp tool
+    and its TCP server against a simulated base station and prints the
+    results as JSON.
+    Fails, if the startup of the dccpp tool exceeds its time budget.
+    """
+
+    SUITES = {
+        "driver": driver.run,
+        "cli": cli.run,
+        "server": server.run,
+        "layout": layout.run,
+        "ramp": ramp.run,
+        "recorder": recorder.run,
+        "routes": routes.run,
+        "startup": startup.run,
+    }
+
+    def __init__(self):
+        super(BenchmarkCli, self).__init__("pyrail-bench")
+
+    def define_argparser(self):
+        parser = super(BenchmarkCli, self).define_argparser()
+        parser.add_argument("-n", "--count", type=int, default=1000,
+                help="Number of commands per benchmark (default: 1000)")
+        parser.add_argument("-b", "--baudrate", type=int, default=0,
+                help="Baudrate of the simulator, 0 for unlimited")
+        parser.add_argument("--process-time", type=float, default=0.0,
+                metavar="SEC", help="Simulated time to process a command")
+        parser.add_argument("-o", "--output", metavar="FILE",
+                help="Write the results to FILE instead of stdout")
+        parser.add_argument("suites", nargs="*", metavar="SUITE",
+                help="Benchmark suites to run: %s (default: all)" %
+                ", ".join(self.SUITES))
+        return parser
+
+    def run(self, args):
+        for name in args.suites:
+            if name not in self.SUITES:
+                raise Cli.Error("Unknown benchmark suite '%s'!" % name)
+        results = {
+            "version": self.version,
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+            "params": {"count": args.count, "baudrate": args.baudrate,
+                    "process_time": args.process_time},
+        }
+        sim = SimulatorProcess(args.baudrate, args.process_time)
+        with sim:
+            for name in args.suites or self.SUITES:
+                results[name] = self.SUITES[name](sim.port, args.count)
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                f.write(output + "\n")
+        else:
+            sys.stdout.write(output + "\n")
+        if not results.get("startup", {}).get("within_budget", True):
+            raise Cli.Error("Startup of %s exceeds its budget!" %
+                    startup.MODULE)
+        return True
+
+
+def main():
+    bench = BenchmarkCli()
+    bench.start()
+
+
+### MAIN PROGRAM
+
+if __name__ == "__main__":
+    main()
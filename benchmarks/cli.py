@@ -0,0 +1,102 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from pyrail.tools.dccpp import DCCppCli
+from benchmarks.utils import Timer, python_env, percentile
+
+
+# Two values per command, alternated so no command is dropped as unchanged
+COMMANDS = {
+    "throttle": ("throttle 3 40", "throttle 3 41"),
+    "point": ("point 5 0", "point 5 1"),
+    "light": ("light 3 0", "light 3 1"),
+}
+
+
+def dispatch(port, count):
+    """Time of a shell command line from parsing until it was sent"""
+    cli = DCCppCli()
+    cli.cfg.port = port
+    cli.create(None)
+    results = {}
+    try:
+        for name, values in COMMANDS.items():
+            lines = [values[i % 2] for i in range(count)]
+            with Timer() as timer:
+                for line in lines:
+                    cli.onecmd(line)
+            results[name] = {
+                "commands_per_sec": round(count / timer.wall, 1),
+                "cpu_us_per_command": round(timer.cpu / count * 1e6, 2),
+            }
+    finally:
+        cli.cleanup()
+    return results
+
+
+def _feed(fd, lines):
+    with os.fdopen(fd, "w") as f:
+        f.write("".join("%s\n" % line for line in lines))
+
+
+def async_dispatch(port, count):
+    """Rate of piped command lines run by the asynchronous shell loop
+
+    The point is switched back and forth, so no command is dropped as
+    unchanged. The same lines are dispatched by onecmd for comparison.
+    """
+    lines = ["point 5 %d" % (i % 2) for i in range(count)]
+    cli = DCCppCli()
+    cli.cfg.port = port
+    cli.create(None)
+    try:
+        with Timer() as direct:
+            for line in lines:
+                cli.onecmd(line)
+        read_fd, write_fd = os.pipe()
+        # The lines exceed the capacity of the pipe, they are fed by a thread
+        feeder = threading.Thread(target=_feed, args=(write_fd, lines))
+        feeder.start()
+        cli.stdin = os.fdopen(read_fd)
+        with Timer() as timer:
+            cli.async_cmdloop()
+        feeder.join()
+        cli.stdin.close()
+    finally:
+        cli.cleanup()
+    return {
+        "onecmd_per_sec": round(count / direct.wall, 1),
+        "commands_per_sec": round(count / timer.wall, 1),
+    }
+
+
+def _spawn(args):
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + args, env=python_env(), check=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def startup(port, repeat):
+    """Wall time of a Python process importing or running the dccpp tool"""
+    baseline = [_spawn(["-c", "pass"]) for i in range(repeat)]
+    imports = [_spawn(["-c", "import pyrail.tools.dccpp"])
+            for i in range(repeat)]
+    direct = [_spawn(["-m", "pyrail.tools.dccpp", "-l", "0", "-p", port,
+            "throttle", "3", "40"]) for i in range(repeat)]
+    return {
+        "python_ms": round(percentile(baseline, 50) * 1000, 2),
+        "import_ms": round(percentile(imports, 50) * 1000, 2),
+        "direct_command_ms": round(percentile(direct, 50) * 1000, 2),
+    }
+
+
+def run(port, count):
+    return {
+        "dispatch": dispatch(port, count),
+        "async_dispatch": async_dispatch(port, count),
+        "startup": startup(port, 5),
+    }
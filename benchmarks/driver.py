@@ -0,0 +1,111 @@
+import os
+import pty
+import tty
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from benchmarks.utils import Timer, latency_summary
+
+
+def throughput(port, count):
+    """Pipelined throttle commands, until all of them are acknowledged"""
+    dcc = DCCpp(port)
+    dcc.connect()
+    try:
+        with Timer() as timer:
+            futures = [dcc.throttle(1 + i % 12, 3 + i % 12, i % 127)
+                    for i in range(count)]
+            for future in futures:
+                future.result()
+    finally:
+        dcc.disconnect()
+    return {
+        "commands": count,
+        "commands_per_sec": round(count / timer.wall, 1),
+        "cpu_us_per_command": round(timer.cpu / count * 1e6, 2),
+    }
+
+
+def latency(port, count):
+    """Round trip from sending a command until its reply was received"""
+    ops = {
+        "power_on": lambda dcc, i: dcc.power_on(),
+        "throttle": lambda dcc, i: dcc.throttle(1, 3, i % 127),
+        "status": lambda dcc, i: dcc.status(),
+        "cv_write": lambda dcc, i: dcc.write(1, 3),
+    }
+    dcc = DCCpp(port)
+    dcc.connect()
+    results = {}
+    try:
+        for name, op in ops.items():
+            latencies = []
+            with Timer() as timer:
+                for i in range(count):
+                    with Timer() as rtt:
+                        op(dcc, i).result()
+                    latencies.append(rtt.wall)
+            results[name] = latency_summary(latencies)
+            results[name]["cpu_us_per_command"] = round(timer.cpu / count *
+                    1e6, 2)
+    finally:
+        dcc.disconnect()
+    return results
+
+
+def _setup_layout(dcc):
+    with dcc.batch():
+        dcc.power_on()
+        for addr in range(1, 51):
+            dcc.turnout(addr, 0)
+        for cab in range(1, 21):
+            dcc.throttle(1 + cab % 12, cab, 0)
+
+
+def wire_bytes():
+    """Bytes written to the serial line per logical operation"""
+    ops = {
+        "power_on": lambda dcc: dcc.power_on(),
+        "status": lambda dcc: dcc.status(),
+        "throttle": lambda dcc: dcc.throttle(1, 3, 40),
+        "function": lambda dcc: dcc.function(3, 144),
+        "turnout": lambda dcc: dcc.turnout(17, 1),
+        "cv_write": lambda dcc: dcc.write(1, 3),
+        "layout_setup": _setup_layout,
+    }
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    dcc = DCCpp(os.ttyname(slave))
+    dcc.connect()
+    results = {}
+    try:
+        for name, op in ops.items():
+            op(dcc)
+            dcc._com.flush()
+            results[name] = _drain(master)
+    finally:
+        dcc.disconnect()
+        os.close(master)
+        os.close(slave)
+    return results
+
+
+def _drain(fd):
+    count = 0
+    os.set_blocking(fd, False)
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            break
+        if not data:
+            break
+        count += len(data)
+    return count
+
+
+def run(port, count):
+    return {
+        "throughput": throughput(port, count),
+        "latency": latency(port, max(count // 10, 10)),
+        "wire_bytes": wire_bytes(),
+    }
@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+
+from pyrail.drivers.arduino.layoutconfig import LayoutConfig, LayoutCache
+from benchmarks.utils import Timer
+
+# Objects of a big club layout
+CABS = 2000
+TURNOUTS = 4000
+SENSORS = 2000
+ROUTES = 500
+
+
+def _write_layout(path):
+    sections = ["[cab cab%d]\naddress = %d\n" % (i, i + 1)
+            for i in range(CABS)]
+    sections += ["[turnout t%d]\naddress = %d\n" % (i, i + 1)
+            for i in range(TURNOUTS)]
+    sections += ["[sensor s%d]\nid = %d\npin = %d\n" % (i, i, 2 + i % 60)
+            for i in range(SENSORS)]
+    sections += ["[route r%d]\nturnouts = %s\n" % (i, ", ".join(
+            "t%d:%s" % ((i * 8 + n) % TURNOUTS, ("closed", "thrown")[n % 2])
+            for n in range(8))) for i in range(ROUTES)]
+    with open(path, "w") as f:
+        f.write("\n".join(sections))
+
+
+def run(port, count):
+    """Time to load a big layout file compiled and from the cache"""
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "layout.ini")
+        _write_layout(path)
+        cache = LayoutCache(os.path.join(tmp, "cache"))
+        with Timer() as compiled:
+            layout = LayoutConfig.load(path, cache)
+        with Timer() as cached:
+            LayoutConfig.load(path, cache)
+        # Touching the file only costs a hash, not a compile
+        os.utime(path)
+        with Timer() as touched:
+            LayoutConfig.load(path, cache)
+        names = ["t%d" % (i % TURNOUTS) for i in range(count)]
+        with Timer() as lookup:
+            for name in names:
+                layout.turnout(name)
+    finally:
+        shutil.rmtree(tmp)
+    return {
+        "objects": len(layout),
+        "compile_ms": round(compiled.wall * 1000, 2),
+        "cached_ms": round(cached.wall * 1000, 2),
+        "touched_ms": round(touched.wall * 1000, 2),
+        "lookup_ns": round(lookup.wall / count * 1e9, 1),
+    }
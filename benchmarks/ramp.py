@@ -0,0 +1,40 @@
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.ramp import RampEngine
+from benchmarks.utils import Timer
+
+CABS = 500
+TICKS = 200
+
+
+def _ramp(dcc, moving, ticks):
+    """Ramp the first `moving` of CABS cabs for a number of ticks"""
+    engine = RampEngine(dcc)
+    for cab in range(CABS):
+        engine.ramp(1 + cab % 12, 3 + cab, 0)
+    for cab in range(moving):
+        engine.ramp(1 + cab % 12, 3 + cab, 126, rate=126 / (ticks *
+                engine.tick))
+    written = dcc.metrics.counter("dccpp.bytes_written")
+    with Timer() as timer:
+        for i in range(ticks):
+            engine.step()
+    dcc.wait_replies(10)
+    return {
+        "moving": moving,
+        "cpu_us_per_tick": round(timer.cpu / ticks * 1e6, 2),
+        "commands": engine.sent,
+        "bytes_per_sec": round((dcc.metrics.counter("dccpp.bytes_written") -
+                written) / (ticks * engine.tick), 1),
+    }
+
+
+def run(port, count, ticks=TICKS):
+    """Cost of a tick of the ramp engine with few and many moving cabs"""
+    dcc = DCCpp(port)
+    dcc.connect()
+    dcc.enable_metrics()
+    try:
+        results = [_ramp(dcc, moving, ticks) for moving in (0, 10, CABS)]
+    finally:
+        dcc.disconnect()
+    return {"cabs": CABS, "ticks": ticks, "runs": results}
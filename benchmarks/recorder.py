@@ -0,0 +1,53 @@
+import os
+import tempfile
+import time
+
+from pyrail.drivers.arduino.recorder import (TrafficRecorder, TrafficLog,
+        INBOUND, OUTBOUND)
+from benchmarks.utils import Timer
+
+# The log is scaled up from the count, scans are only meaningful on big logs
+RECORDS_PER_COUNT = 200
+
+
+def _record(path, frames):
+    recorder = TrafficRecorder(path)
+    # One frame per millisecond, like a busy station
+    now = time.monotonic()
+    with Timer() as timer:
+        for i in range(frames):
+            now += 0.001
+            recorder.record(OUTBOUND, b"<t %d %d %d 1>" % (1 + i % 12,
+                    3 + i % 12, i % 127), now)
+            recorder.record(INBOUND, b"<T %d %d 1>" % (1 + i % 12, i % 127),
+                    now)
+    recorder.close()
+    return timer
+
+
+def run(port, count, records_per_count=RECORDS_PER_COUNT):
+    """Cost of recording the traffic and of filtering a big log"""
+    frames = count * records_per_count // 2
+    fd, path = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    try:
+        record = _record(path, frames)
+        size = os.path.getsize(path)
+        with TrafficLog(path) as log:
+            with Timer() as scan:
+                matched = sum(1 for record in log.records(cab=3))
+            with Timer() as seek:
+                log.seek(frames * 0.001 * 0.9)
+            with Timer() as seek_again:
+                log.seek(frames * 0.001 * 0.5)
+    finally:
+        os.unlink(path)
+    return {
+        "records": 2 * frames,
+        "bytes_per_record": round(size / (2.0 * frames), 1),
+        "record_us": round(record.cpu / (2 * frames) * 1e6, 3),
+        "scan_mb_per_sec": round(size / scan.wall / 1e6, 1),
+        "cab_matches": matched,
+        "first_seek_ms": round(seek.wall * 1000, 2),
+        "seek_ms": round(seek_again.wall * 1000, 3),
+    }
@@ -0,0 +1,53 @@
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.routes import RouteEngine
+
+TURNOUTS = 64
+THROWS = 4
+INTERVAL = 0.02
+
+
+def _set(engine, points):
+    route = engine.set_route(points)
+    elapsed = route.wait(30)
+    return {
+        "seconds": round(elapsed, 4),
+        "switched": route.thrown,
+        "skipped": route.skipped,
+        "confirmed": route.confirmed,
+    }
+
+
+def run(port, count):
+    """Time to set a route of a yard, switching THROWS turnouts at once"""
+    dcc = DCCpp(port)
+    dcc.connect()
+    try:
+        with dcc.batch():
+            for tid in range(1, TURNOUTS + 1):
+                dcc.define_turnout(tid, 100 + tid, 0)
+        dcc.wait_replies(10)
+        engine = RouteEngine(dcc, THROWS, INTERVAL, dict(
+                (100 + tid, tid) for tid in range(1, TURNOUTS + 1)))
+        engine.start()
+        try:
+            thrown = [(100 + tid, 1) for tid in range(1, TURNOUTS + 1)]
+            # Every other turnout back to closed
+            half = [(address, tid % 2) for tid, (address, state) in
+                    enumerate(thrown)]
+            runs = {
+                "all": _set(engine, thrown),
+                "unchanged": _set(engine, thrown),
+                "half": _set(engine, half),
+            }
+        finally:
+            engine.stop()
+    finally:
+        dcc.disconnect()
+    return {
+        "turnouts": TURNOUTS,
+        "throws": THROWS,
+        "interval_ms": INTERVAL * 1000,
+        # A write every interval is the shortest time within the limit
+        "min_seconds": round((TURNOUTS - 1) // THROWS * INTERVAL, 4),
+        "runs": runs,
+    }
@@ -0,0 +1,71 @@
+import asyncio
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.server import StationServer
+from benchmarks.utils import Timer, latency_summary
+
+CLIENTS = 200
+
+
+async def _client(host, port, frames, expected, start):
+    """Send the frames and wait until all replies of all clients arrived"""
+    reader, writer = await asyncio.open_connection(host, port)
+    await start.wait()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    writer.write(b"".join(frames))
+    await writer.drain()
+    received = 0
+    while received < expected:
+        data = await reader.read(4096)
+        if not data:
+            break
+        received += data.count(b"<T")
+    writer.close()
+    return loop.time() - started, received
+
+
+async def _run_clients(dcc, clients, per_client):
+    server = StationServer(dcc, "127.0.0.1", 0)
+    await server.start()
+    try:
+        host, port = server.addresses[0][:2]
+        start = asyncio.Event()
+        expected = clients * per_client
+        tasks = [asyncio.ensure_future(_client(host, port,
+                [b"<t %d %d %d 1>" % (1 + i % 12, 3 + i, n % 127)
+                for n in range(per_client)], expected, start))
+                for i in range(clients)]
+        # Connect all clients before the first frame is sent
+        while server.stats["clients"] < clients:
+            await asyncio.sleep(0.01)
+        with Timer() as timer:
+            start.set()
+            results = await asyncio.gather(*tasks)
+        return timer, results, dict(server.stats)
+    finally:
+        await server.close()
+
+
+def run(port, count, clients=CLIENTS):
+    """Many clients sharing one station through the TCP server"""
+    per_client = max(1, count // clients)
+    dcc = DCCpp(port)
+    dcc.connect()
+    try:
+        timer, results, stats = asyncio.run(_run_clients(dcc, clients,
+                per_client))
+    finally:
+        dcc.disconnect()
+    frames = clients * per_client
+    return {
+        "clients": clients,
+        "frames": frames,
+        "frames_per_sec": round(frames / timer.wall, 1),
+        "frames_per_write": round(stats["frames"] / max(stats["writes"], 1),
+                1),
+        "replies_received": sum(received for elapsed, received in results),
+        "replies_dropped": stats["dropped"],
+        "completion": latency_summary([elapsed for elapsed, received in
+                results]),
+    }
@@ -0,0 +1,81 @@
+import json
+import subprocess
+import sys
+
+from benchmarks.utils import python_env
+
+
+MODULE = "pyrail.tools.dccpp"
+CLI = "DCCppCli"
+# Modules which are expensive and must only be imported when needed
+LAZY_MODULES = ("serial", "inspect", "asyncio", "concurrent.futures",
+        "tempfile", "mmap", "pyrail.drivers.arduino.recorder",
+        "pyrail.drivers.arduino.scheduler")
+BUDGET_MS = 80.0
+
+# Build the CLI and its argument parser, like every call does before it runs
+# a command, and report the time it took and the imported modules
+CONSTRUCT = """
+import json, sys, time
+start = time.perf_counter()
+from %s import %s
+imported = time.perf_counter()
+%s().define_argparser()
+built = time.perf_counter()
+json.dump({"construct_ms": (built - imported) * 1000.0,
+        "modules": sorted(sys.modules)}, sys.stdout)
+"""
+
+
+def importtime(module, repeat=5):
+    """Return the fastest cumulative import time of the module in ms and
+    the names of all modules imported with it"""
+    best = None
+    modules = set()
+    for i in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                "import %s" % module], env=python_env(), check=True,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        for line in proc.stderr.decode().splitlines():
+            try:
+                self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+                cumulative_us = int(cumulative_us)
+            except ValueError:
+                continue
+            name = name.strip()
+            modules.add(name)
+            if name == module and (best is None or cumulative_us < best):
+                best = cumulative_us
+    return best / 1000.0, modules
+
+
+def constructtime(module, cli, repeat=5):
+    """Return the fastest construction time of the CLI in ms, without its
+    import, and the names of all modules imported until then"""
+    best = None
+    modules = set()
+    for i in range(repeat):
+        proc = subprocess.run([sys.executable, "-c", CONSTRUCT % (module,
+                cli, cli)], env=python_env(), check=True,
+                stdout=subprocess.PIPE)
+        result = json.loads(proc.stdout.decode())
+        modules.update(result["modules"])
+        if best is None or result["construct_ms"] < best:
+            best = result["construct_ms"]
+    return best, modules
+
+
+def run(port, count, budget_ms=BUDGET_MS):
+    import_ms, modules = importtime(MODULE)
+    construct_ms, constructed = constructtime(MODULE, CLI)
+    eager = sorted(m for m in LAZY_MODULES if m in modules | constructed)
+    startup_ms = import_ms + construct_ms
+    return {
+        "module": MODULE,
+        "import_ms": round(import_ms, 2),
+        "construct_ms": round(construct_ms, 2),
+        "startup_ms": round(startup_ms, 2),
+        "budget_ms": budget_ms,
+        "eager_imports": eager,
+        "within_budget": startup_ms <= budget_ms and not eager,
+    }
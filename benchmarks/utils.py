@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+import time
+
+
+def percentile(values, p):
+    """Return the p-th percentile (0-100) of the values"""
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(int(round(p / 100.0 * (len(values) - 1))), len(values) - 1)
+    return values[idx]
+
+
+def latency_summary(latencies):
+    """Summarise latencies given in seconds as milliseconds"""
+    return {
+        "count": len(latencies),
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+    }
+
+
+def _ms(value):
+    return None if value is None else round(value * 1000.0, 4)
+
+
+class Timer(object):
+    """Measure the wall and CPU time of the current process"""
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+
+
+class SimulatorProcess(object):
+    """Run the DCC++ simulator in its own process
+
+    Like this the CPU time of the simulator is not accounted to the driver
+    being measured.
+
+    """
+
+    def __init__(self, baudrate=0, process_time=0.0, reply_delay=0.0):
+        self.args = ["-b", str(baudrate), "--process-time", str(process_time),
+                "--reply-delay", str(reply_delay)]
+        self.port = None
+        self._proc = None
+
+    def start(self):
+        self._proc = subprocess.Popen([sys.executable, "-m",
+                "pyrail.tools.dccppsim", "-l", "0"] + self.args,
+                stdout=subprocess.PIPE, env=python_env())
+        self.port = self._proc.stdout.readline().decode().strip()
+        if not self.port:
+            raise RuntimeError("Simulator did not start!")
+        return self.port
+
+    def stop(self):
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait()
+            self._proc = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def python_env():
+    """Environment for subprocesses which finds the pyrail package"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [root] + [p for p in env.get("PYTHONPATH", "").split(os.pathsep)
+            if p]
+    env["PYTHONPATH"] = os.pathsep.join(paths)
+    return env
@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+import logging
+import os
+import serial
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.reply import (ReplyParser, PendingReplies,
+        ResultReply)
+
+_log = logging.getLogger(__name__)
+
+
+async def open_serial_connection(port, baudrate, loop=None, com=None):
+    """Open a serial port and wrap it into an asyncio stream pair
+
+    The port is configured by pyserial and then handed over to the event loop
+    as a character device, so no additional dependency is required. This only
+    works on POSIX systems. A port, which is open already, is given as com.
+
+    Returns a tuple of (com, reader, writer), where com is the underlying
+    serial.Serial object which has to be closed after the writer.
+
+    """
+    loop = loop or asyncio.get_running_loop()
+    if com is None:
+        com = serial.Serial(port, baudrate, timeout=0)
+    else:
+        com.timeout = 0
+    fd = com.fileno()
+    try:
+        reader = asyncio.StreamReader(loop=loop)
+        protocol = asyncio.StreamReaderProtocol(reader, loop=loop)
+        await loop.connect_read_pipe(lambda: protocol,
+                os.fdopen(os.dup(fd), "rb", buffering=0))
+        transport, protocol = await loop.connect_write_pipe(
+                lambda: asyncio.streams.FlowControlMixin(loop=loop),
+                os.fdopen(os.dup(fd), "wb", buffering=0))
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    except Exception:
+        com.close()
+        raise
+    return com, reader, writer
+
+
+class AsyncDCCpp(object):
+    """Asyncio implementation of the Arduino DCC++ Base Station
+
+    All commands are coroutines writing to an asyncio serial stream, while a
+    background task reads the frames sent back by the base station. Like this
+    a single event loop is able to drive many stations, throttles and clients.
+    Commands which are acknowledged by the base station return a future which
+    is resolved with the reply.
+
+    """
+
+    DEFAULT_PORT = DCCpp.DEFAULT_PORT
+    DEFAULT_BAUDRATE = DCCpp.DEFAULT_BAUDRATE
+    DEFAULT_TIMEOUT = DCCpp.DEFAULT_TIMEOUT
+    READ_SIZE = 4096
+
+    def __init__(self, port=None, baudrate=None, timeout=None):
+        self.port = port or AsyncDCCpp.DEFAULT_PORT
+        # Discover the port of the station on every connect
+        self.auto = self.port == DCCpp.AUTO_PORT
+        self.info = None
+        self.baudrate = baudrate or AsyncDCCpp.DEFAULT_BAUDRATE
+        self.timeout = timeout or AsyncDCCpp.DEFAULT_TIMEOUT
+        self.listeners = []
+        self._parser = ReplyParser()
+        self._pending = PendingReplies()
+        self._callnums = itertools.count(1)
+        self._com = None
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    async def _discover(self):
+        from pyrail.drivers.arduino.discovery import find_station
+        _log.debug("Discovering DCC++ station at %s baud ..." % self.baudrate)
+        # Probing the ports blocks, it runs in a thread of the loop
+        found = await asyncio.get_running_loop().run_in_executor(None,
+                find_station, self.baudrate)
+        if found is None:
+            raise AsyncDCCpp.Error("Unable to find a DCC++ station!")
+        self.port, self.info, com = found
+        _log.info("Found '%s' on '%s'" % (self.info, self.port))
+        return com
+
+    async def connect(self):
+        if not self.connected:
+            # The discovered port is open already, opening it again would
+            # reset the Arduino
+            com = await self._discover() if self.auto else None
+            try:
+                _log.debug("Connecting to '%s' at %s baud ..." % (self.port,
+                        self.baudrate))
+                self._com, self._reader, self._writer = \
+                        await open_serial_connection(self.port, self.baudrate,
+                        com=com)
+            except (serial.SerialException, OSError) as ex:
+                self._com = self._reader = self._writer = None
+                raise AsyncDCCpp.Error("Unable to connect %s: %s" % (self, ex))
+            self._parser.reset()
+            self._read_task = asyncio.ensure_future(self._read_loop())
+        else:
+            _log.warn("%s already connected!" % self)
+        return self.connected
+
+    async def disconnect(self):
+        if self.connected:
+            _log.debug("Disconnecting from '%s' ..." % self.port)
+            if self._read_task is not None:
+                self._read_task.cancel()
+                try:
+                    await self._read_task
+                except asyncio.CancelledError:
+                    pass
+            self._writer.close()
+            self._com.close()
+        self._com = self._reader = self._writer = self._read_task = None
+        self._pending.cancel_all(AsyncDCCpp.Error("%s disconnected!" % self))
+        return not self.connected
+
+    async def _read_loop(self):
+        while True:
+            data = await self._reader.read(AsyncDCCpp.READ_SIZE)
+            if not data:
+                _log.warn("%s closed by the base station!" % self)
+                break
+            for reply in self._parser.feed(data):
+                self.reply_received(reply)
+
+    def add_listener(self, callback):
+        """Register a callback which is called with every received reply"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def reply_received(self, reply):
+        _log.debug("Received reply: '<%s>'", reply.frame)
+        if type(reply) is ResultReply and not reply.ok:
+            self._pending.reject(DCCpp.REFUSABLE, AsyncDCCpp.Refused(
+                    "Command refused by '%s'!" % self.port))
+        else:
+            self._pending.resolve(reply)
+        for callback in self.listeners:
+            try:
+                callback(reply)
+            except Exception as ex:
+                _log.exception("Reply listener failed: %s" % ex)
+
+    async def send_command(self, name, *args):
+        if self.connected:
+            cmd = DCCpp.encode_command(name, *args)
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug("Send command: '%s'", cmd.decode("ascii"))
+            self._writer.write(cmd)
+            await self._writer.drain()
+            return True
+        raise AsyncDCCpp.Error("DCC++ Station is not connected!")
+
+    async def request(self, key, name, *args, timeout=None):
+        """Send a command and return a future for its reply
+
+        The returned future is resolved with the first reply matching the
+        key, or fails with AsyncDCCpp.Timeout if no such reply arrives in
+        time.
+
+        """
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        future = self._pending.add(key, loop.create_future(), timeout)
+        timer = loop.call_later(timeout, self._pending.fail, key, future,
+                AsyncDCCpp.Timeout("No reply for %s!" % (key,)))
+        future.add_done_callback(lambda f: timer.cancel())
+        try:
+            await self.send_command(name, *args)
+        except AsyncDCCpp.Error as ex:
+            self._pending.fail(key, future, ex)
+            raise
+        return future
+
+    async def status(self):
+        return await self.request(("i",), "s")
+
+    async def current(self):
+        return await self.request(("c",), "c")
+
+    async def power_on(self):
+        return await self.request(("p",), "1")
+
+    async def power_off(self):
+        return await self.request(("p",), "0")
+
+    async def power(self, state):
+        return await (self.power_on() if state else self.power_off())
+
+    async def throttle(self, register, cab, speed):
+        return await self.request(("T", register), "t",
+                *DCCpp.throttle_args(register, cab, speed))
+
+    async def function(self, cab, fn):
+        await self.send_command("f", cab, fn)
+
+    async def turnout(self, addr, state):
+        await self.send_command("a", addr, 0, state)
+
+    async def write(self, cv, value, addr=0):
+        if addr != 0:
+            # Operations mode writes are not acknowledged
+            name, args = DCCpp.write_args(cv, value, addr)
+            await self.send_command(name, *args)
+            return None
+        callnum = next(self._callnums) % 32768
+        name, args = DCCpp.write_args(cv, value, addr, callnum)
+        return await self.request(("r", callnum, 0), name, *args)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.disconnect()
+
+    def __repr__(self):
+        return "<AsyncDCCpp<connected=%s>(port='%s', baudrate='%s')>" % (
+                self.connected, self.port, self.baudrate)
+
+
+    class Error(DCCpp.Error):
+        pass
+
+
+    class Timeout(Error, DCCpp.Timeout):
+        pass
+
+
+    class Refused(Error, DCCpp.Refused):
+        pass
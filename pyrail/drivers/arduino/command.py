@@ -0,0 +1,78 @@
+# Priorities of the command queue, lower values are sent first, see also:
+# scheduler.CommandQueue
+PRIORITY_SAFETY = 0
+PRIORITY_HIGH = 1
+PRIORITY_NORMAL = 2
+PRIORITY_LOW = 3
+
+
+class CommandBuilder(object):
+    """Builder for DCC++ command frames
+
+    Frames are encoded straight into a reusable buffer. The encoded prefix of
+    every command name and the complete frames of commands without arguments
+    (e.g. <1>, <0> or <s>) are cached. Several frames can be collected in the
+    buffer and taken out at once, so they can be sent with a single write.
+
+    """
+
+    _prefixes = {}
+    _constants = {}
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def __len__(self):
+        return len(self._buf)
+
+    @classmethod
+    def prefix(cls, name):
+        try:
+            return cls._prefixes[name]
+        except KeyError:
+            prefix = cls._prefixes[name] = b"<" + name.encode("ascii",
+                    "ignore")
+            return prefix
+
+    @classmethod
+    def constant(cls, name):
+        try:
+            return cls._constants[name]
+        except KeyError:
+            frame = cls._constants[name] = cls.prefix(name) + b">"
+            return frame
+
+    def append(self, name, *args):
+        buf = self._buf
+        if not args:
+            buf += self.constant(name)
+            return self
+        buf += self.prefix(name)
+        for arg in args:
+            if isinstance(arg, int):
+                buf += b" %d" % arg
+            else:
+                buf += b" " + str(arg).encode("ascii", "ignore")
+        buf += b">"
+        return self
+
+    def extend(self, data):
+        """Append frames which are encoded already"""
+        self._buf += data
+        return self
+
+    def take(self):
+        """Return the collected frames and clear the buffer"""
+        data = bytes(self._buf)
+        del self._buf[:]
+        return data
+
+    def clear(self):
+        del self._buf[:]
+
+    @classmethod
+    def encode(cls, name, *args):
+        """Return the encoded frame of a single command"""
+        if not args:
+            return cls.constant(name)
+        return cls().append(name, *args).take()
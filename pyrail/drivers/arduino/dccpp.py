@@ -1,6 +1,17 @@
+import itertools
 import logging
-import serial
+import threading
+import time
 
+from contextlib import contextmanager
+
+from pyrail.drivers.arduino.command import (CommandBuilder, PRIORITY_SAFETY,
+        PRIORITY_NORMAL)
+from pyrail.drivers.arduino.layout import LayoutState
+from pyrail.drivers.arduino.reply import (ReplyParser, PendingReplies,
+        InfoReply, SensorReply, ResultReply)
+from pyrail.drivers.arduino.registers import RegisterAllocator
+from pyrail.drivers.arduino.sensors import SensorTable
 from pyrail.exc.error import Error as BaseError
 
 _log = logging.getLogger(__name__)
@@ -13,81 +24,681 @@ class DCCpp(object):
 
     """
 
-    DEFAULT_PORT = "auto"
+    AUTO_PORT = "auto"
+    DEFAULT_PORT = AUTO_PORT
     DEFAULT_BAUDRATE = 115200
+    DEFAULT_TIMEOUT = 2.0
+    READ_TIMEOUT = 0.1
+    # Codes of the requests, which the station may answer with <X>
+    REFUSABLE = ("O", "H", "Y")
 
-    def __init__(self, port=None, baudrate=None):
+    def __init__(self, port=None, baudrate=None, timeout=None,
+            throttle_rate=None, write_queue=False, registers=None):
         self.port = port or DCCpp.DEFAULT_PORT
+        # Discover the port of the station on every connect
+        self.auto = self.port == DCCpp.AUTO_PORT
+        self.info = None
         self.baudrate = baudrate or DCCpp.DEFAULT_BAUDRATE
+        self.timeout = timeout or DCCpp.DEFAULT_TIMEOUT
+        self.listeners = []
+        self.layout = LayoutState()
+        # Main track registers of the cabs driven with set_speed
+        self.registers = RegisterAllocator(self.layout, registers)
+        self.sensors = SensorTable()
+        # Coalesce throttle updates, if a maximum flush rate is given
+        self.scheduler = None
+        if throttle_rate is not None:
+            from pyrail.drivers.arduino.scheduler import WriteScheduler
+            self.scheduler = WriteScheduler(self._send_throttle, throttle_rate)
+        # Send the commands by priority from a writer thread, if requested
+        self.queue = None
+        if write_queue:
+            from pyrail.drivers.arduino.scheduler import CommandQueue
+            self.queue = CommandQueue(self._write_com, self.baudrate)
         self._com = None
+        self._builder = CommandBuilder()
+        self._write_lock = threading.RLock()
+        # Only guards the serial port, safety commands do not wait for batches
+        self._io_lock = threading.Lock()
+        self._batch = None
+        self._batch_depth = 0
+        self._batch_pending = []
+        # Throttle frames of a batch, tagged with their cab, so they are
+        # cancelled by a stop, see _batch_cab
+        self._batch_segments = []
+        self._batch_lock = threading.Lock()
+        self._parser = ReplyParser()
+        self._pending = PendingReplies()
+        self._callnums = itertools.count(1)
+        self._reader = None
+        self._stop_reader = threading.Event()
+        # Instrumentation is switched off, while metrics is None
+        self.metrics = None
+        self.recorder = None
 
     @property
     def connected(self):
         return self._com is not None
 
     def connect(self):
+        # Importing pyserial is expensive, only do it when really needed
+        import serial
         if not self.connected:
-            # Open serial port
-            try:
-                _log.debug("Connecting to '%s' at %s baud ..." % (self.port,
-                        self.baudrate))
-                self._com = serial.Serial(self.port, self.baudrate)
-            except serial.SerialException as ex:
-                self._com = None
-                raise DCCpp.Error("Unable to connect %s: %s" % (self, ex))
+            if self.auto:
+                self._com = self._discover()
+            else:
+                # Open serial port
+                try:
+                    _log.debug("Connecting to '%s' at %s baud ..." % (
+                            self.port, self.baudrate))
+                    self._com = serial.Serial(self.port, self.baudrate,
+                            timeout=DCCpp.READ_TIMEOUT)
+                except serial.SerialException as ex:
+                    self._com = None
+                    raise DCCpp.Error("Unable to connect %s: %s" % (self, ex))
+            # Opening the port resets the Arduino, so its state is lost
+            self.layout.clear()
+            self.registers.clear()
+            self.sensors.clear()
+            self._start_reader()
+            if self.queue is not None:
+                self.queue.start()
+            if self.scheduler is not None:
+                self.scheduler.start()
         else:
             _log.warn("%s already connected!" % self)
         return self.connected
 
+    def enable_metrics(self, metrics=None):
+        """Start recording metrics of the hot paths of the driver
+
+        Returns the Metrics object, which is created if none is given.
+
+        """
+        if metrics is None:
+            from pyrail.utils.metrics import Metrics
+            metrics = Metrics()
+        metrics.gauge("dccpp.pending_replies", self._pending.__len__)
+        if self.scheduler is not None:
+            metrics.gauge("dccpp.scheduler", lambda: self.scheduler.stats)
+        if self.queue is not None:
+            metrics.gauge("dccpp.queue", lambda: self.queue.stats)
+        self.metrics = metrics
+        return metrics
+
+    def disable_metrics(self):
+        self.metrics = None
+
+    def start_recording(self, path):
+        """Record the traffic with the station to a log file
+
+        Returns the TrafficRecorder, the log is read with a TrafficLog.
+
+        """
+        from pyrail.drivers.arduino.recorder import TrafficRecorder
+        self.stop_recording()
+        self.recorder = TrafficRecorder(path)
+        return self.recorder
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def _discover(self):
+        from pyrail.drivers.arduino.discovery import find_station
+        _log.debug("Discovering DCC++ station at %s baud ..." % self.baudrate)
+        found = find_station(self.baudrate)
+        if found is None:
+            raise DCCpp.Error("Unable to find a DCC++ station!")
+        self.port, self.info, com = found
+        com.timeout = DCCpp.READ_TIMEOUT
+        _log.info("Found '%s' on '%s'" % (self.info, self.port))
+        return com
+
     def disconnect(self):
-        if self.connected:
+        # The reader is left after a lost connection, see _connection_lost
+        if self.connected or self._reader is not None:
             _log.debug("Disconnecting from '%s' ..." % self.port)
-            self._com.close()
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            if self.queue is not None:
+                self.queue.stop()
+            self._stop_reader.set()
+            if self._reader is not None:
+                self._reader.join()
+            if self._com is not None:
+                self._com.close()
         self._com = None
+        self._reader = None
+        self._pending.cancel_all(DCCpp.Error("%s disconnected!" % self))
         return not self.connected
 
-    def send_command(self, name, *args):
+    def _start_reader(self):
+        self._parser.reset()
+        self._stop_reader.clear()
+        self._reader = threading.Thread(target=self._read_loop,
+                name="%s-reader" % self.port, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        import serial
+        com = self._com
+        while not self._stop_reader.is_set():
+            try:
+                data = com.read(com.in_waiting or 1)
+            except (serial.SerialException, OSError) as ex:
+                _log.error("Reading from '%s' failed: %s" % (self.port, ex))
+                self._connection_lost(com, ex)
+                return
+            if data:
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.record(recorder.INBOUND, data)
+                metrics = self.metrics
+                if metrics is None:
+                    for reply in self._parser.feed(data):
+                        self.reply_received(reply)
+                else:
+                    self._dispatch_measured(metrics, data)
+            self._pending.expire(DCCpp.Timeout)
+            due = self.sensors.settle()
+            # Wake up when the debounce time of a held back change is over
+            timeout = DCCpp.READ_TIMEOUT if due is None else min(max(
+                    due - time.monotonic(), 0.001), DCCpp.READ_TIMEOUT)
+            if timeout != com.timeout:
+                com.timeout = timeout
+
+    def _connection_lost(self, com, ex):
+        """Mark the station disconnected and fail the pending requests, as
+        no reply arrives anymore"""
+        with self._io_lock:
+            self._com = None
+        try:
+            com.close()
+        except OSError:
+            pass
+        self._pending.cancel_all(DCCpp.Error("Lost the connection to '%s': "
+                "%s" % (self.port, ex)))
+
+    def _dispatch_measured(self, metrics, data):
+        metrics.count("dccpp.bytes_read", len(data))
+        start = time.perf_counter()
+        for reply in self._parser.feed(data):
+            self.reply_received(reply)
+            metrics.count("dccpp.reply.%s" % reply.code)
+            # From parsing the data to the end of dispatching the reply
+            metrics.record("dccpp.dispatch_latency",
+                    time.perf_counter() - start)
+
+    def add_listener(self, callback):
+        """Register a callback which is called with every received reply"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def reply_received(self, reply):
+        _log.debug("Received reply: '<%s>'", reply.frame)
+        if type(reply) is SensorReply and reply.state is not None:
+            # Sensor events are dispatched first, they are time critical
+            self.sensors.update(reply.id, reply.state)
+        self.layout.confirm(reply)
+        if isinstance(reply, InfoReply):
+            self.info = reply.info
+        if type(reply) is ResultReply and not reply.ok:
+            self._pending.reject(DCCpp.REFUSABLE, DCCpp.Refused("Command "
+                    "refused by '%s'!" % self.port))
+        else:
+            self._pending.resolve(reply)
+        for callback in self.listeners:
+            try:
+                callback(reply)
+            except Exception as ex:
+                _log.exception("Reply listener failed: %s" % ex)
+
+    @staticmethod
+    def encode_command(name, *args):
+        return CommandBuilder.encode(name, *args)
+
+    @staticmethod
+    def throttle_args(register, cab, speed):
+        if speed < 0:
+            direction = 0
+            speed = -speed
+        else:
+            direction = 1
+        return register, cab, speed, direction
+
+    @staticmethod
+    def write_args(cv, value, addr=0, callnum=0, callsub=0):
+        if addr == 0:
+            return "W", (cv, value, callnum, callsub)
+        return "w", (addr, cv, value)
+
+    def _write_com(self, data, pending=()):
+        with self._io_lock:
+            # Register the requests in the order their frames are written,
+            # so replies with the same key are matched correctly
+            for key, future, timeout in pending:
+                self._pending.add(key, future, timeout)
+            try:
+                self._com.write(data)
+            except (OSError, AttributeError) as ex:
+                # SerialException is an OSError, the port is None after a
+                # disconnect
+                error = DCCpp.Error("Writing to '%s' failed: %s" % (
+                        self.port, ex))
+                for key, future, timeout in pending:
+                    self._pending.fail(key, future, error)
+                raise error
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record(recorder.OUTBOUND, data)
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.count("dccpp.bytes_written", len(data))
+
+    def _write(self, data, priority=PRIORITY_NORMAL, cab=None, pending=()):
+        if self.queue is not None:
+            self.queue.put(data, priority, cab, pending)
+        else:
+            self._write_com(data, pending)
+
+    def send_command(self, name, *args, priority=PRIORITY_NORMAL, cab=None,
+            pending=None):
+        """Send a command to the base station
+
+        With a write queue the commands are sent by priority. Throttle
+        commands are tagged with their cab, so they can be cancelled while
+        they are queued (see emergency_stop). Safety commands are never
+        part of a batch, they are sent right away. pending is the
+        (key, future, timeout) of the request waiting for the reply.
+
+        """
+        pending = () if pending is None else (pending,)
         if self.connected:
-            if (len(args) == 0):
-                cmd = "<%s>" % name
-            else:
-                cmd = "<%s %s>" % (name, " ".join(map(str, args)))
-            _log.debug("Send command: '%s'" % cmd)
-            self._com.write(cmd.encode("ascii", "ignore"))
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.count("dccpp.cmd.%s" % name)
+            if priority == PRIORITY_SAFETY:
+                cmd = CommandBuilder.encode(name, *args)
+                _log.debug("Send safety command: '%s'", cmd.decode("ascii"))
+                self._write(cmd, priority, cab, pending)
+                return True
+            with self._write_lock:
+                if self._batch is not None:
+                    if cab is not None:
+                        self._batch_cab(CommandBuilder.encode(name, *args),
+                                cab, pending)
+                    else:
+                        self._batch.append(name, *args)
+                        self._batch_pending.extend(pending)
+                    return True
+                cmd = self._builder.append(name, *args).take()
+                if _log.isEnabledFor(logging.DEBUG):
+                    _log.debug("Send command: '%s'", cmd.decode("ascii"))
+                self._write(cmd, priority, cab, pending)
+            return True
+        raise DCCpp.Error("DCC++ Station is not connected!")
+
+    def send_raw(self, data, priority=PRIORITY_NORMAL):
+        """Send frames which are encoded already, e.g. of a network client"""
+        if self.connected:
+            with self._write_lock:
+                if self._batch is not None:
+                    self._batch.extend(data)
+                    return True
+                if _log.isEnabledFor(logging.DEBUG):
+                    _log.debug("Send frames: '%s'", data.decode("ascii",
+                            "replace"))
+                self._write(data, priority)
             return True
         raise DCCpp.Error("DCC++ Station is not connected!")
 
+    def _batch_cab(self, frame, cab, pending):
+        # The frames collected so far are kept in front of the frame of the
+        # cab, so the order of the frames does not change
+        with self._batch_lock:
+            if len(self._batch) > 0:
+                self._batch_segments.append((self._batch.take(), None,
+                        self._batch_pending))
+                self._batch_pending = []
+            self._batch_segments.append((frame, cab, pending))
+
+    @contextmanager
+    def batch(self):
+        """Collect all commands sent within the context into a single write
+
+        The write lock is held for the whole batch, so commands of other
+        threads are sent after the batch. With a write queue the throttle
+        frames of the batch are queued tagged with their cab, so a stop
+        cancels them like any other queued throttle frame.
+
+        """
+        with self._write_lock:
+            if self._batch_depth == 0:
+                self._batch = CommandBuilder()
+                self._batch_pending = []
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._send_batch()
+
+    def _send_batch(self):
+        with self._batch_lock:
+            segments, self._batch_segments = self._batch_segments, []
+            if len(self._batch) > 0:
+                segments.append((self._batch.take(), None,
+                        self._batch_pending))
+            self._batch, self._batch_pending = None, []
+        if not segments:
+            return
+        if not self.connected:
+            error = DCCpp.Error("%s disconnected!" % self)
+            for data, cab, pending in segments:
+                for key, future, timeout in pending:
+                    if not future.done():
+                        future.set_exception(error)
+            return
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("Send batch of %d bytes", sum(len(data) for data, cab,
+                    pending in segments))
+        if self.queue is not None:
+            for data, cab, pending in segments:
+                self._write(data, cab=cab, pending=pending)
+        else:
+            self._write(b"".join(data for data, cab, pending in segments),
+                    pending=[request for data, cab, pending in segments
+                    for request in pending])
+
+    def request(self, key, name, *args, timeout=None,
+            priority=PRIORITY_NORMAL, cab=None):
+        """Send a command and return a future for its reply
+
+        The future is resolved with the first reply matching the key, or
+        fails with DCCpp.Timeout if no such reply arrives in time.
+
+        """
+        from concurrent.futures import Future
+        future = Future()
+        metrics = self.metrics
+        if metrics is not None:
+            self._measure_reply(metrics, future)
+        try:
+            self.send_command(name, *args, priority=priority, cab=cab,
+                    pending=(key, future, timeout or self.timeout))
+        except DCCpp.Error as ex:
+            if not future.done():
+                future.set_exception(ex)
+            raise
+        return future
+
+    @staticmethod
+    def _measure_reply(metrics, future):
+        start = time.perf_counter()
+
+        def _done(future):
+            if future.cancelled() or future.exception() is not None:
+                metrics.count("dccpp.reply_failed")
+            else:
+                metrics.record("dccpp.reply_latency",
+                        time.perf_counter() - start)
+        future.add_done_callback(_done)
+
+    def wait_replies(self, timeout=None):
+        """Wait until all pending requests got their reply or timed out"""
+        if self.scheduler is not None:
+            self.scheduler.flush()
+        if self.queue is not None:
+            started = time.monotonic()
+            if not self.queue.join(timeout):
+                return False
+            if timeout is not None:
+                timeout = max(timeout - (time.monotonic() - started), 0)
+        return self._pending.wait_empty(timeout)
+
     def status(self):
-        self.send_command("s")
+        return self.request(("i",), "s")
+
+    def current(self):
+        return self.request(("c",), "c")
 
     def power_on(self):
-        self.send_command("1")
+        return self.request(("p",), "1")
 
     def power_off(self):
-        self.send_command("0")
+        return self.request(("p",), "0", priority=PRIORITY_SAFETY)
 
     def power(self, state):
-        self.power_on() if state else self.power_off()
+        return self.power_on() if state else self.power_off()
 
-    def throttle(self, register, cab, speed):
-        if speed < 0:
-            direction = 0
-            speed = -speed
-        else:
-            direction = 1
-        self.send_command("t", register, cab, speed, direction)
+    def _send_throttle(self, register, cab, speed):
+        return self.request(("T", register), "t",
+                *self.throttle_args(register, cab, speed), cab=cab)
 
-    def function(self, cab, fn):
-        self.send_command("f", cab, fn)
+    def _cancel_throttles(self, cab=None):
+        """Drop the coalesced and queued throttle updates of a cab, or of
+        all cabs if cab is None"""
+        if self.scheduler is not None:
+            self.scheduler.cancel(cab=cab)
+        # Also the frames of a batch, which is still collected
+        with self._batch_lock:
+            segments = self._batch_segments
+            dropped = [entry for entry in segments if entry[1] is not None
+                    and cab in (None, entry[1])]
+            if dropped:
+                segments[:] = [entry for entry in segments
+                        if entry[1] is None or cab not in (None, entry[1])]
+        if self.queue is not None:
+            dropped.extend(self.queue.cancel(cab))
+        for data, tag, pending in dropped:
+            for key, future, timeout in pending:
+                if not future.done():
+                    future.set_exception(DCCpp.Cancelled(
+                            "Throttle of cab %s cancelled!" % tag))
 
-    def turnout(self, addr, state):
-        self.send_command("a", addr, 0, state)
+    def _stop(self, register, cab):
+        """Record the stop of a cab and return the emergency stop args"""
+        state = self.layout.cab(cab)
+        direction = 0 if state is not None and (state.speed.commanded or
+                0) < 0 else 1
+        self.layout.set_throttle(register, cab, 0)
+        # Speed -1 stops the engine immediately
+        return register, cab, -1, direction
 
-    def write(self, cv, value, addr=0):
-        if addr == 0:
-            self.send_command("W", cv, value, 0, 0)
-        else:
-            self.send_command("w", addr, cv, value)
+    def emergency_stop(self, cab):
+        """Stop a cab immediately, regardless of its deceleration
+
+        The stop overtakes all queued commands and the pending throttle
+        updates of the cab are dropped. The future resolves to the <T> reply.
+
+        """
+        state = self.layout.cab(cab)
+        if state is None or state.register is None:
+            raise DCCpp.Error("Cab %s has no register!" % cab)
+        register = state.register
+        self._cancel_throttles(cab)
+        return self.request(("T", register), "t", *self._stop(register, cab),
+                priority=PRIORITY_SAFETY)
+
+    def all_stop(self):
+        """Stop all cabs with a register immediately, with a single write
+
+        Returns the futures of the <T> replies of all registers.
+
+        """
+        if not self.connected:
+            raise DCCpp.Error("DCC++ Station is not connected!")
+        from concurrent.futures import Future
+        self._cancel_throttles()
+        builder = CommandBuilder()
+        pending = []
+        for register, cab in sorted(list(self.layout.registers.items())):
+            builder.append("t", *self._stop(register, cab))
+            pending.append((("T", register), Future(), self.timeout))
+        if pending:
+            data = builder.take()
+            _log.debug("Send all stop: '%s'", data.decode("ascii"))
+            self._write(data, PRIORITY_SAFETY, pending=pending)
+        futures = [future for key, future, timeout in pending]
+        return futures
+
+    @staticmethod
+    def _suppressed():
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(None)
+        return future
+
+    def _tracked(self, changed, state, value, send, *args):
+        """Send a command, which changed a state of the layout, the state is
+        reverted if the command fails"""
+        if not changed:
+            return send(*args)
+        try:
+            result = send(*args)
+        except DCCpp.Error:
+            self.layout.revert(state, value)
+            raise
+        from concurrent.futures import Future
+        if isinstance(result, Future):
+            def _failed(future):
+                if future.cancelled() or future.exception() is not None:
+                    self.layout.revert(state, value)
+            result.add_done_callback(_failed)
+        return result
+
+    def throttle(self, register, cab, speed, force=False):
+        """Set the speed of a cab, the future resolves to None if the cab is
+        already at this speed and nothing was sent"""
+        changed = self.layout.set_throttle(register, cab, speed)
+        if not changed and not force:
+            return self._suppressed()
+        return self._tracked(changed, self.layout.cab(cab).speed, speed,
+                self._sched_throttle, register, cab, speed)
+
+    def _sched_throttle(self, register, cab, speed):
+        if self.scheduler is not None:
+            return self.scheduler.throttle(register, cab, speed)
+        return self._send_throttle(register, cab, speed)
+
+    def set_speed(self, cab, speed, force=False):
+        """Set the speed of a cab on a register of its own, see: registers"""
+        # The register is assigned and recorded with the lock of the
+        # registers, but sent without it, as a batch of another thread may
+        # hold the write lock and wait for the registers
+        with self.registers.lock:
+            register = self.registers.acquire(cab)
+            if register is None:
+                raise DCCpp.Error("No register left for cab %s, %d cabs are "
+                        "moving!" % (cab, self.registers.size))
+            changed = self.layout.set_throttle(register, cab, speed)
+        if not changed and not force:
+            return self._suppressed()
+        return self._tracked(changed, self.layout.cab(cab).speed, speed,
+                self._sched_throttle, register, cab, speed)
+
+    def function(self, cab, fn, fn2=None, force=False):
+        """Send a raw function group, see also: functions"""
+        if self.layout.set_function(cab, fn, fn2) or force:
+            args = (fn,) if fn2 is None else (fn, fn2)
+            return self.send_command("f", cab, *args)
+        return False
+
+    def functions(self, cab, on=(), off=()):
+        """Switch several functions (F0-F28) of a cab on and off at once
+
+        Only the function groups which actually change are sent, all of them
+        with a single write. Returns the number of sent groups.
+
+        """
+        groups = self.layout.set_functions(cab, on, off)
+        with self.batch():
+            for args in groups:
+                self.send_command("f", cab, *args)
+        return len(groups)
+
+    def set_function(self, cab, fn, state):
+        if state:
+            return self.functions(cab, on=(fn,))
+        return self.functions(cab, off=(fn,))
+
+    def turnout(self, addr, state, force=False):
+        changed = self.layout.set_accessory(addr, state)
+        if changed or force:
+            return self._tracked(changed, self.layout.accessories.get(addr),
+                    state, self.send_command, "a", addr, 0, state)
+        return False
+
+    def define_turnout(self, tid, addr, subaddr):
+        return self.request(("O",), "T", tid, addr, subaddr)
+
+    def throw(self, tid, thrown, force=False):
+        """Throw a defined turnout, the future resolves to its <H> reply"""
+        changed = self.layout.set_turnout(tid, thrown)
+        if not changed and not force:
+            return self._suppressed()
+        return self._tracked(changed, self.layout.turnout(tid), thrown,
+                self.request, ("H", tid), "T", tid, thrown)
+
+    def define_sensor(self, sid, pin, pullup=1):
+        """Define a sensor on an Arduino pin, see also: sensors"""
+        return self.request(("O",), "S", sid, pin, pullup)
+
+    def delete_sensor(self, sid):
+        return self.request(("O",), "S", sid)
+
+    def list_sensors(self):
+        """Request the definitions of all sensors (<Q ID PIN PULLUP>)"""
+        return self.send_command("S")
+
+    def refresh_sensors(self):
+        """Request the state of all sensors, which updates the sensors"""
+        return self.send_command("Q")
+
+    def define_output(self, oid, pin, iflag=0):
+        return self.request(("O",), "Z", oid, pin, iflag)
+
+    def output(self, oid, state, force=False):
+        changed = self.layout.set_output(oid, state)
+        if not changed and not force:
+            return self._suppressed()
+        return self._tracked(changed, self.layout.output(oid), state,
+                self.request, ("Y", oid), "Z", oid, state)
+
+    def next_callnum(self):
+        """Return a new CALLNUM to match programming replies with requests"""
+        return next(self._callnums) % 32768
+
+    def write(self, cv, value, addr=0, callnum=None, callsub=0, timeout=None):
+        """Write a CV in operations mode (addr) or on the programming track
+
+        Writes on the programming track are verified by the base station,
+        the future resolves to the <r> reply with the value read back.
+
+        """
+        if addr != 0:
+            # Operations mode writes are not acknowledged
+            name, args = self.write_args(cv, value, addr)
+            self.send_command(name, *args)
+            return None
+        if callnum is None:
+            callnum = self.next_callnum()
+        name, args = self.write_args(cv, value, addr, callnum, callsub)
+        return self.request(("r", callnum, callsub), name, *args,
+                timeout=timeout)
+
+    def read(self, cv, callnum=None, callsub=0, timeout=None):
+        """Read a CV on the programming track, the future resolves to the
+        <r> reply with the value, which is -1 if reading failed"""
+        if callnum is None:
+            callnum = self.next_callnum()
+        return self.request(("r", callnum, callsub), "R", cv, callnum,
+                callsub, timeout=timeout)
 
     def __repr__(self):
         return "<DCCpp<connected=%s>(port='%s', baudrate='%s')>" % (
@@ -96,3 +707,15 @@ class DCCpp(object):
 
     class Error(BaseError):
         pass
+
+
+    class Timeout(Error):
+        pass
+
+
+    class Cancelled(Error):
+        pass
+
+
+    class Refused(Error):
+        pass
@@ -0,0 +1,155 @@
+import glob
+import json
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from pyrail.drivers.arduino.reply import ReplyParser, InfoReply
+from pyrail.utils.cache import cache_path
+
+_log = logging.getLogger(__name__)
+
+PORT_PATTERNS = ("/dev/ttyACM*", "/dev/ttyUSB*", "/dev/tty.usbmodem*",
+        "/dev/tty.usbserial*", "/dev/cu.usbmodem*", "/dev/cu.usbserial*")
+BANNER = "DCC++"
+# Opening the port resets the Arduino, it takes about 2s until it answers
+PROBE_TIMEOUT = 3.0
+PROBE_INTERVAL = 0.25
+
+
+def candidate_ports():
+    """Return the serial ports which might be connected to an Arduino"""
+    ports = set()
+    try:
+        from serial.tools.list_ports import comports
+        for info in comports():
+            # Skip legacy serial ports without any USB hardware behind them
+            if info.hwid and info.hwid != "n/a":
+                ports.add(info.device)
+    except ImportError:
+        pass
+    for pattern in PORT_PATTERNS:
+        ports.update(glob.glob(pattern))
+    return sorted(ports)
+
+
+def probe(port, baudrate, timeout=PROBE_TIMEOUT):
+    """Check whether a DCC++ Base Station is connected to port
+
+    The status command is sent repeatedly until the base station answers
+    with its banner or the timeout expires. Returns a tuple of the opened
+    serial port and the banner of the base station, or None.
+
+    """
+    import serial
+    try:
+        com = serial.Serial(port, baudrate, timeout=PROBE_INTERVAL / 5)
+    except (serial.SerialException, OSError) as ex:
+        _log.debug("Probing '%s' failed: %s" % (port, ex))
+        return None
+    parser = ReplyParser()
+    deadline = time.monotonic() + timeout
+    next_status = 0
+    try:
+        while time.monotonic() < deadline:
+            if time.monotonic() >= next_status:
+                com.write(b"<s>")
+                next_status = time.monotonic() + PROBE_INTERVAL
+            for reply in parser.feed(com.read(com.in_waiting or 1)):
+                if (isinstance(reply, InfoReply) and
+                        reply.info.startswith(BANNER)):
+                    _log.debug("Found '%s' on '%s'" % (reply.info, port))
+                    return com, reply.info
+    except (serial.SerialException, OSError) as ex:
+        _log.debug("Probing '%s' failed: %s" % (port, ex))
+    com.close()
+    return None
+
+
+def discover(baudrate, ports=None, timeout=PROBE_TIMEOUT):
+    """Probe all ports concurrently and return the first station found
+
+    Returns a tuple of (port, banner, com) or None.
+
+    """
+    ports = candidate_ports() if ports is None else ports
+    if not ports:
+        return None
+    _log.debug("Probing %s ..." % ", ".join(ports))
+    executor = ThreadPoolExecutor(max_workers=len(ports),
+            thread_name_prefix="dccpp-probe")
+    futures = dict((executor.submit(probe, port, baudrate, timeout), port)
+            for port in ports)
+    found = winner = None
+    for future in as_completed(futures):
+        result = future.result()
+        if result is not None:
+            found, winner = (futures[future], result[1], result[0]), future
+            break
+    # Do not wait for the other probes, but close their ports when done
+    for future in futures:
+        if future is not winner:
+            future.add_done_callback(_close_probe)
+    executor.shutdown(wait=False)
+    return found
+
+
+def _close_probe(future):
+    result = future.result()
+    if result is not None:
+        _log.warn("Ignoring another DCC++ station on '%s'" % result[0].port)
+        result[0].close()
+
+
+class PortCache(object):
+    """On-disk cache of the last discovered port and firmware of a station"""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = cache_path("dccpp-port.json")
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                entry = json.load(f)
+            return entry["port"], entry.get("info")
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, port, info):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump({"port": port, "info": info}, f)
+        except OSError as ex:
+            _log.warn("Unable to cache port: %s" % ex)
+
+    def clear(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def find_station(baudrate, cache=None, timeout=PROBE_TIMEOUT):
+    """Find a DCC++ Base Station, trying the cached port first
+
+    Returns a tuple of (port, banner, com) or None.
+
+    """
+    cache = cache or PortCache()
+    cached = cache.load()
+    if cached is not None:
+        result = probe(cached[0], baudrate, timeout)
+        if result is not None:
+            return (cached[0], result[1], result[0])
+        _log.info("Cached port '%s' does not answer, probing all ports ..." %
+                cached[0])
+        cache.clear()
+    found = discover(baudrate, timeout=timeout)
+    if found is not None:
+        cache.save(found[0], found[1])
+    return found
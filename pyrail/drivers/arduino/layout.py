@@ -0,0 +1,259 @@
+import threading
+
+from pyrail.drivers.arduino.reply import (ThrottleReply, TurnoutReply,
+        OutputReply)
+
+
+# DCC function groups: (first function, number of functions, first byte)
+FUNCTION_GROUPS = (
+    (0, 5, 128),
+    (5, 4, 176),
+    (9, 4, 160),
+    (13, 8, 222),
+    (21, 8, 223),
+)
+MAX_FUNCTION = 28
+
+
+def function_group(fn):
+    """Return the index of the group of the first byte of an <f> command"""
+    if fn == 222:
+        return 3
+    elif fn == 223:
+        return 4
+    elif fn >= 176:
+        return 1
+    elif fn >= 160:
+        return 2
+    return 0
+
+
+def group_mask(group):
+    first, count, prefix = FUNCTION_GROUPS[group]
+    return ((1 << count) - 1) << first
+
+
+def encode_group(mask, group):
+    """Return the arguments of the <f> command setting a function group"""
+    first, count, prefix = FUNCTION_GROUPS[group]
+    bits = (mask >> first) & ((1 << count) - 1)
+    if group == 0:
+        # F0 is bit 4, F1-F4 are bits 0-3
+        return (prefix + ((bits & 1) << 4) + (bits >> 1),)
+    elif prefix >= 222:
+        return (prefix, bits)
+    return (prefix + bits,)
+
+
+def decode_group(fn, fn2=None):
+    """Return the group index and function bits of an <f> command"""
+    group = function_group(fn)
+    first = FUNCTION_GROUPS[group][0]
+    if group == 0:
+        bits = ((fn >> 4) & 1) | ((fn & 0x0f) << 1)
+    elif fn2 is not None:
+        bits = fn2
+    else:
+        bits = fn & 0x0f
+    return group, (bits << first) & group_mask(group)
+
+
+class State(object):
+    """Last commanded and last confirmed state of a layout object
+
+    previous is the commanded state before the last change, it is restored
+    if the command of the change fails (see LayoutState.revert).
+
+    """
+
+    __slots__ = ("commanded", "confirmed", "previous")
+
+    def __init__(self, commanded=None, confirmed=None):
+        self.commanded = commanded
+        self.confirmed = confirmed
+        self.previous = None
+
+    def __repr__(self):
+        return "<State(commanded=%s, confirmed=%s)>" % (self.commanded,
+                self.confirmed)
+
+
+class CabState(object):
+    """State of a cab: register, signed speed and functions
+
+    The functions F0-F28 are stored as bitmask, bit n is function Fn. Bit n
+    of groups is set, once group n was sent to the decoder.
+
+    """
+
+    __slots__ = ("cab", "register", "speed", "functions", "groups")
+
+    def __init__(self, cab):
+        self.cab = cab
+        self.register = None
+        self.speed = State()
+        self.functions = 0
+        self.groups = 0
+
+    @property
+    def moving(self):
+        return bool(self.speed.commanded)
+
+    def function(self, fn):
+        return bool(self.functions & (1 << fn))
+
+    def __repr__(self):
+        return "<CabState(cab=%s, register=%s, speed=%s)>" % (self.cab,
+                self.register, self.speed)
+
+
+class LayoutState(object):
+    """In-memory model of the layout as known by a DCC++ Base Station
+
+    The set_* methods record a command and return False, if it would not
+    change anything, so the driver is able to drop it. Replies of the base
+    station update the confirmed state (see confirm). Commands of objects,
+    which the base station confirms, are only dropped if their state is
+    confirmed, so a command which was lost or refused is sent again.
+
+    Function groups and accessories are never acknowledged by the base
+    station, so only their commanded state is known.
+
+    """
+
+    def __init__(self):
+        self.cabs = {}
+        self.registers = {}
+        self.turnouts = {}
+        self.accessories = {}
+        self.outputs = {}
+        self._lock = threading.Lock()
+
+    def cab(self, cab):
+        """Return the state of a cab or None, if it was never commanded"""
+        return self.cabs.get(cab)
+
+    def turnout(self, tid):
+        return self.turnouts.get(tid)
+
+    def output(self, oid):
+        return self.outputs.get(oid)
+
+    def clear(self):
+        with self._lock:
+            self.cabs.clear()
+            self.registers.clear()
+            self.turnouts.clear()
+            self.accessories.clear()
+            self.outputs.clear()
+
+    def _cab(self, cab):
+        state = self.cabs.get(cab)
+        if state is None:
+            state = self.cabs[cab] = CabState(cab)
+        return state
+
+    def set_throttle(self, register, cab, speed):
+        with self._lock:
+            state = self._cab(cab)
+            if state.register == register and state.speed.commanded == \
+                    speed and state.speed.confirmed == speed:
+                return False
+            # A register only refreshes the packets of one cab
+            old_cab = self.registers.get(register)
+            if old_cab is not None and old_cab != cab:
+                self.cabs[old_cab].register = None
+            if state.register is not None and state.register != register:
+                self.registers.pop(state.register, None)
+            self.registers[register] = cab
+            state.register = register
+            state.speed.previous = state.speed.commanded
+            state.speed.commanded = speed
+            return True
+
+    def set_function(self, cab, fn, fn2=None):
+        group, bits = decode_group(fn, fn2)
+        mask = group_mask(group)
+        with self._lock:
+            state = self._cab(cab)
+            if (state.groups & (1 << group) and
+                    state.functions & mask == bits):
+                return False
+            state.functions = (state.functions & ~mask) | bits
+            state.groups |= 1 << group
+            return True
+
+    def set_functions(self, cab, on=(), off=()):
+        """Switch functions on and off
+
+        Returns the list of <f> command arguments of the function groups
+        which have to be sent to apply the change.
+
+        """
+        set_mask = clear_mask = 0
+        for fn in on:
+            set_mask |= 1 << fn
+        for fn in off:
+            clear_mask |= 1 << fn
+        if (set_mask | clear_mask) >> (MAX_FUNCTION + 1):
+            raise ValueError("Functions must be between F0 and F%d!" %
+                    MAX_FUNCTION)
+        with self._lock:
+            state = self._cab(cab)
+            old = state.functions
+            new = (old & ~clear_mask) | set_mask
+            commands = []
+            for group in range(len(FUNCTION_GROUPS)):
+                mask = group_mask(group)
+                if not (set_mask | clear_mask) & mask:
+                    continue
+                if state.groups & (1 << group) and not (old ^ new) & mask:
+                    continue
+                commands.append(encode_group(new, group))
+                state.groups |= 1 << group
+            state.functions = new
+            return commands
+
+    def _set(self, states, key, value, confirmed=False):
+        with self._lock:
+            state = states.get(key)
+            if state is None:
+                states[key] = State(value)
+                return True
+            if state.commanded == value and (not confirmed or
+                    state.confirmed == value):
+                return False
+            state.previous = state.commanded
+            state.commanded = value
+            return True
+
+    def revert(self, state, value):
+        """Restore the commanded state before a command of value failed"""
+        with self._lock:
+            if state is not None and state.commanded == value:
+                state.commanded = state.previous
+
+    def set_turnout(self, tid, thrown):
+        return self._set(self.turnouts, tid, thrown, True)
+
+    def set_accessory(self, addr, state):
+        return self._set(self.accessories, addr, state)
+
+    def set_output(self, oid, state):
+        return self._set(self.outputs, oid, state, True)
+
+    def confirm(self, reply):
+        """Update the confirmed state with a reply of the base station"""
+        if isinstance(reply, ThrottleReply):
+            cab = self.registers.get(reply.register)
+            if cab is not None:
+                # Speed -1 is an emergency stop
+                speed = max(reply.speed, 0)
+                speed = speed if reply.direction else -speed
+                self.cabs[cab].speed.confirmed = speed
+        elif isinstance(reply, TurnoutReply):
+            self.turnouts.setdefault(reply.id, State(reply.state)).confirmed \
+                    = reply.state
+        elif isinstance(reply, OutputReply):
+            self.outputs.setdefault(reply.id, State(reply.state)).confirmed \
+                    = reply.state
@@ -0,0 +1,289 @@
+import configparser
+import hashlib
+import logging
+import marshal
+import os
+
+from pyrail.exc.error import Error as BaseError
+from pyrail.utils.cache import cache_path
+
+_log = logging.getLogger(__name__)
+
+# Bump, if the compiled tables change
+FORMAT_VERSION = 2
+
+TURNOUT_STATES = {"0": 0, "1": 1, "closed": 0, "thrown": 1, "straight": 0,
+        "diverging": 1}
+
+
+class LayoutConfig(object):
+    """Cabs, turnouts, sensors, routes and stations of a layout by name
+
+    The layout is described in an INI file, one section per object:
+
+        [station main]
+        port = /dev/ttyACM0
+        baudrate = 115200
+
+        [cab br218]
+        address = 3
+
+        [turnout yard-entry]
+        address = 5
+        id = 1
+
+        [sensor block1]
+        id = 4
+        pin = 30
+        pullup = yes
+        debounce = 0.05
+
+        [route yard]
+        turnouts = yard-entry:thrown, 6:closed
+
+    The file is compiled into tables of name -> address and address -> name
+    of every kind of object. Names are resolved with a single lookup and
+    numbers are taken as addresses, so a layout is optional. The id of a
+    turnout is the id it is defined with on the station (<T ID ADDR SUB>),
+    so it is thrown with a confirmation (see RouteEngine).
+
+    """
+
+    KINDS = ("station", "cab", "turnout", "sensor", "route")
+
+    def __init__(self, tables=None, path=None):
+        self.path = path
+        self.tables = tables or dict((kind, ({}, {}))
+                for kind in LayoutConfig.KINDS)
+
+    def __len__(self):
+        return sum(len(by_name) for by_name, by_address in
+                self.tables.values())
+
+    @classmethod
+    def load(cls, path, cache=None):
+        """Load a layout file, from the compiled cache if it is unchanged"""
+        cache = cache or LayoutCache()
+        tables = cache.load(path)
+        if tables is None:
+            try:
+                # The file is examined before it is read, so a change while
+                # reading invalidates the cache
+                stat = os.stat(path)
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as ex:
+                raise LayoutConfig.Error("Unable to read %s: %s" % (path, ex))
+            tables = compile_layout(data.decode("utf-8"), path)
+            cache.save(path, stat, data, tables)
+        return cls(tables, path)
+
+    @classmethod
+    def parse(cls, text, path="<layout>"):
+        return cls(compile_layout(text, path), path)
+
+    def _resolve(self, kind, value):
+        by_name = self.tables[kind][0]
+        address = by_name.get(value)
+        if address is not None:
+            return address
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError("Unknown %s: %s" % (kind, value))
+
+    def cab(self, value):
+        """Return the address of a cab given by name or address"""
+        return self._resolve("cab", value)
+
+    def turnout(self, value):
+        value = self._resolve("turnout", value)
+        return value[0] if isinstance(value, tuple) else value
+
+    def turnout_ids(self):
+        """Return a dict of address -> id of the defined turnouts"""
+        return dict((address, tid) for address, tid in
+                self.tables["turnout"][0].values() if tid is not None)
+
+    def sensor(self, value):
+        """Return the id of a sensor given by name or id"""
+        value = self._resolve("sensor", value)
+        return value[0] if isinstance(value, tuple) else value
+
+    def sensor_definition(self, value):
+        """Return the (id, pin, pullup, debounce) of a sensor or None"""
+        entry = self.tables["sensor"][0].get(value)
+        if entry is None:
+            entry = self.tables["sensor"][1].get(self.sensor(value))
+            entry = None if entry is None else self.tables["sensor"][0][entry]
+        return entry
+
+    def route(self, name):
+        """Return the ((turnout address, state), ...) of a route"""
+        try:
+            return self.tables["route"][0][name]
+        except KeyError:
+            raise ValueError("Unknown route: %s" % name)
+
+    def station(self, name):
+        """Return the (port, baudrate) of a station or None"""
+        return self.tables["station"][0].get(name)
+
+    @property
+    def default_station(self):
+        """Return the (port, baudrate) of the only or the first station"""
+        stations = self.tables["station"][0]
+        return next(iter(stations.values()), None)
+
+    def names(self, kind):
+        return list(self.tables[kind][0])
+
+    def name(self, kind, address):
+        """Return the name of an object by its address, None if unnamed"""
+        return self.tables[kind][1].get(address)
+
+
+    class Error(BaseError):
+        pass
+
+
+def _int(section, key, path):
+    try:
+        return section.getint(key)
+    except ValueError:
+        raise LayoutConfig.Error("%s: [%s] %s must be a number!" % (path,
+                section.name, key))
+
+
+def compile_layout(text, path="<layout>"):
+    """Compile the text of a layout file into the tables of a LayoutConfig"""
+    parser = configparser.ConfigParser(interpolation=None)
+    try:
+        parser.read_string(text, path)
+    except configparser.Error as ex:
+        raise LayoutConfig.Error("%s: %s" % (path, ex))
+    tables = dict((kind, ({}, {})) for kind in LayoutConfig.KINDS)
+    routes = []
+    for name in parser.sections():
+        kind, sep, obj_name = name.partition(" ")
+        obj_name = obj_name.strip()
+        if kind not in tables or not obj_name:
+            raise LayoutConfig.Error("%s: Invalid section [%s], expected "
+                    "[KIND NAME] with KIND one of %s!" % (path, name,
+                    ", ".join(LayoutConfig.KINDS)))
+        section = parser[name]
+        if kind == "station":
+            if "port" not in section:
+                raise LayoutConfig.Error("%s: [%s] has no port!" % (path,
+                        name))
+            entry = (section["port"], _int(section, "baudrate", path))
+            address = section["port"]
+        elif kind == "cab":
+            address = entry = _int(section, "address", path)
+        elif kind == "turnout":
+            address = _int(section, "address", path)
+            entry = (address, _int(section, "id", path))
+        elif kind == "sensor":
+            address = _int(section, "id", path)
+            try:
+                entry = (address, section.getint("pin"),
+                        int(section.getboolean("pullup", True)),
+                        section.getfloat("debounce"))
+            except ValueError as ex:
+                raise LayoutConfig.Error("%s: [%s] %s" % (path, name, ex))
+        else:
+            # Routes refer to turnouts, which may be defined later
+            routes.append((obj_name, section))
+            continue
+        if address is None:
+            raise LayoutConfig.Error("%s: [%s] has no address!" % (path,
+                    name))
+        by_name, by_address = tables[kind]
+        if address in by_address:
+            raise LayoutConfig.Error("%s: [%s] uses the address of %s!" % (
+                    path, name, by_address[address]))
+        by_name[obj_name] = entry
+        by_address[address] = obj_name
+    turnouts = tables["turnout"][0]
+    for obj_name, section in routes:
+        settings = []
+        for item in section.get("turnouts", "").split(","):
+            if not item.strip():
+                continue
+            turnout, sep, state = item.strip().rpartition(":")
+            address = turnouts[turnout][0] if turnout in turnouts else None
+            if address is None:
+                try:
+                    address = int(turnout)
+                except ValueError:
+                    address = None
+            if address is None or state.lower() not in TURNOUT_STATES:
+                raise LayoutConfig.Error("%s: [route %s] invalid turnout "
+                        "'%s', expected TURNOUT:STATE!" % (path, obj_name,
+                        item.strip()))
+            settings.append((address, TURNOUT_STATES[state.lower()]))
+        tables["route"][0][obj_name] = tuple(settings)
+    return tables
+
+
+class LayoutCache(object):
+    """On-disk cache of compiled layout files
+
+    A compiled layout is valid while the modification time and the size of
+    its file are unchanged. Otherwise the file is hashed, so touching it does
+    not compile it again. The tables are stored with marshal, which is much
+    faster to load than parsing the file.
+
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = cache_path("layouts")
+        self.path = path
+
+    def filename(self, source):
+        digest = hashlib.sha1(os.path.abspath(source).encode("utf-8"))
+        return os.path.join(self.path, "%s.marshal" % digest.hexdigest())
+
+    def _read(self, source):
+        try:
+            with open(self.filename(source), "rb") as f:
+                entry = marshal.load(f)
+            if entry["version"] == FORMAT_VERSION:
+                return entry
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+        return None
+
+    def load(self, source):
+        """Return the tables of an unchanged layout file, or None"""
+        entry = self._read(source)
+        if entry is None:
+            return None
+        try:
+            stat = os.stat(source)
+            if (stat.st_mtime_ns, stat.st_size) == (entry["mtime"],
+                    entry["size"]):
+                return entry["tables"]
+            with open(source, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if hashlib.sha256(data).hexdigest() != entry["hash"]:
+            return None
+        # Only the time changed, remember it for the next start
+        self.save(source, stat, data, entry["tables"])
+        return entry["tables"]
+
+    def save(self, source, stat, data, tables):
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            tmp = "%s.%d.tmp" % (self.filename(source), os.getpid())
+            with open(tmp, "wb") as f:
+                marshal.dump({"version": FORMAT_VERSION,
+                        "mtime": stat.st_mtime_ns, "size": stat.st_size,
+                        "hash": hashlib.sha256(data).hexdigest(),
+                        "tables": tables}, f)
+            os.replace(tmp, self.filename(source))
+        except (OSError, ValueError) as ex:
+            _log.warn("Unable to cache the layout: %s" % ex)
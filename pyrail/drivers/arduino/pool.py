@@ -0,0 +1,199 @@
+import bisect
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.scheduler import chain_future
+from pyrail.exc.error import Error as BaseError
+
+_log = logging.getLogger(__name__)
+
+
+class RoutingTable(object):
+    """Map addresses of cabs, turnouts and sensors to station names
+
+    Routes are either single addresses or inclusive address ranges. Single
+    addresses take precedence over ranges, if no route matches the default
+    station is used.
+
+    """
+
+    KINDS = ("cab", "turnout", "sensor")
+
+    def __init__(self, default=None):
+        self.default = default
+        self._addrs = dict((kind, {}) for kind in RoutingTable.KINDS)
+        self._ranges = dict((kind, []) for kind in RoutingTable.KINDS)
+
+    def add(self, kind, addr, station):
+        """Route a single address or a (first, last) range to a station"""
+        if kind not in self._addrs:
+            raise StationPool.Error("Unknown address kind '%s'!" % kind)
+        if isinstance(addr, tuple):
+            first, last = addr
+            ranges = self._ranges[kind]
+            idx = bisect.bisect_left(ranges, (first,))
+            if ((idx > 0 and ranges[idx - 1][1] >= first) or
+                    (idx < len(ranges) and ranges[idx][0] <= last)):
+                raise StationPool.Error("Range %s-%s of %s overlaps!" % (first,
+                        last, kind))
+            ranges.insert(idx, (first, last, station))
+        else:
+            self._addrs[kind][addr] = station
+
+    def lookup(self, kind, addr):
+        station = self._addrs[kind].get(addr)
+        if station is not None:
+            return station
+        ranges = self._ranges[kind]
+        idx = bisect.bisect_right(ranges, (addr, float("inf"))) - 1
+        if idx >= 0 and ranges[idx][0] <= addr <= ranges[idx][1]:
+            return ranges[idx][2]
+        if self.default is None:
+            raise StationPool.Error("No station for %s %s!" % (kind, addr))
+        return self.default
+
+
+class StationPool(object):
+    """Several DCC++ Base Stations driven as one
+
+    Every station has its own worker thread, so commands to all stations are
+    written in parallel and a slow or disconnected station does not stall the
+    others. Commands are routed by the address of the cab, turnout or sensor,
+    see RoutingTable. All commands return a future of the station's reply.
+
+    """
+
+    MAX_QUEUE = 256
+
+    def __init__(self, default=None, max_queue=None):
+        self.stations = {}
+        self.routes = RoutingTable(default)
+        self.max_queue = max_queue or StationPool.MAX_QUEUE
+        self._workers = {}
+        self._queued = {}
+        self._lock = threading.Lock()
+
+    def add_station(self, name, station):
+        """Add a DCCpp instance or the port of a station to the pool"""
+        if not isinstance(station, DCCpp):
+            station = DCCpp(station)
+        self.stations[name] = station
+        self._queued[name] = 0
+        self._workers[name] = ThreadPoolExecutor(max_workers=1,
+                thread_name_prefix="station-%s" % name)
+        if self.routes.default is None:
+            self.routes.default = name
+        return station
+
+    def route(self, kind, addr, name):
+        if name not in self.stations:
+            raise StationPool.Error("Unknown station '%s'!" % name)
+        self.routes.add(kind, addr, name)
+
+    def station_for(self, kind, addr):
+        return self.stations[self.routes.lookup(kind, addr)]
+
+    def submit(self, name, func, *args):
+        """Run func(station, *args) in the worker of the station
+
+        If func returns a future, the returned future is resolved with its
+        result.
+
+        """
+        future = Future()
+        with self._lock:
+            if self._queued[name] >= self.max_queue:
+                future.set_exception(StationPool.Error(
+                        "Station '%s' is not keeping up!" % name))
+                return future
+            self._queued[name] += 1
+        self._workers[name].submit(self._execute, name, future, func, args)
+        return future
+
+    def _execute(self, name, future, func, args):
+        with self._lock:
+            self._queued[name] -= 1
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = func(self.stations[name], *args)
+        except Exception as ex:
+            future.set_exception(ex)
+            return
+        if isinstance(result, Future):
+            chain_future(result, [future])
+        else:
+            future.set_result(result)
+
+    def broadcast(self, func, *args):
+        return dict((name, self.submit(name, func, *args))
+                for name in self.stations)
+
+    def connect(self):
+        """Connect all stations in parallel, failed stations are logged"""
+        futures = self.broadcast(DCCpp.connect)
+        connected = {}
+        for name, future in futures.items():
+            try:
+                connected[name] = future.result()
+            except DCCpp.Error as ex:
+                _log.error("Station '%s': %s" % (name, ex))
+                connected[name] = False
+        return connected
+
+    def disconnect(self):
+        futures = self.broadcast(DCCpp.disconnect)
+        for future in futures.values():
+            future.exception()
+
+    def close(self):
+        self.disconnect()
+        for worker in self._workers.values():
+            worker.shutdown()
+
+    def queued(self, name):
+        return self._queued[name]
+
+    def power_on(self):
+        return self.broadcast(DCCpp.power_on)
+
+    def power_off(self):
+        return self.broadcast(DCCpp.power_off)
+
+    def status(self):
+        return self.broadcast(DCCpp.status)
+
+    def throttle(self, register, cab, speed):
+        return self.submit(self.routes.lookup("cab", cab), DCCpp.throttle,
+                register, cab, speed)
+
+    def function(self, cab, fn):
+        return self.submit(self.routes.lookup("cab", cab), DCCpp.function,
+                cab, fn)
+
+    def turnout(self, addr, state):
+        return self.submit(self.routes.lookup("turnout", addr),
+                DCCpp.turnout, addr, state)
+
+    def define_sensor(self, sid, pin, pullup=1):
+        return self.submit(self.routes.lookup("sensor", sid),
+                DCCpp.define_sensor, sid, pin, pullup)
+
+    def delete_sensor(self, sid):
+        return self.submit(self.routes.lookup("sensor", sid),
+                DCCpp.delete_sensor, sid)
+
+    def sensor(self, sid):
+        """Return the state of a sensor reported by its station, None if it
+        is unknown"""
+        return self.station_for("sensor", sid).sensors.state(sid)
+
+    def __repr__(self):
+        return "<StationPool(%s)>" % ", ".join(self.stations)
+
+
+    class Error(BaseError):
+        pass
@@ -0,0 +1,228 @@
+import json
+import logging
+import os
+import time
+
+from collections import deque
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.exc.error import Error as BaseError
+from pyrail.utils.cache import cache_path
+
+_log = logging.getLogger(__name__)
+
+# CVs identifying a decoder
+CV_ADDRESS = 1
+CV_VERSION = 7
+CV_MANUFACTURER = 8
+CV_LONG_ADDRESS = (17, 18)
+CV_CONFIG = 29
+IDENTITY_CVS = (CV_ADDRESS, CV_VERSION, CV_MANUFACTURER, CV_CONFIG)
+# CVs which cannot be written, CV8 resets the decoder when written
+READ_ONLY_CVS = (CV_VERSION, CV_MANUFACTURER)
+DEFAULT_CVS = range(1, 257)
+
+
+class CvCache(object):
+    """On-disk cache of the CVs of decoders
+
+    The CVs of a decoder are stored in one file per address, manufacturer
+    and version, together with the time they were read or written.
+
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            path = cache_path("cvs")
+        self.path = path
+
+    def filename(self, ident):
+        return os.path.join(self.path, "%d-%d-%d.json" % ident)
+
+    def load(self, ident):
+        """Return a dict of CV -> (value, timestamp) of a decoder"""
+        try:
+            with open(self.filename(ident)) as f:
+                entries = json.load(f)["cvs"]
+            return dict((int(cv), tuple(entry))
+                    for cv, entry in entries.items())
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def save(self, ident, cvs):
+        address, manufacturer, version = ident
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.filename(ident), "w") as f:
+                json.dump({"address": address, "manufacturer": manufacturer,
+                        "version": version, "cvs": dict((str(cv), entry)
+                        for cv, entry in sorted(cvs.items()))}, f)
+        except OSError as ex:
+            _log.warn("Unable to cache CVs: %s" % ex)
+
+
+class Programmer(object):
+    """Read, verify and write the CVs of a decoder on the programming track
+
+    Several requests are sent at once, at most `window` of them wait for
+    their reply. All requests of an operation share one CALLNUM and use the
+    CV as CALLSUB, so every reply is matched with its request. As the base
+    station processes programming commands one after the other, the timeout
+    of a request covers the requests sent before it.
+
+    """
+
+    DEFAULT_WINDOW = 4
+    # Time a decoder takes to answer a single read or write
+    DEFAULT_CV_TIMEOUT = 1.0
+    # Cached CVs older than this are read again (seconds)
+    DEFAULT_MAX_AGE = 30 * 24 * 3600
+
+    def __init__(self, dcc, window=None, cv_timeout=None, cache=None,
+            max_age=None):
+        self.dcc = dcc
+        self.window = window or Programmer.DEFAULT_WINDOW
+        self.cv_timeout = cv_timeout or Programmer.DEFAULT_CV_TIMEOUT
+        self.cache = cache or CvCache()
+        self.max_age = Programmer.DEFAULT_MAX_AGE if max_age is None else \
+                max_age
+
+    @property
+    def timeout(self):
+        return self.window * self.cv_timeout
+
+    def _pipeline(self, send, items, errors=None):
+        """Send one request per item, with at most window outstanding
+
+        Returns a dict of CV -> value, the value is None, if the request
+        failed or timed out. The CVs without a reply are added to errors.
+
+        """
+        callnum = self.dcc.next_callnum()
+        results = {}
+        pending = deque()
+        for item in items:
+            if len(pending) >= self.window:
+                self._collect(pending.popleft(), results, errors)
+            pending.append((item[0], send(callnum, *item)))
+        while pending:
+            self._collect(pending.popleft(), results, errors)
+        return results
+
+    @staticmethod
+    def _collect(entry, results, errors):
+        cv, future = entry
+        try:
+            reply = future.result()
+        except DCCpp.Error as ex:
+            _log.warn("CV %d failed: %s" % (cv, ex))
+            results[cv] = None
+            if errors is not None:
+                errors.add(cv)
+            return
+        results[cv] = None if reply.failed else reply.value
+
+    def read_cvs(self, cvs, errors=None):
+        return self._pipeline(lambda callnum, cv: self.dcc.read(cv, callnum,
+                cv, self.timeout), [(cv,) for cv in cvs], errors)
+
+    def write_cvs(self, values):
+        """Write and verify CVs, returns a dict of CV -> value read back
+
+        The written values are stored in the cache of the decoder, so a
+        dump does not have to read them again.
+
+        """
+        written = self._pipeline(lambda callnum, cv, value: self.dcc.write(
+                cv, value, 0, callnum, cv, self.timeout),
+                sorted(values.items()))
+        try:
+            ident = self.identify()
+        except Programmer.Error as ex:
+            _log.warn("Not caching the written CVs: %s" % ex)
+            return written
+        cached = self.cache.load(ident)
+        now = time.time()
+        for cv, value in written.items():
+            if value is not None:
+                cached[cv] = (value, now)
+        self.cache.save(ident, cached)
+        return written
+
+    def read(self, cv):
+        value = self.read_cvs([cv])[cv]
+        if value is None:
+            raise Programmer.Error("Unable to read CV %d!" % cv)
+        return value
+
+    def verify(self, cv, value):
+        """Check whether a CV has the expected value"""
+        return self.read(cv) == value
+
+    def write(self, cv, value):
+        if self.write_cvs({cv: value})[cv] != value:
+            raise Programmer.Error("Unable to write CV %d!" % cv)
+
+    def identify(self, values=None):
+        """Read the identity of a decoder: (address, manufacturer, version)"""
+        values = dict(values or {})
+        missing = [cv for cv in IDENTITY_CVS if values.get(cv) is None]
+        values.update(self.read_cvs(missing))
+        if any(values.get(cv) is None for cv in IDENTITY_CVS):
+            raise Programmer.Error("Unable to identify the decoder!")
+        address = values[CV_ADDRESS]
+        if values[CV_CONFIG] & 0x20:
+            high, low = self.read_cvs(CV_LONG_ADDRESS).values()
+            if high is None or low is None:
+                raise Programmer.Error("Unable to read the long address!")
+            address = ((high - 192) << 8) + low
+        return address, values[CV_MANUFACTURER], values[CV_VERSION]
+
+    def dump(self, cvs=DEFAULT_CVS, refresh=False):
+        """Read the CVs of a decoder, using the cache for recent values
+
+        Returns the identity of the decoder and a dict of CV -> value, the
+        value is None if the CV could not be read (e.g. it does not exist).
+
+        """
+        # CVs without a reply are not cached, only those the decoder failed
+        errors = set()
+        identity = self.read_cvs(IDENTITY_CVS, errors)
+        ident = self.identify(identity)
+        cached = {} if refresh else self.cache.load(ident)
+        now = time.time()
+        values = dict(identity)
+        stale = []
+        for cv in cvs:
+            if cv in values:
+                continue
+            entry = cached.get(cv)
+            if entry is not None and now - entry[1] < self.max_age:
+                values[cv] = entry[0]
+            else:
+                stale.append(cv)
+        _log.debug("Reading %d CVs, %d are cached" % (len(stale),
+                len(values)))
+        values.update(self.read_cvs(stale, errors))
+        for cv in stale + list(IDENTITY_CVS):
+            if cv not in errors:
+                cached[cv] = (values[cv], now)
+        self.cache.save(ident, cached)
+        return ident, dict((cv, values[cv]) for cv in cvs if cv in values)
+
+    def restore(self, values, verify=True):
+        """Write the CVs of a dump back to the decoder
+
+        CVs which cannot be written and CVs without a value are skipped.
+        Returns the list of CVs, which failed.
+
+        """
+        values = dict((cv, value) for cv, value in values.items()
+                if value is not None and cv not in READ_ONLY_CVS)
+        written = self.write_cvs(values)
+        return sorted(cv for cv, value in written.items()
+                if value != values[cv] and (verify or value is None))
+
+
+    class Error(BaseError):
+        pass
@@ -0,0 +1,201 @@
+import logging
+import threading
+import time
+
+from array import array
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+
+_log = logging.getLogger(__name__)
+
+
+class RampEngine(object):
+    """Momentum of many cabs, advanced on a fixed tick
+
+    The register (0: assigned by the station's register allocator), target
+    speed, current speed and rate (speed steps per second) of every cab are
+    kept in arrays, a cab occupies the same slot of all arrays. Each tick
+    advances only the slots which did not reach their target yet, and a
+    throttle command is only sent when the integer speed step of a cab
+    changes. All commands of a tick are sent with a single write. Like this
+    the work per tick and the traffic grow with the number of cabs changing
+    their speed, not with the number of cabs.
+
+    """
+
+    DEFAULT_TICK = 0.05
+    DEFAULT_RATE = 20.0
+
+    def __init__(self, dcc, tick=None, rate=None):
+        self.dcc = dcc
+        self.tick = tick or RampEngine.DEFAULT_TICK
+        self.rate = rate or RampEngine.DEFAULT_RATE
+        self.ticks = 0
+        self.sent = 0
+        self._slots = {}
+        self._cabs = array("i")
+        self._registers = array("i")
+        self._target = array("d")
+        self._current = array("d")
+        self._rates = array("d")
+        # Slots which did not reach their target speed yet
+        self._ramping = set()
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        return len(self._cabs)
+
+    @property
+    def ramping(self):
+        """Return the number of cabs which did not reach their target yet"""
+        return len(self._ramping)
+
+    def _slot(self, register, cab):
+        register = register or 0
+        slot = self._slots.get(cab)
+        if slot is None:
+            slot = self._slots[cab] = len(self._cabs)
+            state = self.dcc.layout.cab(cab)
+            speed = state.speed.commanded if state is not None else None
+            self._cabs.append(cab)
+            self._registers.append(register)
+            self._target.append(0.0)
+            self._current.append(float(speed or 0))
+            self._rates.append(self.rate)
+        else:
+            self._registers[slot] = register
+        return slot
+
+    def ramp(self, register, cab, speed, rate=None):
+        """Change the speed of a cab gradually, by rate steps per second
+
+        With a register of None the cab gets a register of its own, see
+        DCCpp.set_speed.
+
+        """
+        with self._lock:
+            slot = self._slot(register, cab)
+            if slot not in self._ramping:
+                # The speed may have been set without the engine meanwhile
+                state = self.dcc.layout.cab(cab)
+                if state is not None and state.speed.commanded is not None:
+                    self._current[slot] = float(state.speed.commanded)
+            self._target[slot] = float(speed)
+            self._rates[slot] = rate or self.rate
+            if self._current[slot] != speed:
+                self._ramping.add(slot)
+            else:
+                self._ramping.discard(slot)
+
+    def speed(self, cab):
+        """Return the current speed of a cab, or None if it is unknown"""
+        slot = self._slots.get(cab)
+        return None if slot is None else self._current[slot]
+
+    def target(self, cab):
+        slot = self._slots.get(cab)
+        return None if slot is None else self._target[slot]
+
+    def hold(self, cab=None):
+        """Stop ramping a cab (or all cabs) at its current speed"""
+        with self._lock:
+            if cab is None:
+                slots = list(self._ramping)
+            else:
+                slot = self._slots.get(cab)
+                slots = [] if slot is None else [slot]
+            for slot in slots:
+                self._target[slot] = self._current[slot]
+                self._ramping.discard(slot)
+
+    def emergency_stop(self, cab=None):
+        """Stop a cab (or all cabs) immediately, see DCCpp.emergency_stop"""
+        with self._lock:
+            if cab is None:
+                slots = list(self._slots.values())
+            else:
+                slot = self._slots.get(cab)
+                slots = [] if slot is None else [slot]
+            for slot in slots:
+                self._target[slot] = self._current[slot] = 0.0
+                self._ramping.discard(slot)
+        if cab is None:
+            return self.dcc.all_stop()
+        return self.dcc.emergency_stop(cab)
+
+    def step(self, dt=None):
+        """Advance all ramping cabs by dt seconds (default: one tick)
+
+        Returns the number of sent throttle commands.
+
+        """
+        dt = self.tick if dt is None else dt
+        with self._lock:
+            self.ticks += 1
+            if not self._ramping:
+                return 0
+        # The speeds are advanced and sent with the lock held, so a stop or
+        # hold of a cab either comes before the tick or cancels its frames
+        with self.dcc.batch(), self._lock:
+            changes = []
+            target = self._target
+            current = self._current
+            rates = self._rates
+            done = []
+            for slot in self._ramping:
+                old = current[slot]
+                delta = target[slot] - old
+                limit = rates[slot] * dt
+                if -limit < delta < limit:
+                    new = target[slot]
+                    done.append(slot)
+                elif delta > 0:
+                    new = old + limit
+                else:
+                    new = old - limit
+                current[slot] = new
+                # Speed steps are truncated towards 0
+                if int(new) != int(old):
+                    changes.append((self._registers[slot], self._cabs[slot],
+                            int(new)))
+            self._ramping.difference_update(done)
+            for register, cab, speed in changes:
+                if register:
+                    self.dcc.throttle(register, cab, speed)
+                    continue
+                try:
+                    self.dcc.set_speed(cab, speed)
+                except DCCpp.Error as ex:
+                    _log.error("Ramping cab %s failed: %s" % (cab, ex))
+            self.sent += len(changes)
+        return len(changes)
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                    name="dccpp-ramp", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # The ticks are scheduled relative to the start, so they do not drift
+        next_tick = time.monotonic()
+        while self._running:
+            try:
+                self.step()
+            except Exception as ex:
+                _log.error("Ramping failed: %s" % ex)
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
@@ -0,0 +1,306 @@
+import bisect
+import collections
+import logging
+import mmap
+import re
+import struct
+import threading
+import time
+
+from array import array
+
+from pyrail.exc.error import Error as BaseError
+
+_log = logging.getLogger(__name__)
+
+INBOUND = 0
+OUTBOUND = 1
+
+# File header: magic, version, wall clock time of the start of the recording
+HEADER = struct.Struct("<8sBd")
+MAGIC = b"PYRAILTR"
+VERSION = 1
+# Record header: microseconds since the start, direction, length of the frame
+RECORD = struct.Struct("<QBH")
+
+TrafficRecord = collections.namedtuple("TrafficRecord",
+        ("time", "direction", "frame"))
+
+
+class TrafficRecorder(object):
+    """Append the frames sent to and received from a station to a log file
+
+    Every frame is stored without its brackets, preceded by an 11 byte
+    header with the time since the start of the recording, the direction
+    and the length of the frame. The data of the transport is split into
+    frames here, so it is recorded as written and read, also if a frame is
+    split over several reads. Data outside of frames is not recorded.
+
+    """
+
+    INBOUND = INBOUND
+    OUTBOUND = OUTBOUND
+    FRAME = re.compile(rb"<([^<>]*)>")
+    BUFFER_SIZE = 64 * 1024
+
+    def __init__(self, path, buffering=None):
+        self.path = path
+        self.frames = 0
+        self._file = open(path, "wb", buffering or
+                TrafficRecorder.BUFFER_SIZE)
+        self._start = time.monotonic()
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time()))
+        self._partial = [b"", b""]
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def record(self, direction, data, now=None):
+        """Record the data written (OUTBOUND) or read (INBOUND)"""
+        now = time.monotonic() if now is None else now
+        usec = max(int((now - self._start) * 1e6), 0)
+        with self._lock:
+            if self._file.closed:
+                return
+            data = self._partial[direction] + data
+            records = []
+            end = 0
+            for match in self.FRAME.finditer(data):
+                frame = match.group(1)[:0xffff]
+                records.append(RECORD.pack(usec, direction, len(frame)))
+                records.append(frame)
+                end = match.end()
+            # Keep the start of an incomplete frame for the next data
+            start = data.rfind(b"<", end)
+            self._partial[direction] = data[start:] if start >= 0 else b""
+            if records:
+                self.frames += len(records) // 2
+                self._file.write(b"".join(records))
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class TrafficLog(object):
+    """Read a log of a TrafficRecorder
+
+    The log is mapped into memory, so even huge logs are read without
+    loading them. Filters look at the headers and the command code of the
+    records and only decode the frames which are returned. A sparse index
+    of the record offsets is built on the first seek by time.
+
+    """
+
+    INDEX_STEP = 4096
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = None
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            magic, version, self.started = HEADER.unpack_from(self._mm, 0)
+        except (ValueError, struct.error):
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise TrafficLog.Error("'%s' is no traffic log!" % path)
+        self._index_times = None
+        self._index_offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return sum(1 for entry in self._scan(HEADER.size))
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def _scan(self, offset):
+        """Iterate over the (offset, usec, direction, length) of the records
+
+        A record, which was not completely written, ends the log.
+
+        """
+        mm = self._mm
+        end = len(mm)
+        unpack = RECORD.unpack_from
+        size = RECORD.size
+        while offset + size <= end:
+            usec, direction, length = unpack(mm, offset)
+            if offset + size + length > end:
+                break
+            yield offset, usec, direction, length
+            offset += size + length
+
+    def _build_index(self):
+        times = array("Q")
+        offsets = array("Q")
+        for idx, (offset, usec, direction, length) in enumerate(
+                self._scan(HEADER.size)):
+            if idx % TrafficLog.INDEX_STEP == 0:
+                times.append(usec)
+                offsets.append(offset)
+        self._index_times, self._index_offsets = times, offsets
+
+    def seek(self, seconds):
+        """Return the offset of the first record at or after seconds"""
+        if self._index_times is None:
+            self._build_index()
+        usec = int(seconds * 1e6)
+        pos = bisect.bisect_left(self._index_times, usec)
+        offset = self._index_offsets[pos - 1] if pos else HEADER.size
+        for offset, record_usec, direction, length in self._scan(offset):
+            if record_usec >= usec:
+                return offset
+        return len(self._mm)
+
+    def records(self, since=None, until=None, direction=None, codes=None,
+            cab=None):
+        """Iterate over the TrafficRecords matching all given filters
+
+        since and until are seconds since the start of the recording,
+        codes is a string of command codes, e.g. "tT". Replies of the
+        throttles (<T REGISTER SPEED DIRECTION>) match the cab of the last
+        throttle command of their register.
+
+        """
+        mm = self._mm
+        size = RECORD.size
+        codes = None if codes is None else frozenset(codes.encode("ascii"))
+        until = None if until is None else int(until * 1e6)
+        if cab is None:
+            offset = HEADER.size if since is None else self.seek(since)
+            since = None
+        else:
+            # The cabs of the registers are learnt from the start
+            offset = HEADER.size
+            since = None if since is None else int(since * 1e6)
+            registers = {}
+            cab = b"%d" % cab
+        throttle, function, reply = ord("t"), ord("f"), ord("T")
+        # The records are scanned inline, this loop runs over huge logs
+        end = len(mm)
+        unpack = RECORD.unpack_from
+        while offset + size <= end:
+            usec, rec_direction, length = unpack(mm, offset)
+            start = offset + size
+            offset = start + length
+            if offset > end or (until is not None and usec > until):
+                break
+            code = mm[start] if length else None
+            if cab is not None:
+                # The arguments follow the code with or without a space, the
+                # station replies <T1 20 1>
+                if rec_direction == OUTBOUND and (code == throttle or
+                        code == function):
+                    args = mm[start + 1:offset].split()
+                    if code == throttle and len(args) >= 2:
+                        registers[args[0]] = record_cab = args[1]
+                    else:
+                        record_cab = args[0] if args else None
+                elif rec_direction == INBOUND and code == reply:
+                    args = mm[start + 1:offset].split()
+                    record_cab = registers.get(args[0]) if args else None
+                else:
+                    continue
+                if record_cab != cab or (since is not None and usec < since):
+                    continue
+            if direction is not None and rec_direction != direction:
+                continue
+            if codes is not None and code not in codes:
+                continue
+            yield TrafficRecord(usec / 1e6, rec_direction,
+                    mm[start:offset].decode("ascii", "replace"))
+
+
+    class Error(BaseError):
+        pass
+
+
+class Replayer(object):
+    """Send the recorded frames of a log to a station again
+
+    With a speed of 1.0 the frames are sent with their recorded timing, 2.0
+    replays twice as fast. With a speed of None the frames are sent as fast
+    as possible, in writes of up to max_batch bytes. Only the frames sent
+    to the station are replayed.
+
+    """
+
+    MAX_BATCH = 1024
+
+    def __init__(self, log, dcc, speed=1.0, max_batch=None):
+        self.log = log
+        self.dcc = dcc
+        self.speed = speed
+        self.max_batch = max_batch or Replayer.MAX_BATCH
+        self.sent = 0
+        # Maximum delay of a frame behind its recorded time (seconds)
+        self.late = 0.0
+
+    def replay(self, since=None, until=None, codes=None, cab=None):
+        """Replay the matching frames, returns the number of sent frames"""
+        records = self.log.records(since, until, OUTBOUND, codes, cab)
+        if self.speed:
+            self._replay_timed(records)
+        else:
+            self._replay_fast(records)
+        self.dcc.wait_replies()
+        return self.sent
+
+    def _send(self, frames):
+        self.dcc.send_raw(b"".join(frames))
+        self.sent += len(frames)
+
+    def _replay_fast(self, records):
+        frames = []
+        size = 0
+        for record in records:
+            frame = b"<%s>" % record.frame.encode("ascii")
+            frames.append(frame)
+            size += len(frame)
+            if size >= self.max_batch:
+                self._send(frames)
+                frames = []
+                size = 0
+        if frames:
+            self._send(frames)
+
+    def _replay_timed(self, records):
+        start = None
+        frames = []
+        size = 0
+        for record in records:
+            if start is None:
+                start = time.monotonic() - record.time / self.speed
+            delay = start + record.time / self.speed - time.monotonic()
+            # Frames which are due already are sent with one write
+            if frames and (delay > 0 or size >= self.max_batch):
+                self._send(frames)
+                frames = []
+                size = 0
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.late = max(self.late, -delay)
+            frame = b"<%s>" % record.frame.encode("ascii")
+            frames.append(frame)
+            size += len(frame)
+        if frames:
+            self._send(frames)
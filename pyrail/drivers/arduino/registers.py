@@ -0,0 +1,73 @@
+import itertools
+import logging
+import threading
+
+_log = logging.getLogger(__name__)
+
+# Number of main track registers of the DCC++ firmware (MAX_MAIN_REGISTERS)
+MAX_MAIN_REGISTERS = 12
+
+
+class RegisterAllocator(object):
+    """Assign the main track registers of a station to the cabs
+
+    A register refreshes the speed packets of one cab, so every cab needs a
+    register of its own. The registers in use are taken from the layout
+    state, so registers given to throttle explicitly are respected. A cab
+    keeps its register, while it has one. If all registers are taken, the
+    register of the least recently used idle (stopped) cab is reused. The
+    registers of moving cabs are never taken away.
+
+    """
+
+    def __init__(self, layout, size=None):
+        self.layout = layout
+        self.size = size or MAX_MAIN_REGISTERS
+        # Held while a register is assigned and the throttle is recorded
+        self.lock = threading.RLock()
+        self._uses = {}
+        self._clock = itertools.count(1)
+
+    @property
+    def mapping(self):
+        """Return a dict of register -> cab of the registers in use"""
+        return dict(self.layout.registers)
+
+    def register(self, cab):
+        """Return the register of a cab, None if it has none"""
+        state = self.layout.cab(cab)
+        return None if state is None else state.register
+
+    def _idle(self, cab):
+        state = self.layout.cab(cab)
+        return state is None or not state.speed.commanded
+
+    def acquire(self, cab):
+        """Return the register of a cab, assign one if it has none
+
+        Returns None, if all registers are used by moving cabs.
+
+        """
+        with self.lock:
+            self._uses[cab] = next(self._clock)
+            register = self.register(cab)
+            if register is not None:
+                return register
+            used = self.layout.registers
+            for register in range(1, self.size + 1):
+                if register not in used:
+                    return register
+            # Registers are reassigned with the next throttle command
+            idle = [(self._uses.get(old_cab, 0), register, old_cab)
+                    for register, old_cab in list(used.items())
+                    if self._idle(old_cab)]
+            if not idle:
+                return None
+            uses, register, old_cab = min(idle)
+            _log.debug("Register %d: cab %s replaces idle cab %s" % (
+                    register, cab, old_cab))
+            return register
+
+    def clear(self):
+        with self.lock:
+            self._uses.clear()
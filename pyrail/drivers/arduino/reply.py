@@ -0,0 +1,370 @@
+import itertools
+import threading
+import time
+
+from collections import deque
+
+
+class Reply(object):
+    """Generic reply of a DCC++ Base Station
+
+    A reply is the content of a frame between '<' and '>'. The key of a reply
+    is used to match it with the pending request which is waiting for it.
+
+    """
+
+    __slots__ = ("frame", "args")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.args = frame[1:].split()
+
+    @property
+    def code(self):
+        return self.frame[:1]
+
+    @property
+    def key(self):
+        return (self.code,)
+
+    def __repr__(self):
+        return "<%s(<%s>)>" % (self.__class__.__name__, self.frame)
+
+
+class PowerReply(Reply):
+    """<pSTATE>: Power state of the tracks (0: off, 1: on, 2: overload)"""
+
+    __slots__ = ("state",)
+
+    def __init__(self, frame):
+        super(PowerReply, self).__init__(frame)
+        self.state = int(frame[1:].strip() or 0)
+
+    @property
+    def key(self):
+        return ("p",)
+
+    @property
+    def on(self):
+        return self.state == 1
+
+
+class ThrottleReply(Reply):
+    """<T REGISTER SPEED DIRECTION>: Throttle of a register was set"""
+
+    __slots__ = ("register", "speed", "direction")
+
+    def __init__(self, frame):
+        super(ThrottleReply, self).__init__(frame)
+        self.register, self.speed, self.direction = map(int, self.args[:3])
+
+    @property
+    def key(self):
+        return ("T", self.register)
+
+
+class TurnoutReply(Reply):
+    """<H ID STATE>: State of a defined turnout (0: unthrown, 1: thrown)"""
+
+    __slots__ = ("id", "state")
+
+    def __init__(self, frame):
+        super(TurnoutReply, self).__init__(frame)
+        self.id, self.state = int(self.args[0]), int(self.args[-1])
+
+    @property
+    def key(self):
+        return ("H", self.id)
+
+
+class OutputReply(Reply):
+    """<Y ID STATE>: State of a defined output (0: inactive, 1: active)"""
+
+    __slots__ = ("id", "state")
+
+    def __init__(self, frame):
+        super(OutputReply, self).__init__(frame)
+        self.id, self.state = int(self.args[0]), int(self.args[-1])
+
+    @property
+    def key(self):
+        return ("Y", self.id)
+
+
+class CvReply(Reply):
+    """<r CALLNUM|CALLSUB|CV [BIT] VALUE>: Result of a programming command
+
+    A value of -1 means that the base station was unable to read or verify
+    the CV.
+
+    """
+
+    __slots__ = ("callnum", "callsub", "cv", "bit", "value")
+
+    def __init__(self, frame):
+        super(CvReply, self).__init__(frame)
+        head, values = frame[1:].split(None, 1)
+        self.callnum, self.callsub, self.cv = map(int, head.split("|"))
+        values = list(map(int, values.split()))
+        self.bit = values[0] if len(values) > 1 else None
+        self.value = values[-1]
+
+    @property
+    def key(self):
+        return ("r", self.callnum, self.callsub)
+
+    @property
+    def failed(self):
+        return self.value < 0
+
+
+class SensorReply(Reply):
+    """<Q ID> or <q ID>: Sensor became active or inactive
+
+    The definitions of the sensors are listed as <Q ID PIN PULLUP>, their
+    state is None.
+
+    """
+
+    __slots__ = ("id", "state", "pin", "pullup")
+
+    def __init__(self, frame):
+        super(SensorReply, self).__init__(frame)
+        self.id = int(self.args[0])
+        if len(self.args) >= 3:
+            self.state = None
+            self.pin, self.pullup = int(self.args[1]), int(self.args[2])
+        else:
+            self.state = frame[:1] == "Q"
+            self.pin = self.pullup = None
+
+    @property
+    def key(self):
+        return ("Q", self.id)
+
+
+class InfoReply(Reply):
+    """<iDCC++ ...>: Version and build information of the base station"""
+
+    __slots__ = ()
+
+    @property
+    def info(self):
+        return self.frame[1:].strip()
+
+    @property
+    def key(self):
+        return ("i",)
+
+
+class CurrentReply(Reply):
+    """<a CURRENT> or <c ...>: Current drawn by the main track"""
+
+    __slots__ = ()
+
+    @property
+    def current(self):
+        for arg in self.args:
+            try:
+                return int(arg)
+            except ValueError:
+                continue
+        return None
+
+    @property
+    def key(self):
+        return ("c",)
+
+
+class ResultReply(Reply):
+    """<O> or <X>: Result of a command which has no reply of its own
+
+    The station answers the definition and deletion of turnouts, sensors
+    and outputs with <O> or <X>, and a command for an unknown id with <X>.
+
+    """
+
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.frame[:1] == "O"
+
+    @property
+    def key(self):
+        return ("O",)
+
+
+REPLY_TYPES = {
+    "p": PowerReply,
+    "T": ThrottleReply,
+    "H": TurnoutReply,
+    "Y": OutputReply,
+    "r": CvReply,
+    "Q": SensorReply,
+    "q": SensorReply,
+    "i": InfoReply,
+    "a": CurrentReply,
+    "c": CurrentReply,
+    "O": ResultReply,
+    "X": ResultReply,
+}
+
+
+def parse_reply(frame):
+    """Convert the content of a frame into a reply object"""
+    reply_cls = REPLY_TYPES.get(frame[:1], Reply)
+    try:
+        return reply_cls(frame)
+    except (ValueError, IndexError):
+        return Reply(frame)
+
+
+class ReplyParser(object):
+    """Incremental parser for the byte stream sent by a DCC++ Base Station
+
+    Received data is appended to a reusable buffer, complete frames are
+    converted into replies and removed from the buffer. Incomplete frames
+    are kept until the rest of the frame arrives.
+
+    """
+
+    MAX_FRAME_SIZE = 256
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        replies = []
+        pos = 0
+        while True:
+            start = buf.find(b"<", pos)
+            if start < 0:
+                pos = len(buf)
+                break
+            end = buf.find(b">", start + 1)
+            if end < 0:
+                pos = start
+                break
+            # Skip garbage of an interrupted frame
+            start = buf.rfind(b"<", start, end)
+            replies.append(parse_reply(buf[start + 1:end].decode("ascii",
+                    "ignore")))
+            pos = end + 1
+        del buf[:pos]
+        if len(buf) > self.MAX_FRAME_SIZE:
+            del buf[:]
+        return replies
+
+    def reset(self):
+        del self._buf[:]
+
+
+class PendingReplies(object):
+    """Thread-safe registry of requests waiting for their reply
+
+    Every request is represented by a future which is registered with the
+    key of the expected reply. Requests with the same key are resolved in
+    the order they were sent.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._empty = threading.Condition(self._lock)
+        self._pending = {}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(q) for q in self._pending.values())
+
+    def add(self, key, future, timeout):
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._pending.setdefault(key, deque()).append((deadline, future,
+                    next(self._seq)))
+        return future
+
+    def resolve(self, reply):
+        with self._lock:
+            queue = self._pending.get(reply.key)
+            if not queue:
+                return False
+            future = queue.popleft()[1]
+            if not queue:
+                del self._pending[reply.key]
+                self._notify_empty()
+        if not future.done():
+            future.set_result(reply)
+        return True
+
+    def reject(self, codes, error):
+        """Fail the oldest request waiting for a reply with one of the codes,
+        returns False if there is none"""
+        with self._lock:
+            oldest = None
+            for key, queue in self._pending.items():
+                if key[0] in codes and (oldest is None or
+                        queue[0][2] < self._pending[oldest][0][2]):
+                    oldest = key
+            if oldest is None:
+                return False
+            queue = self._pending[oldest]
+            future = queue.popleft()[1]
+            if not queue:
+                del self._pending[oldest]
+                self._notify_empty()
+        if not future.done():
+            future.set_exception(error)
+        return True
+
+    def fail(self, key, future, error):
+        with self._lock:
+            queue = self._pending.get(key)
+            if queue:
+                for entry in queue:
+                    if entry[1] is future:
+                        queue.remove(entry)
+                        break
+                if not queue:
+                    del self._pending[key]
+                    self._notify_empty()
+        if not future.done():
+            future.set_exception(error)
+
+    def expire(self, error_cls):
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key in list(self._pending):
+                queue = self._pending[key]
+                while queue and queue[0][0] <= now:
+                    expired.append((key, queue.popleft()[1]))
+                if not queue:
+                    del self._pending[key]
+            self._notify_empty()
+        for key, future in expired:
+            if not future.done():
+                future.set_exception(error_cls("No reply for %s!" % (key,)))
+        return len(expired)
+
+    def cancel_all(self, error):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._notify_empty()
+        for queue in pending.values():
+            for deadline, future, seq in queue:
+                if not future.done():
+                    future.set_exception(error)
+
+    def _notify_empty(self):
+        if not self._pending:
+            self._empty.notify_all()
+
+    def wait_empty(self, timeout=None):
+        """Wait until all pending requests are resolved or failed"""
+        with self._lock:
+            return self._empty.wait_for(lambda: not self._pending, timeout)
@@ -0,0 +1,225 @@
+import collections
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.exc.error import Error as BaseError
+
+_log = logging.getLogger(__name__)
+
+
+class Route(object):
+    """A route set by a RouteEngine
+
+    future is resolved with the seconds it took to set the route, when all
+    its turnouts are set, or fails with RouteEngine.Error.
+
+    """
+
+    def __init__(self, name, points):
+        self.name = name
+        self.points = tuple(points)
+        self.future = Future()
+        # Turnouts in their state already, thrown and confirmed by <H>
+        self.skipped = 0
+        self.thrown = 0
+        self.confirmed = 0
+        self.started = time.monotonic()
+        self._waiting = 0
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        """Wait until the route is set, returns the seconds it took"""
+        return self.future.result(timeout)
+
+    def _point_done(self, confirmed):
+        # Called with the lock of the engine
+        self.confirmed += confirmed
+        self._waiting -= 1
+        if self._waiting == 0 and not self.future.done():
+            self.future.set_result(time.monotonic() - self.started)
+
+    def _fail(self, error):
+        if not self.future.done():
+            self.future.set_exception(error)
+
+    def __repr__(self):
+        return "<Route(name=%s, points=%d)>" % (self.name, len(self.points))
+
+
+class RouteEngine(object):
+    """Set routes with as many turnouts at once as the booster allows
+
+    The points of a route are (address, state) of turnouts. Turnouts with a
+    station id (see ids) are thrown with <T ID STATE> and confirmed by
+    their <H> reply, the others are switched with accessory commands, which
+    are never confirmed. Turnouts, which are in their state already, are
+    not switched.
+
+    The turnouts of all routes wait in one queue. A solenoid draws a lot of
+    current while it is switched, so the engine sends at most throws
+    turnouts in one write and waits interval seconds before the next
+    write. A turnout, which is queued again before it was sent, is switched
+    only once: a route setting the same state waits for it as well, a
+    route setting the other state replaces it and the earlier route fails.
+
+    """
+
+    DEFAULT_THROWS = 4
+    DEFAULT_INTERVAL = 0.1
+
+    def __init__(self, dcc, throws=None, interval=None, ids=None):
+        self.dcc = dcc
+        self.throws = throws or RouteEngine.DEFAULT_THROWS
+        self.interval = RouteEngine.DEFAULT_INTERVAL if interval is None \
+                else interval
+        # Address -> station id of the defined turnouts
+        self.ids = dict(ids or {})
+        self.writes = 0
+        # Address -> [state, routes] of the turnouts waiting to be sent
+        self._queue = collections.OrderedDict()
+        self._next_write = 0.0
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of turnouts waiting to be sent"""
+        return len(self._queue)
+
+    def _in_state(self, address, state):
+        tid = self.ids.get(address)
+        if tid is None:
+            current = self.dcc.layout.accessories.get(address)
+            return current is not None and current.commanded == state
+        current = self.dcc.layout.turnout(tid)
+        # A turnout thrown without a reply yet is not thrown again
+        return current is not None and current.commanded == state and \
+                current.confirmed in (None, state)
+
+    def set_route(self, points, name=None):
+        """Queue the (address, state) points of a route, returns a Route"""
+        route = Route(name, points)
+        with self._cond:
+            for address, state in route.points:
+                entry = self._queue.get(address)
+                if entry is None:
+                    if self._in_state(address, state):
+                        route.skipped += 1
+                        continue
+                    self._queue[address] = [state, [route]]
+                elif entry[0] == state:
+                    entry[1].append(route)
+                else:
+                    error = RouteEngine.Error("Turnout %s was switched by "
+                            "route %s!" % (address, name))
+                    for old in entry[1]:
+                        old._fail(error)
+                    self._queue[address] = [state, [route]]
+                route._waiting += 1
+            if route._waiting == 0:
+                route.future.set_result(0.0)
+            else:
+                self._cond.notify()
+        return route
+
+    def step(self):
+        """Send the next turnouts, returns the number of sent turnouts"""
+        with self._cond:
+            points = []
+            while self._queue and len(points) < self.throws:
+                address, (state, routes) = self._queue.popitem(last=False)
+                routes = [route for route in routes if not route.done]
+                if routes:
+                    points.append((address, state, routes))
+            if not points:
+                return 0
+            for address, state, routes in points:
+                for route in routes:
+                    route.thrown += 1
+        replies = []
+        try:
+            with self.dcc.batch():
+                for address, state, routes in points:
+                    tid = self.ids.get(address)
+                    if tid is None:
+                        self.dcc.turnout(address, state, force=True)
+                        replies.append(None)
+                    else:
+                        replies.append(self.dcc.throw(tid, state,
+                                force=True))
+        except DCCpp.Error as ex:
+            error = RouteEngine.Error("Unable to switch turnouts: %s" % ex)
+            with self._cond:
+                for address, state, routes in points:
+                    for route in routes:
+                        route._fail(error)
+            return 0
+        self._next_write = time.monotonic() + self.interval
+        self.writes += 1
+        for (address, state, routes), reply in zip(points, replies):
+            if reply is None:
+                self._point_done(address, state, routes, None)
+            else:
+                reply.add_done_callback(lambda future, point=(address,
+                        state, routes): self._point_done(*point, future))
+        return len(points)
+
+    def _point_done(self, address, state, routes, future):
+        error = None
+        if future is not None:
+            try:
+                reply = future.result()
+                if reply.state != state:
+                    error = RouteEngine.Error("Turnout %s is in state %d!" % (
+                            address, reply.state))
+            except DCCpp.Error as ex:
+                error = RouteEngine.Error("Turnout %s: %s" % (address, ex))
+        with self._cond:
+            for route in routes:
+                if error is None:
+                    route._point_done(future is not None)
+                else:
+                    route._fail(error)
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                    name="dccpp-routes", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                delay = self._next_write - time.monotonic()
+                if delay > 0:
+                    # Routes queued meanwhile are sent with the next write
+                    self._cond.wait(delay)
+                    continue
+            try:
+                self.step()
+            except Exception as ex:
+                _log.error("Setting routes failed: %s" % ex)
+
+
+    class Error(BaseError):
+        pass
@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import Future
+
+from pyrail.drivers.arduino.command import (PRIORITY_SAFETY, PRIORITY_HIGH,
+        PRIORITY_NORMAL, PRIORITY_LOW)
+
+_log = logging.getLogger(__name__)
+
+
+def chain_future(source, targets):
+    """Copy the outcome of the source future into all target futures"""
+    def _done(future):
+        error = future.exception()
+        for target in targets:
+            if target.done():
+                continue
+            if error is not None:
+                target.set_exception(error)
+            else:
+                target.set_result(future.result())
+    source.add_done_callback(_done)
+
+
+class WriteScheduler(object):
+    """Coalescing write scheduler for throttle commands
+
+    Throttle updates are not written immediately, instead the newest speed of
+    every (register, cab) pair is kept until the next flush. The scheduler
+    flushes at most `rate` times per second, so a burst of updates results in
+    a bounded number of frames on the serial line. The futures of replaced
+    updates are resolved together with the update which was actually sent.
+
+    """
+
+    DEFAULT_RATE = 50
+
+    def __init__(self, send_throttle, rate=None):
+        self.send_throttle = send_throttle
+        self.rate = rate or WriteScheduler.DEFAULT_RATE
+        self.submitted = 0
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate
+
+    @property
+    def coalesced(self):
+        """Number of updates which were replaced by a newer one"""
+        with self._lock:
+            return self.submitted - self.sent - len(self._pending)
+
+    @property
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+            return {"submitted": self.submitted, "sent": self.sent,
+                    "pending": pending,
+                    "coalesced": self.submitted - self.sent - pending}
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                    name="dccpp-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._running = False
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        # Send what is left, so the last speed of each cab is not lost
+        self.flush()
+
+    def throttle(self, register, cab, speed):
+        future = Future()
+        with self._lock:
+            entry = self._pending.get((register, cab))
+            if entry is None:
+                futures = [future]
+            else:
+                futures = entry[1]
+                futures.append(future)
+            self._pending[(register, cab)] = (speed, futures)
+            self.submitted += 1
+        self._wakeup.set()
+        return future
+
+    def cancel(self, register=None, cab=None):
+        """Drop pending updates of the given register and/or cab"""
+        dropped = []
+        with self._lock:
+            for key in list(self._pending):
+                if register not in (None, key[0]) or cab not in (None, key[1]):
+                    continue
+                futures = self._pending.pop(key)[1]
+                # Dropped updates do not count as coalesced
+                self.submitted -= len(futures)
+                dropped.extend(futures)
+        for future in dropped:
+            future.cancel()
+        return len(dropped)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self.sent += len(pending)
+        for (register, cab), (speed, futures) in pending.items():
+            try:
+                chain_future(self.send_throttle(register, cab, speed),
+                        futures)
+            except Exception as ex:
+                _log.error("Sending throttle of cab %s failed: %s" % (cab, ex))
+                for future in futures:
+                    future.set_exception(ex)
+        return len(pending)
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if not self._running:
+                break
+            started = time.monotonic()
+            self.flush()
+            # Give the following updates the chance to be coalesced
+            delay = self.interval - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+
+class CommandQueue(object):
+    """Priority queue of outbound frames, drained by a writer thread
+
+    Frames are written in the order of their priority and in FIFO order
+    within a priority. The writer paces itself to the baudrate of the serial
+    line and keeps at most `backlog` bytes in flight, takes at most `chunk`
+    bytes per write. So a frame, which is queued with the highest priority,
+    is on the line after at most backlog + chunk bytes.
+
+    Frames can be tagged with a cab, so queued throttle frames of a cab are
+    cancelled when the cab is stopped (see cancel). The requests waiting
+    for the replies to a frame are handed to write together with the frame,
+    so they are registered in the order the frames are written.
+
+    """
+
+    DEFAULT_CHUNK = 64
+    DEFAULT_BACKLOG = 32
+
+    def __init__(self, write, baudrate=None, chunk=None, backlog=None):
+        self.write = write
+        # Time to send one byte with a start and stop bit
+        self.byte_time = 10.0 / baudrate if baudrate else 0.0
+        self.chunk = chunk or CommandQueue.DEFAULT_CHUNK
+        self.backlog = backlog or CommandQueue.DEFAULT_BACKLOG
+        self.written = 0
+        self.cancelled = 0
+        self._queues = [deque() for p in range(PRIORITY_LOW + 1)]
+        self._size = 0
+        self._cond = threading.Condition()
+        self._busy_until = 0.0
+        self._writing = False
+        self._running = False
+        self._thread = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def stats(self):
+        with self._cond:
+            return {"queued": [len(q) for q in self._queues],
+                    "written": self.written, "cancelled": self.cancelled}
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                    name="dccpp-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the writer thread after writing the queued frames"""
+        if self._thread is not None:
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+
+    def put(self, data, priority=PRIORITY_NORMAL, cab=None, pending=()):
+        """Queue encoded frames and the requests waiting for their replies"""
+        with self._cond:
+            self._queues[priority].append((data, cab, pending))
+            self._size += 1
+            self._cond.notify_all()
+
+    def cancel(self, cab=None, priority=PRIORITY_SAFETY):
+        """Drop the queued frames of a cab (or of all cabs, if None) with a
+        lower priority than the given one
+
+        Only frames tagged with a cab are dropped. Returns the dropped
+        entries as (data, cab, pending) tuples.
+
+        """
+        dropped = []
+        with self._cond:
+            for queue in self._queues[priority + 1:]:
+                kept = []
+                for entry in queue:
+                    if entry[1] is not None and cab in (None, entry[1]):
+                        dropped.append(entry)
+                    else:
+                        kept.append(entry)
+                if len(kept) != len(queue):
+                    queue.clear()
+                    queue.extend(kept)
+            self._size -= len(dropped)
+            self.cancelled += len(dropped)
+        return dropped
+
+    def join(self, timeout=None):
+        """Wait until all queued frames were written"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._size and
+                    not self._writing, timeout)
+
+    def _take(self):
+        """Return the frames and requests of the next write"""
+        frames = []
+        pending = []
+        size = 0
+        with self._cond:
+            for queue in self._queues:
+                while queue and (not frames or size + len(queue[0][0]) <=
+                        self.chunk):
+                    data, cab, requests = queue.popleft()
+                    frames.append(data)
+                    pending.extend(requests)
+                    size += len(data)
+                if size >= self.chunk:
+                    break
+            self._size -= len(frames)
+            self.written += len(frames)
+            self._writing = bool(frames)
+        return b"".join(frames), pending
+
+    def _pace(self):
+        # Wait until the line has less than backlog bytes in flight, so
+        # frames with a higher priority are able to overtake the others
+        delay = self._busy_until - self.backlog * self.byte_time - \
+                time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._size:
+                    self._cond.wait()
+                if not self._size:
+                    break
+            if self._running:
+                self._pace()
+            data, pending = self._take()
+            if not data:
+                continue
+            try:
+                self.write(data, pending)
+            except Exception as ex:
+                _log.error("Writing %d bytes failed: %s" % (len(data), ex))
+                for key, future, timeout in pending:
+                    if not future.done():
+                        future.set_exception(ex)
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+            self._busy_until = max(self._busy_until, time.monotonic()) + \
+                    len(data) * self.byte_time
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+
+from array import array
+
+_log = logging.getLogger(__name__)
+
+UNKNOWN = 0xff
+
+
+class SensorTable(object):
+    """Current state and event stream of the sensors of a base station
+
+    The states are kept in a bytearray indexed by the sensor id (0: inactive,
+    1: active, 0xff: unknown). Reported changes are appended to a ring
+    buffer of encoded events (id << 1 | state), which is read by the
+    generator of events and the async iterator of aevents. Callbacks are
+    called with (sensor_id, state) right away in the thread of the serial
+    reader, so they have to be quick.
+
+    A change is reported immediately, unless the previous change of the
+    sensor was reported less than its debounce time ago. Changes within the
+    debounce time are held back and reported by settle once the time is
+    over, if the sensor did not return to its reported state.
+
+    """
+
+    RING_SIZE = 1024
+
+    def __init__(self, debounce=0.0, size=64):
+        self.debounce = debounce
+        self.listeners = []
+        self.lost = 0
+        self._states = bytearray([UNKNOWN]) * size
+        self._raw = bytearray([UNKNOWN]) * size
+        self._changed = array("d", [0.0]) * size
+        self._debounce = {}
+        self._held = set()
+        self._ring = array("l", [0]) * SensorTable.RING_SIZE
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._waiters = []
+
+    def __len__(self):
+        return len(self._states) - self._states.count(UNKNOWN)
+
+    def _grow(self, sid):
+        grow = max(sid + 1, 2 * len(self._states)) - len(self._states)
+        self._states.extend([UNKNOWN] * grow)
+        self._raw.extend([UNKNOWN] * grow)
+        self._changed.extend([0.0] * grow)
+
+    def state(self, sid):
+        """Return the state of a sensor, None if it is unknown"""
+        if sid >= len(self._states) or self._states[sid] == UNKNOWN:
+            return None
+        return self._states[sid] == 1
+
+    def states(self):
+        """Return a dict of sensor id -> state of all known sensors"""
+        return dict((sid, state == 1) for sid, state in
+                enumerate(self._states) if state != UNKNOWN)
+
+    def set_debounce(self, sid, seconds):
+        """Set the debounce time of a single sensor, None for the default"""
+        if seconds is None:
+            self._debounce.pop(sid, None)
+        else:
+            self._debounce[sid] = seconds
+
+    def add_listener(self, callback):
+        """Register a callback, which is called with (sensor_id, state)"""
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def clear(self):
+        with self._cond:
+            for idx in range(len(self._states)):
+                self._states[idx] = self._raw[idx] = UNKNOWN
+            self._held.clear()
+
+    def update(self, sid, active, now=None):
+        """Record the state of a sensor reported by the base station"""
+        if sid >= len(self._states):
+            self._grow(sid)
+        state = 1 if active else 0
+        self._raw[sid] = state
+        if self._states[sid] == state:
+            self._held.discard(sid)
+            return
+        now = time.monotonic() if now is None else now
+        debounce = self._debounce.get(sid, self.debounce)
+        if debounce and now - self._changed[sid] < debounce:
+            self._held.add(sid)
+            return
+        self._report(sid, state, now)
+
+    def settle(self, now=None):
+        """Report the held back changes, whose debounce time is over
+
+        Returns the time (see: time.monotonic) the debounce time of the next
+        held back change is over, None if no change is held back.
+
+        """
+        if not self._held:
+            return None
+        now = time.monotonic() if now is None else now
+        due = None
+        for sid in list(self._held):
+            deadline = self._changed[sid] + self._debounce.get(sid,
+                    self.debounce)
+            if now >= deadline:
+                self._held.discard(sid)
+                state = self._raw[sid]
+                if state != self._states[sid]:
+                    self._report(sid, state, now)
+            elif due is None or deadline < due:
+                due = deadline
+        return due
+
+    def _report(self, sid, state, now):
+        self._states[sid] = state
+        self._changed[sid] = now
+        with self._cond:
+            self._ring[self._seq % SensorTable.RING_SIZE] = sid << 1 | state
+            self._seq += 1
+            self._cond.notify_all()
+            if self._waiters:
+                waiters, self._waiters = self._waiters, []
+                for loop, waiter in waiters:
+                    loop.call_soon_threadsafe(_wake, waiter)
+        for callback in self.listeners:
+            try:
+                callback(sid, state == 1)
+            except Exception as ex:
+                _log.exception("Sensor listener failed: %s" % ex)
+
+    def _read(self, seq):
+        """Return the events since seq and the new sequence number"""
+        with self._cond:
+            end = self._seq
+        if end - seq > SensorTable.RING_SIZE:
+            # The consumer did not keep up, the oldest events are lost
+            self.lost += end - seq - SensorTable.RING_SIZE
+            seq = end - SensorTable.RING_SIZE
+        ring = self._ring
+        size = SensorTable.RING_SIZE
+        return [(ring[idx % size] >> 1, bool(ring[idx % size] & 1))
+                for idx in range(seq, end)], end
+
+    def wake(self):
+        """Wake the generators of events, e.g. after setting their stop"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def events(self, timeout=None, stop=None):
+        """Generator of (sensor_id, state) events reported from now on
+
+        The generator ends, if there is no event for timeout seconds or the
+        stop event is set (see also: wake).
+
+        """
+        seq = self._seq
+        while True:
+            with self._cond:
+                if not self._cond.wait_for(lambda: self._seq != seq or
+                        (stop is not None and stop.is_set()), timeout):
+                    return
+            if stop is not None and stop.is_set():
+                return
+            events, seq = self._read(seq)
+            for event in events:
+                yield event
+
+    async def aevents(self):
+        """Async iterator of (sensor_id, state) events reported from now on"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        seq = self._seq
+        while True:
+            with self._cond:
+                waiter = None
+                if self._seq == seq:
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+            if waiter is not None:
+                await waiter
+            events, seq = self._read(seq)
+            for event in events:
+                yield event
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import re
+import threading
+
+from collections import deque
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+
+_log = logging.getLogger(__name__)
+
+# Port of the DCC++ Base Station with an ethernet shield
+DEFAULT_PORT = 2560
+
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    """Parse '[HOST:]PORT', ':PORT' or 'HOST' into a (host, port) tuple
+
+    A missing host is None, so the server listens on all interfaces.
+
+    """
+    if not address:
+        return None, default_port
+    host, sep, port = address.rpartition(":")
+    if not sep:
+        if port.isdigit():
+            return None, int(port)
+        return port, default_port
+    return host or None, int(port) if port else default_port
+
+
+class FrameReader(object):
+    """Split the data sent by a client into DCC++ frames
+
+    Clients either send raw DCC++ frames, e.g. '<t 1 3 20 1>', or one
+    command per line without the brackets, e.g. 't 1 3 20 1'. Everything
+    outside of a frame which is not terminated by a newline is ignored.
+
+    """
+
+    FRAME = re.compile(rb"<([^<>]*)>|([^<>\r\n]*)\r?\n")
+    MAX_FRAME_SIZE = 256
+
+    def __init__(self):
+        self._buf = b""
+        self.lines = False
+
+    def feed(self, data):
+        """Return the complete frames of the data, including the brackets"""
+        buf = self._buf + data
+        frames = []
+        end = 0
+        for match in self.FRAME.finditer(buf):
+            end = match.end()
+            if match.group(1) is not None:
+                frames.append(match.group(0))
+            else:
+                line = match.group(2).strip()
+                if line:
+                    self.lines = True
+                    frames.append(b"<" + line + b">")
+        buf = buf[end:]
+        if len(buf) > self.MAX_FRAME_SIZE:
+            buf = b""
+        self._buf = buf
+        return frames
+
+
+class Client(object):
+    """Connection of a client with its queue of frames to send"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+        self.frames = FrameReader()
+        self.queue = deque()
+        # Set while the queue has room for more frames
+        self.space = asyncio.Event()
+        self.space.set()
+        self.received = 0
+        self.dropped = 0
+
+    def __repr__(self):
+        return "<Client(%s)>" % (self.peer,)
+
+
+class StationServer(object):
+    """Share one DCC++ Base Station with many TCP clients
+
+    The frames of the clients are forwarded to the base station in batches.
+    Every batch takes one frame of each client in turn, so a client flooding
+    the server only delays its own frames. A client is not read anymore,
+    while max_queue of its frames wait to be sent.
+
+    Every reply of the base station, e.g. throttle replies or sensor events,
+    is sent to all clients. Replies for a client, which does not keep up
+    reading, are dropped once max_buffer bytes wait to be sent to it.
+
+    """
+
+    MAX_QUEUE = 32
+    MAX_BATCH = 1024
+    MAX_BUFFER = 64 * 1024
+    READ_SIZE = 4096
+
+    def __init__(self, dcc, host=None, port=DEFAULT_PORT, max_queue=None,
+            max_batch=None, max_buffer=None):
+        self.dcc = dcc
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue or StationServer.MAX_QUEUE
+        self.max_batch = max_batch or StationServer.MAX_BATCH
+        self.max_buffer = max_buffer or StationServer.MAX_BUFFER
+        self.clients = set()
+        self._handlers = set()
+        self.stats = {"clients": 0, "frames": 0, "writes": 0, "replies": 0,
+                "dropped": 0}
+        self._server = None
+        self._loop = None
+        self._active = deque()
+        self._ready = None
+        self._write_task = None
+        self._replies = []
+        self._replies_lock = threading.Lock()
+
+    @property
+    def addresses(self):
+        """Return the socket addresses the server is listening on"""
+        if self._server is None:
+            return []
+        return [sock.getsockname() for sock in self._server.sockets]
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle_client,
+                self.host, self.port, limit=StationServer.READ_SIZE)
+        self._write_task = asyncio.ensure_future(self._write_loop())
+        self.dcc.add_listener(self._reply_received)
+        _log.info("Listening on %s ..." % ", ".join("%s:%s" % addr[:2]
+                for addr in self.addresses))
+
+    async def close(self):
+        if self._server is None:
+            return
+        self.dcc.remove_listener(self._reply_received)
+        self._server.close()
+        self._write_task.cancel()
+        try:
+            await self._write_task
+        except asyncio.CancelledError:
+            pass
+        # Let the handlers finish, as they end once their client is closed
+        for client in list(self.clients):
+            client.writer.close()
+            client.space.set()
+        if self._handlers:
+            await asyncio.wait(self._handlers)
+        await self._server.wait_closed()
+        self._server = self._write_task = None
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def _handle_client(self, reader, writer):
+        client = Client(reader, writer)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        self.clients.add(client)
+        self.stats["clients"] += 1
+        _log.debug("%s connected." % client)
+        try:
+            while True:
+                data = await reader.read(StationServer.READ_SIZE)
+                if not data:
+                    break
+                self._enqueue(client, client.frames.feed(data))
+                if len(client.queue) >= self.max_queue:
+                    client.space.clear()
+                    await client.space.wait()
+                    if client.writer.is_closing():
+                        break
+        except ConnectionError as ex:
+            _log.debug("%s failed: %s" % (client, ex))
+        finally:
+            self.clients.discard(client)
+            self._handlers.discard(handler)
+            client.queue.clear()
+            writer.close()
+            _log.debug("%s disconnected." % client)
+
+    def _enqueue(self, client, frames):
+        if not frames:
+            return
+        if not client.queue:
+            self._active.append(client)
+        client.queue.extend(frames)
+        client.received += len(frames)
+        self._ready.set()
+
+    def _next_batch(self):
+        """Take the frames of the next write, one of each client in turn"""
+        active = self._active
+        frames = []
+        size = 0
+        while active and size < self.max_batch:
+            client = active.popleft()
+            if not client.queue:
+                # The client disconnected
+                continue
+            frame = client.queue.popleft()
+            frames.append(frame)
+            size += len(frame)
+            if client.queue:
+                active.append(client)
+            if len(client.queue) < self.max_queue:
+                client.space.set()
+        if not active:
+            self._ready.clear()
+        return frames
+
+    async def _write_loop(self):
+        while True:
+            await self._ready.wait()
+            frames = self._next_batch()
+            if not frames:
+                continue
+            self.stats["frames"] += len(frames)
+            self.stats["writes"] += 1
+            try:
+                # Writing to the serial port blocks, keep the loop running
+                await self._loop.run_in_executor(None, self.dcc.send_raw,
+                        b"".join(frames))
+            except DCCpp.Error as ex:
+                _log.error("Forwarding %d frames failed: %s" % (len(frames),
+                        ex))
+
+    def _reply_received(self, reply):
+        # Called by the reader thread of the station, the replies are
+        # collected until the loop sends them with one write per client
+        frame = b"<%s>" % reply.frame.encode("ascii")
+        with self._replies_lock:
+            self._replies.append(frame)
+            if len(self._replies) > 1:
+                return
+        self._loop.call_soon_threadsafe(self._broadcast)
+
+    def _broadcast(self):
+        with self._replies_lock:
+            replies, self._replies = self._replies, []
+        self.stats["replies"] += len(replies)
+        data = b"".join(replies)
+        lines = None
+        for client in self.clients:
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.max_buffer:
+                client.dropped += len(replies)
+                self.stats["dropped"] += len(replies)
+                continue
+            if client.frames.lines:
+                if lines is None:
+                    lines = b"".join(frame + b"\n" for frame in replies)
+                client.writer.write(lines)
+            else:
+                client.writer.write(data)
@@ -0,0 +1,387 @@
+import logging
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+from collections import deque
+
+_log = logging.getLogger(__name__)
+
+
+class DCCppSimulator(object):
+    """Simulation of an Arduino DCC++ Base Station on a pseudo-terminal
+
+    The simulator opens a Linux pseudo-terminal, the path of its slave side
+    (see `port`) can be used like a real serial port, e.g. by DCCpp. Besides
+    the BaseStation protocol the simulator models the limits of the real
+    hardware:
+
+     * baudrate: Bytes are transferred with the given baudrate in both
+       directions (10 bits per byte). None means unlimited bandwidth.
+     * rx_buffer: Size of the Arduino's serial RX buffer. Bytes which arrive
+       while the buffer is full are dropped and counted as overflows.
+     * process_time: Time the Arduino needs to process one command, while
+       processing the RX buffer is not read.
+     * reply_delay: Additional delay until the reply of a command is sent.
+
+    See also: https://github.com/DccPlusPlus/BaseStation/wiki
+
+    """
+
+    VERSION = "DCC++ BASE STATION FOR ARDUINO SIMULATOR / PTY: V-1.2.1+"
+    DEFAULT_BAUDRATE = 115200
+    RX_BUFFER_SIZE = 64
+    MAX_MAIN_REGISTERS = 12
+    DEFAULT_CVS = {1: 3, 7: 10, 8: 13, 29: 6}
+
+    def __init__(self, baudrate=DEFAULT_BAUDRATE, rx_buffer=None,
+            process_time=0.0, reply_delay=0.0, max_registers=None):
+        self.baudrate = baudrate
+        self.rx_buffer = rx_buffer or DCCppSimulator.RX_BUFFER_SIZE
+        self.process_time = process_time
+        self.reply_delay = reply_delay
+        self.max_registers = max_registers or DCCppSimulator.MAX_MAIN_REGISTERS
+        # Layout state
+        self.power = 0
+        self.current = 0
+        self.registers = {}
+        self.functions = {}
+        self.accessories = {}
+        self.turnouts = {}
+        self.sensors = {}
+        self.outputs = {}
+        self.cvs = dict(DCCppSimulator.DEFAULT_CVS)
+        self.ops_cvs = {}
+        # Statistics
+        self.rx_bytes = 0
+        self.tx_bytes = 0
+        self.commands = 0
+        self.overflows = 0
+        self._master = None
+        self._slave = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._wire = deque()
+        self._rx = deque()
+        self._frame = bytearray()
+        self._tx = deque()
+        self._rx_free_at = 0.0
+        self._tx_free_at = 0.0
+        self._busy_until = 0.0
+
+    @property
+    def port(self):
+        if self._slave is None:
+            return None
+        return os.ttyname(self._slave)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    @property
+    def byte_time(self):
+        if self.baudrate is None:
+            return 0.0
+        return 10.0 / self.baudrate
+
+    @property
+    def stats(self):
+        return {"rx_bytes": self.rx_bytes, "tx_bytes": self.tx_bytes,
+                "commands": self.commands, "overflows": self.overflows}
+
+    def start(self):
+        if not self.running:
+            self._master, self._slave = pty.openpty()
+            tty.setraw(self._master)
+            tty.setraw(self._slave)
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                    name="dccpp-simulator", daemon=True)
+            self._thread.start()
+            _log.debug("Simulating DCC++ Base Station on '%s'" % self.port)
+        return self.port
+
+    def stop(self):
+        if self.running:
+            self._running = False
+            self._thread.join()
+            self._thread = None
+            os.close(self._master)
+            os.close(self._slave)
+            self._master = self._slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def set_sensor(self, sensor_id, active):
+        """Change the state of a sensor and report it to the host"""
+        with self._lock:
+            sensor = self.sensors.setdefault(sensor_id, [0, 0, 0])
+            if sensor[2] != int(bool(active)):
+                sensor[2] = int(bool(active))
+                self._reply(time.monotonic(),
+                        ["<%s%d>" % ("Q" if active else "q", sensor_id)])
+
+    def set_power(self, state):
+        """Change the power state, e.g. 2 to simulate an overload"""
+        with self._lock:
+            self.power = state
+            self._reply(time.monotonic(), ["<p%d>" % state])
+
+    def _run(self):
+        while self._running:
+            timeout = self._next_event(time.monotonic())
+            readable, _, _ = select.select([self._master], [], [], timeout)
+            now = time.monotonic()
+            with self._lock:
+                if readable:
+                    try:
+                        data = os.read(self._master, 4096)
+                    except OSError:
+                        data = b""
+                    self._receive(now, data)
+                self._advance(now)
+                self._transmit(now)
+
+    def _next_event(self, now):
+        events = [now + 0.05]
+        if self._wire:
+            events.append(self._wire[0][0])
+        if self._rx:
+            events.append(self._busy_until)
+        if self._tx:
+            events.append(max(self._tx[0][0], self._tx_free_at))
+        return max(min(events) - now, 0)
+
+    def _receive(self, now, data):
+        # Bytes arrive one after the other with the speed of the serial line
+        arrival = max(now, self._rx_free_at)
+        for byte in data:
+            arrival += self.byte_time
+            self._wire.append((arrival, byte))
+        self._rx_free_at = arrival
+        self.rx_bytes += len(data)
+
+    def _advance(self, now):
+        wire, rx = self._wire, self._rx
+        while wire and wire[0][0] <= now:
+            arrival, byte = wire.popleft()
+            self._consume(arrival)
+            if len(rx) >= self.rx_buffer:
+                self.overflows += 1
+            else:
+                rx.append(byte)
+        self._consume(now)
+
+    def _consume(self, now):
+        # The Arduino reads the RX buffer whenever it is idle
+        rx, frame = self._rx, self._frame
+        while rx and self._busy_until <= now:
+            byte = rx.popleft()
+            if byte == 0x3c:
+                # '<' starts a new frame
+                del frame[:]
+                frame.append(byte)
+            elif frame:
+                frame.append(byte)
+                if byte == 0x3e:
+                    start = max(self._busy_until, now)
+                    self._busy_until = start + self.process_time
+                    replies = self.process(frame[1:-1].decode("ascii",
+                            "ignore"))
+                    del frame[:]
+                    self._reply(self._busy_until + self.reply_delay, replies)
+
+    def _reply(self, when, replies):
+        for reply in replies:
+            self._tx.append((when, reply.encode("ascii")))
+
+    def _transmit(self, now):
+        tx = self._tx
+        # Replies are sent one after the other, as soon as the line is free
+        while tx and tx[0][0] <= now and self._tx_free_at <= now:
+            data = tx.popleft()[1]
+            self._tx_free_at = now + len(data) * self.byte_time
+            try:
+                os.write(self._master, data)
+            except OSError as ex:
+                _log.warn("Unable to send reply: %s" % ex)
+            self.tx_bytes += len(data)
+
+    def process(self, command):
+        """Execute a command and return the list of reply frames"""
+        self.commands += 1
+        if not command:
+            return []
+        name, args = command[0], command[1:].split()
+        try:
+            args = list(map(int, args))
+        except ValueError:
+            return []
+        handler = getattr(self, "cmd_%s" % self._HANDLERS.get(name, "none"))
+        try:
+            return handler(args)
+        except (ValueError, IndexError, KeyError):
+            return []
+
+    _HANDLERS = {
+        "s": "status", "1": "power_on", "0": "power_off", "t": "throttle",
+        "f": "function", "a": "accessory", "T": "turnout", "S": "sensor",
+        "Q": "sensors", "Z": "output", "W": "write_cv", "B": "write_bit",
+        "R": "read_cv", "w": "write_ops", "b": "write_ops_bit",
+        "c": "current", "E": "store", "e": "erase",
+    }
+
+    def cmd_none(self, args):
+        return []
+
+    def cmd_status(self, args):
+        replies = ["<p%d>" % self.power]
+        for register in sorted(self.registers):
+            cab, speed, direction = self.registers[register]
+            replies.append("<T%d %d %d>" % (register, speed, direction))
+        replies.append("<i%s>" % DCCppSimulator.VERSION)
+        replies.append("<N0: SERIAL>")
+        for tid, (addr, subaddr, thrown) in sorted(self.turnouts.items()):
+            replies.append("<H%d %d>" % (tid, thrown))
+        for oid, (pin, iflag, state) in sorted(self.outputs.items()):
+            replies.append("<Y%d %d>" % (oid, state))
+        return replies
+
+    def cmd_power_on(self, args):
+        self.power = 1
+        return ["<p1>"]
+
+    def cmd_power_off(self, args):
+        self.power = 0
+        return ["<p0>"]
+
+    def cmd_throttle(self, args):
+        register, cab, speed, direction = args
+        if register < 1 or register > self.max_registers:
+            return []
+        self.registers[register] = (cab, speed, direction)
+        return ["<T%d %d %d>" % (register, speed, direction)]
+
+    def cmd_function(self, args):
+        cab, groups = args[0], args[1:]
+        if len(groups) == 1:
+            # The upper bits identify the function group
+            group = groups[0] & (0xf0 if groups[0] >= 160 else 0xe0)
+            self.functions.setdefault(cab, {})[group] = groups[0]
+        else:
+            self.functions.setdefault(cab, {})[groups[0]] = groups[1]
+        return []
+
+    def cmd_accessory(self, args):
+        addr, subaddr, activate = args
+        self.accessories[(addr, subaddr)] = activate
+        return []
+
+    def cmd_turnout(self, args):
+        if len(args) == 3:
+            tid, addr, subaddr = args
+            thrown = self.turnouts.get(tid, (0, 0, 0))[2]
+            self.turnouts[tid] = (addr, subaddr, thrown)
+            return ["<O>"]
+        elif len(args) == 2:
+            tid, thrown = args
+            if tid not in self.turnouts:
+                return ["<X>"]
+            addr, subaddr = self.turnouts[tid][:2]
+            self.turnouts[tid] = (addr, subaddr, thrown)
+            self.accessories[(addr, subaddr)] = thrown
+            return ["<H%d %d>" % (tid, thrown)]
+        elif len(args) == 1:
+            return ["<O>" if self.turnouts.pop(args[0], None) else "<X>"]
+        if not self.turnouts:
+            return ["<X>"]
+        return ["<H%d %d %d %d>" % (tid, addr, subaddr, thrown)
+                for tid, (addr, subaddr, thrown)
+                in sorted(self.turnouts.items())]
+
+    def cmd_sensor(self, args):
+        if len(args) == 3:
+            sid, pin, pullup = args
+            state = self.sensors.get(sid, [0, 0, 0])[2]
+            self.sensors[sid] = [pin, pullup, state]
+            return ["<O>"]
+        elif len(args) == 1:
+            return ["<O>" if self.sensors.pop(args[0], None) else "<X>"]
+        if not self.sensors:
+            return ["<X>"]
+        return ["<Q%d %d %d>" % (sid, pin, pullup)
+                for sid, (pin, pullup, state) in sorted(self.sensors.items())]
+
+    def cmd_sensors(self, args):
+        return ["<%s%d>" % ("Q" if state else "q", sid)
+                for sid, (pin, pullup, state) in sorted(self.sensors.items())]
+
+    def cmd_output(self, args):
+        if len(args) == 3:
+            oid, pin, iflag = args
+            self.outputs[oid] = (pin, iflag, 0)
+            return ["<O>"]
+        elif len(args) == 2:
+            oid, state = args
+            if oid not in self.outputs:
+                return ["<X>"]
+            pin, iflag = self.outputs[oid][:2]
+            self.outputs[oid] = (pin, iflag, state)
+            return ["<Y%d %d>" % (oid, state)]
+        elif len(args) == 1:
+            return ["<O>" if self.outputs.pop(args[0], None) else "<X>"]
+        return ["<Y%d %d %d>" % (oid, pin, iflag)
+                for oid, (pin, iflag, state) in sorted(self.outputs.items())]
+
+    def cmd_write_cv(self, args):
+        cv, value, callnum, callsub = args
+        self.cvs[cv] = value
+        return ["<r%d|%d|%d %d>" % (callnum, callsub, cv, value)]
+
+    def cmd_write_bit(self, args):
+        cv, bit, value, callnum, callsub = args
+        mask = 1 << bit
+        old = self.cvs.get(cv, 0)
+        self.cvs[cv] = (old | mask) if value else (old & ~mask)
+        return ["<r%d|%d|%d %d %d>" % (callnum, callsub, cv, bit, value)]
+
+    def cmd_read_cv(self, args):
+        cv, callnum, callsub = args
+        value = self.cvs.get(cv, -1)
+        return ["<r%d|%d|%d %d>" % (callnum, callsub, cv, value)]
+
+    def cmd_write_ops(self, args):
+        cab, cv, value = args
+        self.ops_cvs[(cab, cv)] = value
+        return []
+
+    def cmd_write_ops_bit(self, args):
+        cab, cv, bit, value = args
+        mask = 1 << bit
+        old = self.ops_cvs.get((cab, cv), 0)
+        self.ops_cvs[(cab, cv)] = (old | mask) if value else (old & ~mask)
+        return []
+
+    def cmd_current(self, args):
+        return ["<a %d>" % self.current]
+
+    def cmd_store(self, args):
+        return ["<e %d %d %d>" % (len(self.turnouts), len(self.sensors),
+                len(self.outputs))]
+
+    def cmd_erase(self, args):
+        self.turnouts.clear()
+        self.sensors.clear()
+        self.outputs.clear()
+        return ["<O>"]
+
@@ -1,32 +1,154 @@
+import logging
+import os
+import signal
+import threading
+
+from argparse import ArgumentTypeError
+
 from pyrail.utils.cli.clish import CliSh
 from pyrail.utils.cli.shcmd import ShCmd
 from pyrail.drivers.arduino.dccpp import DCCpp
 
+_log = logging.getLogger(__name__)
+
 
 class DCCppCli(CliSh):
     """DCC++ Command Line Interface"""
 
+    POWER_STATES = {0: "off", 1: "on", 2: "overload!"}
+
     def __init__(self):
         super(DCCppCli, self).__init__("dccpp")
         self.register_command(ThrottleCmd, "throttle", "t")
         self.register_command(PointCmd, "point", "p")
         self.register_command(LightCmd, "light")
+        self.register_command(CvCmd, "cv")
+        self.register_command(SensorCmd, "sensor", "s")
+        self.register_command(RouteCmd, "route", "r")
         self.prompt = "dccpp>>> "
         self.dcc = None
+        self.ramp = None
+        self.routes = None
+        # Events printed by the shell: off, on (sensors, power) or all replies
+        self.events = "off"
 
     def define_argparser(self):
         parser = super(DCCppCli, self).define_argparser()
         # Define additional arguments for the DCCpp CLI
         parser.add_argument("-p", "--port", metavar="DEV",
                 help="Serial port (default: %s)" % self.cfg.port)
+        parser.add_argument("-m", "--metrics", action="store_true",
+                default=None, help="Record metrics from the start, "
+                "see also: stats")
+        parser.add_argument("--write-queue", action="store_true",
+                default=None, help="Send the commands by priority from a "
+                "writer thread, so stop and off overtake queued commands")
+        parser.add_argument("--serve", metavar="[HOST:]PORT", nargs="?",
+                const="", help="Share the station with DCC++ clients over "
+                "TCP, e.g. JMRI (default: all interfaces, port 2560)")
+        parser.add_argument("--record", metavar="FILE", help="Record the "
+                "traffic with the station to FILE, see also: dccpp-log")
+        parser.add_argument("--throws", metavar="N", type=int,
+                help="Switch at most N turnouts at once, see also: route "
+                "(default: %d)" % self.cfg.throws)
+        parser.add_argument("--throw-interval", metavar="MS", type=int,
+                help="Wait MS milliseconds before switching the next "
+                "turnouts (default: %d)" % self.cfg.throw_interval)
         return parser
 
+    def daemon_key(self):
+        # A daemon only runs the direct calls for its own station
+        return (self.cfg.port.strip("/").replace("/", "_"),)
+
     def create(self, args):
-        self.dcc = DCCpp(self.cfg.port)
+        port, baudrate = self.cfg.port, self.cfg.baudrate
+        # The port is either a device or the name of a station of the layout
+        if self.cfg.layout is not None and self.cfg.layout.station(port):
+            port, baudrate = self.cfg.layout.station(port)
+        self.dcc = DCCpp(port, baudrate, write_queue=self.cfg.write_queue)
+        if self.cfg.metrics:
+            self.enable_metrics()
+        if self.cfg.record is not None:
+            try:
+                self.dcc.start_recording(self.cfg.record)
+            except OSError as ex:
+                raise DCCppCli.Error("Unable to record to %s: %s" % (
+                        self.cfg.record, ex))
         self.dcc.connect()
 
+    def run(self, args):
+        if self.cfg.server is not None:
+            return self.serve_network(self.cfg.server)
+        if self.cfg.use_asyncio:
+            # The asynchronous shell prints the events above its prompt
+            self.set_events("on")
+        return super(DCCppCli, self).run(args)
+
+    def serve_network(self, address):
+        # The server is only imported when needed, as asyncio is expensive
+        import asyncio
+        from pyrail.drivers.arduino.server import StationServer, parse_address
+        try:
+            host, port = parse_address(address)
+        except ValueError:
+            raise DCCppCli.Error("Invalid address: %s" % address)
+        server = StationServer(self.dcc, host, port)
+
+        async def serve():
+            # Stop serving on SIGTERM, so the clients are closed properly
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                    asyncio.current_task().cancel)
+            await server.serve_forever()
+        try:
+            asyncio.run(serve())
+        except asyncio.CancelledError:
+            _log.info("Terminated.")
+        except OSError as ex:
+            raise DCCppCli.Error("Unable to serve on %s:%s: %s" % (
+                    host or "*", port, ex))
+        return True
+
+    def enable_metrics(self):
+        # The shell and the driver record into the same metrics
+        self.metrics = self.dcc.enable_metrics(self.metrics)
+
+    def disable_metrics(self):
+        self.metrics = None
+        self.dcc.disable_metrics()
+
+    def start_ramp(self):
+        """Return the ramp engine of the cabs, start it on first use"""
+        if self.ramp is None:
+            from pyrail.drivers.arduino.ramp import RampEngine
+            self.ramp = RampEngine(self.dcc)
+            self.ramp.start()
+        return self.ramp
+
+    def start_routes(self):
+        """Return the route engine, start it on first use"""
+        if self.routes is None:
+            from pyrail.drivers.arduino.routes import RouteEngine
+            layout = self.cfg.layout
+            self.routes = RouteEngine(self.dcc, self.cfg.throws,
+                    self.cfg.throw_interval / 1000.0,
+                    layout.turnout_ids() if layout is not None else None)
+            self.routes.start()
+        return self.routes
+
     def cleanup(self):
+        if self.ramp is not None:
+            self.ramp.stop()
+        if self.routes is not None:
+            self.routes.stop()
         self.dcc.disconnect()
+        self.dcc.stop_recording()
+
+    def script_context(self):
+        # Send the commands of a script step with a single write
+        return self.dcc.batch()
+
+    def script_wait(self, timeout=None):
+        return self.dcc.wait_replies(timeout)
 
     def do_info(self, line):
         """Print information about the current connected DCC++."""
@@ -34,9 +156,169 @@ class DCCppCli(CliSh):
         if self.dcc.connected:
             infos += "Interface:  %s (%s)\n" % (self.dcc.port,
                     self.dcc.baudrate)
-            self.dcc.status()
+            try:
+                reply = self.dcc.status().result()
+                infos += "Station:    %s\n" % reply.info
+            except DCCpp.Error as ex:
+                infos += "Station:    %s\n" % ex
         self.stdout.write("%s" % infos)
 
+    def set_events(self, events):
+        if self._sensor_changed in self.dcc.sensors.listeners:
+            self.dcc.sensors.remove_listener(self._sensor_changed)
+        if self._reply_received in self.dcc.listeners:
+            self.dcc.remove_listener(self._reply_received)
+        if events == "on":
+            self.dcc.sensors.add_listener(self._sensor_changed)
+        if events != "off":
+            self.dcc.add_listener(self._reply_received)
+        self.events = events
+
+    def _sensor_changed(self, sid, state):
+        self.notify("Sensor %d %s" % (sid, "active" if state else "inactive"))
+
+    def _reply_received(self, reply):
+        if self.events == "all":
+            self.notify("<%s>" % reply.frame)
+        elif reply.code == "p":
+            self.notify("Power: %s" % DCCppCli.POWER_STATES.get(reply.state,
+                    reply.state))
+
+    def do_events(self, line):
+        """usage: events [on|off|all]
+
+        Print events of the station, e.g. sensor changes
+
+        'on' prints the changes of the sensors and of the power, 'all' every
+        reply of the station. Without an argument the setting is printed.
+        The events are on by default in the asynchronous shell (--async).
+        """
+        line = line.strip()
+        if not line:
+            self.stdout.write("%s\n" % self.events)
+            return True
+        if line not in ("on", "off", "all"):
+            _log.error("Invalid events: %s" % line)
+            return False
+        self.set_events(line)
+        return True
+
+    def do_stats(self, line):
+        """usage: stats [on|off|reset|json]
+
+        Print the recorded metrics or control the recording
+
+        Without an argument the metrics are printed as table, 'json' prints
+        a JSON snapshot. Recording is switched off by default, as it costs
+        some time on every command and reply.
+        """
+        line = line.strip()
+        if line == "on":
+            self.enable_metrics()
+        elif line == "off":
+            self.disable_metrics()
+        elif line == "reset":
+            if self.metrics is not None:
+                self.metrics.reset()
+        elif line in ("", "json"):
+            if self.metrics is None:
+                self.stdout.write("Metrics are switched off, see: stats on\n")
+            elif line == "json":
+                self.stdout.write("%s\n" % self.metrics.to_json(indent=2))
+            else:
+                self.print_stats(self.metrics.snapshot())
+        else:
+            self.stdout.write("Unknown argument: %s\n" % line)
+            return False
+        return True
+
+    def print_stats(self, snapshot):
+        out = "Uptime:     %.1fs\n" % snapshot["uptime"]
+        for name, value in sorted(snapshot["counters"].items()):
+            out += "%-32s %10d\n" % (name, value)
+        for name, value in sorted(snapshot["gauges"].items()):
+            out += "%-32s %10s\n" % (name, value)
+        if snapshot["histograms"]:
+            out += "%-32s %7s %9s %9s %9s %9s\n" % ("latency", "count",
+                    "mean[ms]", "p50[ms]", "p99[ms]", "max[ms]")
+        for name, hist in sorted(snapshot["histograms"].items()):
+            out += "%-32s %7d %9.3f %9.3f %9.3f %9.3f\n" % (name,
+                    hist["count"], hist["mean_ms"], hist["p50_ms"],
+                    hist["p99_ms"], hist["max_ms"])
+        self.stdout.write(out)
+
+    def _resolve(self, kind, value):
+        layout = self.cfg.layout
+        try:
+            if layout is None:
+                return int(value)
+            return getattr(layout, kind)(value)
+        except ValueError:
+            # Names are only known with a layout (-c FILE)
+            raise ArgumentTypeError("Unknown %s: %s" % (kind, value))
+
+    def cab_address(self, value):
+        """Return the address of a cab given by name or address"""
+        return self._resolve("cab", value)
+
+    def turnout_address(self, value):
+        return self._resolve("turnout", value)
+
+    def sensor_id(self, value):
+        return self._resolve("sensor", value)
+
+    def do_layout(self, line):
+        """usage: layout [KIND]
+
+        Print the named objects of the layout, see also: -c FILE
+        """
+        layout = self.cfg.layout
+        if layout is None:
+            _log.error("No layout, it is loaded with: -c FILE")
+            return False
+        kinds = line.split() or layout.KINDS
+        out = ""
+        for kind in kinds:
+            if kind not in layout.KINDS:
+                _log.error("Invalid kind: %s" % kind)
+                return False
+            for name, entry in sorted(layout.tables[kind][0].items()):
+                out += "%-8s %-20s %s\n" % (kind, name, entry)
+        self.stdout.write(out)
+        return True
+
+    def do_stop(self, line):
+        """usage: stop [CAB]
+
+        Emergency stop a cab, or all cabs if no CAB is given
+        """
+        try:
+            cab = self.cab_address(line.strip()) if line.strip() else None
+            if self.ramp is not None:
+                # Stop the ramps as well, so they do not start the cabs again
+                self.ramp.emergency_stop(cab)
+            elif cab is None:
+                self.dcc.all_stop()
+            else:
+                self.dcc.emergency_stop(cab)
+        except ArgumentTypeError as ex:
+            _log.error(ex)
+            return False
+        except DCCpp.Error as ex:
+            _log.error(ex)
+            return False
+        return True
+
+    def do_registers(self, line):
+        """Print the cab and speed of the registers in use"""
+        out = ""
+        for register, cab in sorted(self.dcc.registers.mapping.items()):
+            state = self.dcc.layout.cab(cab)
+            out += "%2d: cab %s, speed %s\n" % (register, cab,
+                    state.speed.commanded if state is not None else None)
+        self.stdout.write(out)
+        return True
+
     def do_on(self, line):
         """Turn on the main power for all tracks"""
         self.dcc.power_on()
@@ -51,51 +333,114 @@ class DCCppCli(CliSh):
         def __init__(self):
             super(DCCppCli.Config, self).__init__()
             self.port = "auto"
+            self.metrics = False
+            self.write_queue = False
+            # [HOST:]PORT of the TCP server, None to run the shell
+            self.server = None
+            # Log file of the traffic, None to record nothing
+            self.record = None
+            self.baudrate = None
+            # Names of the objects of the layout, see: LayoutConfig
+            self.layout = None
+            # Turnouts switched at once and the pause between them (ms)
+            self.throws = 4
+            self.throw_interval = 100
+
+        def load_from_file(self, cfg_file):
+            super(DCCppCli.Config, self).load_from_file(cfg_file)
+            if cfg_file is None:
+                return
+            # Only imported with a layout, the cached layout loads quickly
+            from pyrail.drivers.arduino.layoutconfig import LayoutConfig
+            try:
+                if os.path.isfile(cfg_file.name):
+                    cfg_file.close()
+                    self.layout = LayoutConfig.load(cfg_file.name)
+                else:
+                    self.layout = LayoutConfig.parse(cfg_file.read(),
+                            cfg_file.name)
+            finally:
+                cfg_file.close()
+            station = self.layout.default_station
+            if station is not None:
+                self.port, self.baudrate = station
 
         def merge_args(self, args):
             super(DCCppCli.Config, self).merge_args(args)
             if args.port is not None:
                 self.port = args.port
+            if args.metrics is not None:
+                self.metrics = args.metrics
+            if args.write_queue is not None:
+                self.write_queue = args.write_queue
+            if args.serve is not None:
+                self.server = args.serve
+            if args.record is not None:
+                self.record = args.record
+            if args.throws is not None:
+                self.throws = args.throws
+            if args.throw_interval is not None:
+                self.throw_interval = args.throw_interval
 
 
 class ThrottleCmd(ShCmd):
     """Control the speed of a CAB"""
 
+    batchable = True
+
     def define_argparser(self):
         parser = super(ThrottleCmd, self).define_argparser()
-        parser.add_argument("cab", metavar="CAB", type=int,
+        parser.add_argument("cab", metavar="CAB",
+               type=self.shell.cab_address,
                help="Address of the engine decoder")
         parser.add_argument("speed", metavar="SPEED", type=int,
                help="Throttle speed from -126 to 126")
+        parser.add_argument("-r", "--rate", metavar="STEPS", type=float,
+               help="Accelerate or brake smoothly by STEPS per second")
         return parser
 
     def run(self, session, line, args):
-        self.shell.dcc.throttle(1, args.cab, args.speed)
+        if args.rate is not None:
+            self.shell.start_ramp().ramp(None, args.cab, args.speed,
+                    args.rate)
+        else:
+            if self.shell.ramp is not None:
+                self.shell.ramp.hold(args.cab)
+            try:
+                self.shell.dcc.set_speed(args.cab, args.speed)
+            except DCCpp.Error as ex:
+                raise ShCmd.Error(ex.message)
         return True
 
 
 class LightCmd(ShCmd):
     """Control the lights of a CAB"""
 
+    batchable = True
+
     def define_argparser(self):
         parser = super(LightCmd, self).define_argparser()
-        parser.add_argument("cab", metavar="CAB", type=int,
+        parser.add_argument("cab", metavar="CAB",
+               type=self.shell.cab_address,
                help="Address of the engine decoder")
         parser.add_argument("light", metavar="STATE", type=int,
                help="Light: 0: off, 1: on")
         return parser
 
     def run(self, session, line, args):
-        fn = 128 if args.light == 0 else 144
-        self.shell.dcc.function(args.cab, fn)
+        # The headlight is F0, the other functions keep their state
+        self.shell.dcc.set_function(args.cab, 0, args.light)
         return True
 
 class PointCmd(ShCmd):
     """Control a point"""
 
+    batchable = True
+
     def define_argparser(self):
         parser = super(PointCmd, self).define_argparser()
-        parser.add_argument("point", metavar="POINT", type=int,
+        parser.add_argument("point", metavar="POINT",
+               type=self.shell.turnout_address,
                help="Address of the point")
         parser.add_argument("state", metavar="STATE", type=int,
                help="Point: 0: unthrown, 1: thrown")
@@ -106,6 +451,236 @@ class PointCmd(ShCmd):
         return True
 
 
+class SensorCmd(ShCmd):
+    """Define sensors and show their state
+
+    watch prints the changes of the sensors until it is aborted or no change
+    happens for TIMEOUT seconds.
+    """
+
+    def define_argparser(self):
+        parser = super(SensorCmd, self).define_argparser()
+        actions = parser.add_subparsers(dest="action", metavar="ACTION")
+        actions.required = True
+        define = actions.add_parser("define", help="Define a sensor")
+        define.add_argument("sensor", metavar="ID",
+                type=self.shell.sensor_id)
+        define.add_argument("pin", metavar="PIN", type=int, nargs="?",
+                help="Arduino pin of the sensor (default: from the layout)")
+        define.add_argument("--no-pullup", dest="pullup", action="store_const",
+                const=0, help="Disable the internal pull-up")
+        define.add_argument("-d", "--debounce", metavar="SECONDS",
+                type=float, help="Debounce time of the sensor")
+        delete = actions.add_parser("delete", help="Delete a sensor")
+        delete.add_argument("sensor", metavar="ID",
+                type=self.shell.sensor_id)
+        actions.add_parser("show", help="Show the state of the sensors")
+        watch = actions.add_parser("watch", help="Print the sensor changes")
+        watch.add_argument("-t", "--timeout", metavar="TIMEOUT", type=float)
+        return parser
+
+    def run(self, session, line, args):
+        return getattr(self, "run_%s" % args.action)(self.shell.dcc, args)
+
+    def run_define(self, dcc, args):
+        # Missing settings are taken from the definition in the layout
+        layout = self.shell.cfg.layout
+        sid, pin, pullup, debounce = (layout.sensor_definition(args.sensor)
+                if layout is not None else None) or (args.sensor, None, 1,
+                None)
+        pin = pin if args.pin is None else args.pin
+        if pin is None:
+            raise ShCmd.Error("Sensor %d has no pin!" % args.sensor)
+        pullup = pullup if args.pullup is None else args.pullup
+        debounce = debounce if args.debounce is None else args.debounce
+        if debounce is not None:
+            dcc.sensors.set_debounce(args.sensor, debounce)
+        try:
+            dcc.define_sensor(args.sensor, pin, pullup).result()
+        except DCCpp.Error as ex:
+            raise ShCmd.Error("Unable to define sensor %d: %s" % (args.sensor,
+                    ex))
+        return True
+
+    def run_delete(self, dcc, args):
+        try:
+            dcc.delete_sensor(args.sensor).result()
+        except DCCpp.Error as ex:
+            raise ShCmd.Error("Unable to delete sensor %d: %s" % (args.sensor,
+                    ex))
+        return True
+
+    def run_show(self, dcc, args):
+        with dcc.batch():
+            dcc.refresh_sensors()
+            # The station answers in order, the status follows the sensors
+            status = dcc.status()
+        try:
+            status.result()
+        except DCCpp.Error as ex:
+            raise ShCmd.Error("Unable to refresh the sensors: %s" % ex)
+        layout = self.shell.cfg.layout
+        for sid, state in sorted(dcc.sensors.states().items()):
+            name = layout.name("sensor", sid) if layout is not None else None
+            self.stdout.write("%d %s%s\n" % (sid, "active" if state
+                    else "inactive", "" if name is None else " (%s)" % name))
+        return True
+
+    def run_watch(self, dcc, args):
+        self._stop = threading.Event()
+        try:
+            for sid, state in dcc.sensors.events(args.timeout, self._stop):
+                self.stdout.write("%d %s\n" % (sid, "active" if state
+                        else "inactive"))
+                self.stdout.flush()
+        finally:
+            self._stop = None
+        return True
+
+    def abort(self):
+        # Ends watch, which runs until it is aborted
+        stop = getattr(self, "_stop", None)
+        if stop is not None:
+            stop.set()
+            self.shell.dcc.sensors.wake()
+        return stop is not None
+
+
+class RouteCmd(ShCmd):
+    """Set routes of the layout
+
+    A ROUTE is the name of a route of the layout or TURNOUT:STATE, e.g.
+    yard-entry:thrown. The turnouts of all routes are switched together,
+    see --throws and --throw-interval.
+    """
+
+    def define_argparser(self):
+        parser = super(RouteCmd, self).define_argparser()
+        parser.add_argument("routes", metavar="ROUTE", nargs="+",
+                type=self.route_points)
+        parser.add_argument("-n", "--no-wait", action="store_true",
+                help="Do not wait for the confirmation of the turnouts")
+        return parser
+
+    def route_points(self, value):
+        from pyrail.drivers.arduino.layoutconfig import TURNOUT_STATES
+        layout = self.shell.cfg.layout
+        turnout, sep, state = value.rpartition(":")
+        if sep:
+            if state.lower() not in TURNOUT_STATES:
+                raise ArgumentTypeError("Invalid state: %s" % state)
+            return value, ((self.shell.turnout_address(turnout),
+                    TURNOUT_STATES[state.lower()]),)
+        if layout is None:
+            raise ArgumentTypeError("Unknown route: %s" % value)
+        try:
+            return value, layout.route(value)
+        except ValueError as ex:
+            raise ArgumentTypeError(str(ex))
+
+    def run(self, session, line, args):
+        engine = self.shell.start_routes()
+        routes = [engine.set_route(points, name)
+                for name, points in args.routes]
+        if args.no_wait:
+            return True
+        from pyrail.drivers.arduino.routes import RouteEngine
+        ok = True
+        for route in routes:
+            try:
+                elapsed = route.wait()
+            except RouteEngine.Error as ex:
+                _log.error("Route %s: %s" % (route.name, ex.message))
+                ok = False
+                continue
+            self.stdout.write("%s set in %.3fs: %d switched, %d confirmed, "
+                    "%d already set\n" % (route.name, elapsed, route.thrown,
+                    route.confirmed, route.skipped))
+        return ok
+
+
+class CvCmd(ShCmd):
+    """Read and write the CVs of the decoder on the programming track
+
+    dump reads all CVs, unchanged CVs are taken from the cache of the
+    decoder. The output of dump is the input of restore.
+    """
+
+    def define_argparser(self):
+        parser = super(CvCmd, self).define_argparser()
+        actions = parser.add_subparsers(dest="action", metavar="ACTION")
+        actions.required = True
+        read = actions.add_parser("read", help="Read CVs")
+        read.add_argument("cvs", metavar="CV", type=int, nargs="+")
+        write = actions.add_parser("write", help="Write and verify a CV")
+        write.add_argument("cv", metavar="CV", type=int)
+        write.add_argument("value", metavar="VALUE", type=int)
+        verify = actions.add_parser("verify", help="Check the value of a CV")
+        verify.add_argument("cv", metavar="CV", type=int)
+        verify.add_argument("value", metavar="VALUE", type=int)
+        dump = actions.add_parser("dump", help="Back up the decoder")
+        dump.add_argument("-o", "--output", metavar="FILE",
+                help="Write the CVs to FILE instead of stdout")
+        dump.add_argument("--refresh", action="store_true",
+                help="Read all CVs, ignore the cache")
+        restore = actions.add_parser("restore", help="Restore a backup")
+        restore.add_argument("file", metavar="FILE")
+        return parser
+
+    def run(self, session, line, args):
+        from pyrail.drivers.arduino.programmer import Programmer
+        programmer = Programmer(self.shell.dcc)
+        try:
+            return getattr(self, "run_%s" % args.action)(programmer, args)
+        except Programmer.Error as ex:
+            raise ShCmd.Error(ex.message)
+
+    def run_read(self, programmer, args):
+        values = programmer.read_cvs(args.cvs)
+        for cv in args.cvs:
+            self.stdout.write("%d %s\n" % (cv, "failed" if values[cv] is None
+                    else values[cv]))
+        return None not in values.values()
+
+    def run_write(self, programmer, args):
+        programmer.write(args.cv, args.value)
+        return True
+
+    def run_verify(self, programmer, args):
+        ok = programmer.verify(args.cv, args.value)
+        self.stdout.write("%s\n" % ("ok" if ok else "differs"))
+        return ok
+
+    def run_dump(self, programmer, args):
+        ident, values = programmer.dump(refresh=args.refresh)
+        out = "# address %d, manufacturer %d, version %d\n" % ident
+        out += "".join("%d %d\n" % (cv, value)
+                for cv, value in sorted(values.items()) if value is not None)
+        if args.output is not None:
+            with open(args.output, "w") as f:
+                f.write(out)
+        else:
+            self.stdout.write(out)
+        return True
+
+    def run_restore(self, programmer, args):
+        values = {}
+        try:
+            with open(args.file) as f:
+                for line in f:
+                    line = line.split("#", 1)[0].strip()
+                    if line:
+                        cv, value = map(int, line.split())
+                        values[cv] = value
+        except (OSError, ValueError) as ex:
+            raise ShCmd.Error("Unable to read %s: %s" % (args.file, ex))
+        failed = programmer.restore(values)
+        if failed:
+            _log.error("Restoring CVs %s failed!" % ", ".join(map(str,
+                    failed)))
+        return not failed
+
+
 def main():
     cli = DCCppCli()
     cli.start()
@@ -0,0 +1,105 @@
+import logging
+import sys
+import time
+
+from pyrail.utils.cli.cli import Cli
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.recorder import (TrafficLog, Replayer, INBOUND,
+        OUTBOUND)
+
+_log = logging.getLogger(__name__)
+
+
+class DCCppLogCli(Cli):
+    """DCC++ Traffic Log
+
+    Shows and replays the traffic recorded with: dccpp --record FILE
+    """
+
+    DIRECTIONS = {"in": INBOUND, "out": OUTBOUND}
+
+    def __init__(self):
+        super(DCCppLogCli, self).__init__("dccpp-log")
+
+    def define_argparser(self):
+        parser = super(DCCppLogCli, self).define_argparser()
+        parser.add_argument("action", choices=("show", "replay"),
+                help="Print the frames or send them to a station again")
+        parser.add_argument("file", metavar="FILE", help="Recorded log")
+        parser.add_argument("--since", metavar="SEC", type=float,
+                help="Skip the frames of the first SEC seconds")
+        parser.add_argument("--until", metavar="SEC", type=float,
+                help="Skip the frames after SEC seconds")
+        parser.add_argument("--cab", type=int,
+                help="Only frames of the CAB")
+        parser.add_argument("--codes", metavar="CODES",
+                help="Only frames of these command codes, e.g. 'tT'")
+        parser.add_argument("-d", "--direction", choices=("in", "out"),
+                help="Only the received (in) or sent (out) frames")
+        parser.add_argument("-p", "--port", metavar="DEV",
+                help="Serial port of the replay (default: %s)" %
+                self.cfg.port)
+        parser.add_argument("-s", "--speed", type=float, default=1.0,
+                help="Replay speed, 0 for as fast as possible "
+                "(default: 1.0)")
+        return parser
+
+    def run(self, args):
+        try:
+            log = TrafficLog(args.file)
+        except OSError as ex:
+            raise Cli.Error("Unable to open %s: %s" % (args.file, ex))
+        except TrafficLog.Error as ex:
+            raise Cli.Error(ex.message)
+        with log:
+            if args.action == "show":
+                return self.show(log, args)
+            return self.replay(log, args)
+
+    def show(self, log, args):
+        started = time.strftime("%Y-%m-%d %H:%M:%S",
+                time.localtime(log.started))
+        sys.stdout.write("# recorded %s\n" % started)
+        direction = DCCppLogCli.DIRECTIONS.get(args.direction)
+        for record in log.records(args.since, args.until, direction,
+                args.codes, args.cab):
+            sys.stdout.write("%12.6f %s <%s>\n" % (record.time,
+                    ">" if record.direction == OUTBOUND else "<",
+                    record.frame))
+        return True
+
+    def replay(self, log, args):
+        dcc = DCCpp(self.cfg.port)
+        dcc.connect()
+        try:
+            replayer = Replayer(log, dcc, args.speed or None)
+            sent = replayer.replay(args.since, args.until, args.codes,
+                    args.cab)
+        finally:
+            dcc.disconnect()
+        _log.info("Replayed %d frames, at most %.3fs late." % (sent,
+                replayer.late))
+        return True
+
+
+    class Config(Cli.Config):
+
+        def __init__(self):
+            super(DCCppLogCli.Config, self).__init__()
+            self.port = "auto"
+
+        def merge_args(self, args):
+            super(DCCppLogCli.Config, self).merge_args(args)
+            if args.port is not None:
+                self.port = args.port
+
+
+def main():
+    cli = DCCppLogCli()
+    cli.start()
+
+
+### MAIN PROGRAM
+
+if __name__ == "__main__":
+    main()
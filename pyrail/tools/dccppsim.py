@@ -0,0 +1,81 @@
+import logging
+import sys
+import time
+
+from pyrail.utils.cli.cli import Cli
+from pyrail.drivers.arduino.simulator import DCCppSimulator
+
+_log = logging.getLogger(__name__)
+
+
+class DCCppSimCli(Cli):
+    """DCC++ Base Station Simulator
+
+    Simulates a DCC++ Base Station on a pseudo-terminal. Use the printed
+    device as port of the dccpp tool, e.g.: dccpp -p /dev/pts/3
+    """
+
+    def __init__(self):
+        super(DCCppSimCli, self).__init__("dccpp-sim")
+        self.sim = None
+
+    def define_argparser(self):
+        parser = super(DCCppSimCli, self).define_argparser()
+        parser.add_argument("-b", "--baudrate", type=int,
+                help="Simulated baudrate, 0 for unlimited (default: %s)" %
+                self.cfg.baudrate)
+        parser.add_argument("--process-time", type=float, metavar="SEC",
+                help="Time to process one command (default: %s)" %
+                self.cfg.process_time)
+        parser.add_argument("--reply-delay", type=float, metavar="SEC",
+                help="Additional delay of each reply (default: %s)" %
+                self.cfg.reply_delay)
+        return parser
+
+    def create(self, args):
+        self.sim = DCCppSimulator(self.cfg.baudrate or None,
+                process_time=self.cfg.process_time,
+                reply_delay=self.cfg.reply_delay)
+        self.sim.start()
+
+    def run(self, args):
+        sys.stdout.write("%s\n" % self.sim.port)
+        sys.stdout.flush()
+        while True:
+            time.sleep(1)
+
+    def abort(self):
+        _log.info("Simulator statistics: %s" % self.sim.stats)
+        return Cli.EXIT_SUCCESS
+
+    def cleanup(self):
+        self.sim.stop()
+
+
+    class Config(Cli.Config):
+
+        def __init__(self):
+            super(DCCppSimCli.Config, self).__init__()
+            self.baudrate = DCCppSimulator.DEFAULT_BAUDRATE
+            self.process_time = 0.0
+            self.reply_delay = 0.0
+
+        def merge_args(self, args):
+            super(DCCppSimCli.Config, self).merge_args(args)
+            if args.baudrate is not None:
+                self.baudrate = args.baudrate
+            if args.process_time is not None:
+                self.process_time = args.process_time
+            if args.reply_delay is not None:
+                self.reply_delay = args.reply_delay
+
+
+def main():
+    cli = DCCppSimCli()
+    cli.start()
+
+
+### MAIN PROGRAM
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+
+def cache_path(*names):
+    """Return the path of a cache file or directory of pyrail
+
+    The caches are kept in $XDG_CACHE_HOME/pyrail, by default in
+    ~/.cache/pyrail.
+
+    """
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_dir, "pyrail", *names)
@@ -0,0 +1,237 @@
+import asyncio
+import logging
+import os
+import signal
+import termios
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+_log = logging.getLogger(__name__)
+
+
+class AsyncShLoop(object):
+    """Interactive loop of a shell on an asyncio event loop
+
+    The input is read without blocking the loop, on a terminal by readline
+    in an input thread, which only reads a line while the loop waits for
+    one. The commands run as a task in a worker thread,
+    so the loop prints the events of the shell (see Sh.notify) while a
+    command is running or the prompt waits for input. Events printed at the
+    prompt are written above it and the prompt is drawn again with the
+    typed input. A task runs all command lines which are waiting, e.g. of
+    piped input, so they are dispatched as fast as by cmdloop.
+
+    Ctrl-C calls the abort_* hook of the running command and cancels its
+    task. A command, which does not return on its abort hook, keeps running
+    in its worker thread, but the shell goes on with the next command. At
+    the prompt Ctrl-C interrupts the shell, like it interrupts cmdloop.
+
+    """
+
+    WORKERS = 4
+    READ_SIZE = 4096
+
+    def __init__(self, shell):
+        self.shell = shell
+        self.fd = shell.stdin.fileno()
+        self.tty = os.isatty(self.fd)
+        # Task running the commands, its cancel event and current command
+        self.running = None
+        self._cancel = None
+        self._command = None
+        self._loop = None
+        self._executor = None
+        self._readline = None
+        self._lines = deque()
+        self._buf = b""
+        self._eof = False
+        self._prompting = False
+        self._want_line = threading.Event()
+        self._termios = None
+        self._input = None
+        self._aborted = None
+        self._interrupted = False
+        self._events = []
+        self._events_lock = threading.Lock()
+
+    def run(self, intro=None):
+        asyncio.run(self._main(intro))
+        if self._interrupted:
+            raise KeyboardInterrupt()
+
+    async def _main(self, intro):
+        shell = self.shell
+        self._loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(AsyncShLoop.WORKERS,
+                thread_name_prefix="sh")
+        self._input = asyncio.Event()
+        if self.tty:
+            # readline is interrupted, when the shell is left at the prompt
+            self._termios = termios.tcgetattr(self.fd)
+            self._setup_readline()
+            threading.Thread(target=self._read_input, name="sh-input",
+                    daemon=True).start()
+        else:
+            self._loop.add_reader(self.fd, self._read_lines)
+        self._loop.add_signal_handler(signal.SIGINT, self._interrupt)
+        shell.preloop()
+        if intro:
+            shell.stdout.write("%s\n" % intro)
+        shell.async_loop = self
+        try:
+            stop = False
+            while not stop:
+                if not self._lines:
+                    if self._eof:
+                        break
+                    self._prompt()
+                    self._input.clear()
+                    await self._input.wait()
+                    continue
+                stop = await self._execute()
+        finally:
+            shell.async_loop = None
+            self._loop.remove_signal_handler(signal.SIGINT)
+            self._loop.remove_reader(self.fd)
+            self._teardown_readline()
+            if self._termios is not None:
+                termios.tcsetattr(self.fd, termios.TCSADRAIN, self._termios)
+            # Commands, which ignored their abort, are left behind
+            self._executor.shutdown(wait=False)
+            shell.postloop()
+
+    async def _execute(self):
+        """Run the waiting command lines, returns True to stop the shell"""
+        cancel = self._cancel = threading.Event()
+        task = self._loop.create_task(self._run(cancel))
+        self.running = task
+        try:
+            await asyncio.wait([task])
+        finally:
+            self.running = None
+        if task.cancelled():
+            return self.shell.postcmd(self._aborted, "")
+        return task.result()
+
+    async def _run(self, cancel):
+        return await self._loop.run_in_executor(self._executor,
+                self._run_lines, cancel)
+
+    def _run_lines(self, cancel):
+        # Runs in a worker thread, new lines are appended by the loop
+        shell = self.shell
+        lines = self._lines
+        while lines and not cancel.is_set():
+            line = shell.precmd(lines.popleft())
+            self._command = shell.parseline(line)[0]
+            ret = shell.onecmd(line)
+            if cancel.is_set():
+                # The loop went on already, the result is dropped
+                break
+            if shell.postcmd(ret, line):
+                return True
+        return False
+
+    def _interrupt(self):
+        if self.running is not None:
+            cmd = self._command
+            # Like Sh.onecmd on a KeyboardInterrupt
+            abort_func = getattr(self.shell, "abort_%s" % cmd, None) \
+                    if cmd else None
+            self._aborted = abort_func() if abort_func is not None else False
+            self._cancel.set()
+            self.running.cancel()
+        else:
+            self.shell.stdout.write("\n")
+            self._interrupted = self._eof = True
+            self._input.set()
+
+    def _prompt(self):
+        if self._prompting or not self.tty:
+            return
+        self._prompting = True
+        self._want_line.set()
+
+    def _read_input(self):
+        # The terminal is left alone while a command runs
+        while True:
+            self._want_line.wait()
+            self._want_line.clear()
+            try:
+                line = input(self.shell.prompt)
+            except EOFError:
+                line = None
+            try:
+                self._loop.call_soon_threadsafe(self._line_received, line)
+            except RuntimeError:
+                # The loop is closed already
+                return
+            if line is None:
+                return
+
+    def _line_received(self, line):
+        self._prompting = False
+        if line is None:
+            self.shell.stdout.write("\n")
+            self._eof = True
+        else:
+            self._lines.append(line)
+        self._input.set()
+
+    def _read_lines(self):
+        self._prompting = False
+        data = os.read(self.fd, AsyncShLoop.READ_SIZE)
+        if not data:
+            self._loop.remove_reader(self.fd)
+            if self._buf:
+                self._lines.append(self._buf.decode())
+                self._buf = b""
+            self._eof = True
+        else:
+            lines = (self._buf + data).split(b"\n")
+            self._buf = lines.pop()
+            self._lines.extend(line.decode() for line in lines)
+        self._input.set()
+
+    def _setup_readline(self):
+        try:
+            import readline
+        except ImportError:
+            return
+        self._readline = readline
+        self._old_completer = readline.get_completer()
+        readline.set_completer(self.shell.complete)
+        readline.parse_and_bind(self.shell.completekey + ": complete")
+
+    def _teardown_readline(self):
+        if self._readline is not None:
+            self._readline.set_completer(self._old_completer)
+        self._prompting = False
+
+    def notify(self, text):
+        """Print an event, may be called by any thread"""
+        with self._events_lock:
+            self._events.append(text)
+            if len(self._events) > 1:
+                return
+        try:
+            self._loop.call_soon_threadsafe(self._print_events)
+        except RuntimeError:
+            # The loop is closed already
+            self._print_events()
+
+    def _print_events(self):
+        with self._events_lock:
+            events, self._events = self._events, []
+        out = self.shell.stdout
+        text = "".join("%s\n" % event for event in events)
+        if self._prompting:
+            # Clear the prompt line, print the events and draw it again
+            line = self._readline.get_line_buffer() if self._readline \
+                    is not None else ""
+            out.write("\r\x1b[K%s%s%s" % (text, self.shell.prompt, line))
+        else:
+            out.write(text)
+        out.flush()
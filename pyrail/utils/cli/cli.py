@@ -1,10 +1,11 @@
 import logging
+import sys
 
 from argparse import (ArgumentParser, RawDescriptionHelpFormatter, FileType,
         ArgumentTypeError)
-from inspect import cleandoc
 
 from pyrail import __version__
+from pyrail.utils.doc import cleandoc
 from pyrail.utils.log.formatter import ColourFormatter
 from pyrail.exc.error import Error as pyrailError
 
@@ -27,6 +28,7 @@ class Cli(object):
         self.version = __version__
         self.logger = logging.getLogger()
         self.cfg = self.Config()
+        self.log_listener = None
 
     @property
     def log_level(self):
@@ -69,6 +71,9 @@ class Cli(object):
                 help="Log level 0-7 (RFC 5424, syslog)")
         parser.add_argument("-c", "--config-file", metavar="FILE",
                 dest="cfg_file", type=FileType("r"), help="Configuration FILE")
+        parser.add_argument("--log-queue", action="store_true", default=None,
+                help="Write the log messages in a separate thread, so slow "
+                "terminals do not block the program")
         return parser
 
     def parse_args(self):
@@ -78,10 +83,30 @@ class Cli(object):
     def setup_logging(self):
         log_console = logging.StreamHandler()
         log_console.setFormatter(ColourFormatter(self.cfg.log_format))
-        self.logger.addHandler(log_console)
+        if self.cfg.log_queue:
+            from pyrail.utils.log.handler import LogListener
+            self.log_listener = LogListener(log_console)
+            self.log_listener.start()
+            self.logger.addHandler(self.log_listener.handler)
+        else:
+            self.logger.addHandler(log_console)
         self.log_level = self.cfg.log_level
         _log.info("%s - %s" % (self.name, self.version))
 
+    def teardown_logging(self):
+        if self.log_listener is not None:
+            # Emit the queued records before exiting
+            self.log_listener.stop()
+            self.logger.removeHandler(self.log_listener.handler)
+            self.log_listener = None
+
+    def delegate(self, args):
+        """Hand the execution over to someone else, e.g. a running daemon
+
+        Returns the exit code, if the execution was delegated, otherwise None.
+        """
+        return None
+
     def create(self, args):
         pass
 
@@ -96,12 +121,27 @@ class Cli(object):
         pass
 
     def start(self):
-        exit_code = 1
         args = self.parse_args()
-        self.cfg.load_from_file(args.cfg_file)
+        try:
+            self.cfg.load_from_file(args.cfg_file)
+        except pyrailError as e:
+            # Logging is not set up yet
+            sys.stderr.write("%s: %s\n" % (self.name, e))
+            exit(Cli.EXIT_FAILURE)
         self.cfg.merge_args(args)
         self.setup_logging()
         try:
+            exit_code = self._start(args)
+        finally:
+            self.teardown_logging()
+        exit(exit_code)
+
+    def _start(self, args):
+        exit_code = Cli.EXIT_FAILURE
+        try:
+            delegated = self.delegate(args)
+            if delegated is not None:
+                return delegated
             self.create(args)
             try:
                 if self.run(args):
@@ -119,7 +159,7 @@ class Cli(object):
                 self.cleanup()
         except pyrailError as e:
             _log.error(e)
-        exit(exit_code)
+        return exit_code
 
 
     class Config(object):
@@ -127,6 +167,7 @@ class Cli(object):
         def __init__(self):
             self.log_level = 4
             self.log_format = "%(name)s %(levelname)s: %(message)s"
+            self.log_queue = False
 
         def load_from_file(self, file_name):
             pass
@@ -134,6 +175,8 @@ class Cli(object):
         def merge_args(self, args):
             if args.log_level is not None:
                 self.log_level = args.log_level
+            if args.log_queue is not None:
+                self.log_queue = args.log_queue
 
 
     class Error(pyrailError):
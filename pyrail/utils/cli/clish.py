@@ -1,8 +1,14 @@
 import logging
+import os
 import shlex
+import signal
+import sys
+
+from argparse import FileType
 
 from pyrail.utils.cli.cli import Cli
 from pyrail.utils.cli.sh import Sh
+from pyrail.utils.cli.script import Script
 from pyrail.exc.error import Error as pyrailError
 
 _log = logging.getLogger(__name__)
@@ -16,8 +22,42 @@ class CliSh(Sh, Cli):
         self.ignored_direct_cmds = ["help", "q", "quit", "exit", "last_ret",
                 "logging"]
 
+    @staticmethod
+    def socket_dir():
+        # Not tempfile.gettempdir(), importing tempfile slows the start
+        return os.environ.get("XDG_RUNTIME_DIR") or os.environ.get("TMPDIR") \
+                or "/tmp"
+
+    def daemon_key(self):
+        """Return what a daemon is running for, e.g. a port
+
+        Direct calls are only forwarded to a daemon with the same key, unless
+        a socket is given.
+        """
+        return ()
+
+    @property
+    def socket(self):
+        if self.cfg.socket is not None:
+            return self.cfg.socket
+        return os.path.join(self.socket_dir(), "pyrail-%s.sock" % "-".join(
+                (self.name,) + self.daemon_key() + (str(os.getuid()),)))
+
     def define_argparser(self):
         parser = super(CliSh, self).define_argparser()
+        parser.add_argument("-s", "--script", metavar="FILE",
+                type=FileType("r"), help="Run the commands of FILE ('-' for "
+                "stdin) and exit, see also: sleep and wait directives")
+        parser.add_argument("-d", "--daemon", action="store_true",
+                help="Keep running and execute the direct commands of other "
+                "%s calls, which are forwarded over a unix socket" % self.name)
+        parser.add_argument("--async", dest="use_asyncio",
+                action="store_true", default=None, help="Print events, e.g. "
+                "sensor changes, while the shell waits for input and run "
+                "the commands in the background")
+        parser.add_argument("--socket", metavar="PATH",
+                help="Unix socket of the daemon (default: pyrail-%s-*.sock "
+                "in %s)" % (self.name, self.socket_dir()))
         # Insert optional command and args arguments for direct calls
         parser.add_argument("cmd", nargs="?",
                 choices=self.get_commands(self.ignored_direct_cmds),
@@ -28,12 +68,70 @@ class CliSh(Sh, Cli):
                 help="Arguments of the command.")
         return parser
 
+    def run_script(self, script_file):
+        script = Script(self, script_file.name)
+        try:
+            script.compile(script_file)
+        except Script.Error as ex:
+            raise Cli.Error(str(ex))
+        finally:
+            script_file.close()
+        _log.debug("Running %d steps of %s." % (len(script), script.name))
+        return script.run()
+
+    @staticmethod
+    def direct_line(args):
+        if args.cmd is None:
+            return None
+        args_str = " ".join(map(shlex.quote, args.cmd_args))
+        return args.cmd + " " + args_str
+
+    def delegate(self, args):
+        line = self.direct_line(args)
+        if line is None or args.daemon:
+            return None
+        # Forward direct calls to a running daemon, which is connected already
+        from pyrail.utils.cli.daemon import ShServer, forward
+        try:
+            response = forward(self.socket, line)
+        except ShServer.Error as ex:
+            raise Cli.Error(str(ex))
+        if response is None:
+            return None
+        ok, output, errors = response
+        _log.debug("Executed by daemon: %s." % line)
+        sys.stdout.write(output)
+        sys.stderr.write(errors)
+        return Cli.EXIT_SUCCESS if ok else Cli.EXIT_FAILURE
+
+    def serve(self):
+        from pyrail.utils.cli.daemon import ShServer
+        try:
+            server = ShServer(self.socket, self, self.ignored_direct_cmds)
+        except (ShServer.Error, OSError) as ex:
+            raise Cli.Error(str(ex))
+        _log.info("Listening on '%s' ..." % self.socket)
+        # Terminate a daemon like an interrupted shell, so it cleans up
+        signal.signal(signal.SIGTERM, self._terminate)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return True
+
+    @staticmethod
+    def _terminate(signum, frame):
+        raise KeyboardInterrupt()
+
     def run(self, args):
-        line = None
-        if args.cmd is not None:
+        if args.daemon:
+            return self.serve()
+        if args.script is not None:
+            return self.run_script(args.script)
+        self.use_asyncio = self.cfg.use_asyncio
+        line = self.direct_line(args)
+        if line is not None:
             # Perform direct calls from command line
-            args_str = " ".join(map(shlex.quote, args.cmd_args))
-            line = args.cmd + " " + args_str
             _log.debug("Execute: %s." % line)
         return self.invoke(line)
 
@@ -62,3 +160,18 @@ class CliSh(Sh, Cli):
             self.stdout.write("%s:%s\n" % (self.log_level, self.log_level_name))
             ret = True
         return ret
+
+
+    class Config(Cli.Config):
+
+        def __init__(self):
+            super(CliSh.Config, self).__init__()
+            self.socket = None
+            self.use_asyncio = False
+
+        def merge_args(self, args):
+            super(CliSh.Config, self).merge_args(args)
+            if args.socket is not None:
+                self.socket = args.socket
+            if args.use_asyncio is not None:
+                self.use_asyncio = args.use_asyncio
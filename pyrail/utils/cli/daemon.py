@@ -0,0 +1,119 @@
+import io
+import logging
+import os
+import socket
+import socketserver
+import sys
+
+from pyrail.exc.error import Error as pyrailError
+
+_log = logging.getLogger(__name__)
+
+# A response is the status byte followed by the output of the command and
+# its error output, separated by a NUL byte
+STATUS_OK = b"0"
+STATUS_FAILED = b"1"
+SEPARATOR = b"\0"
+# Seconds a direct call waits for the response of the daemon
+FORWARD_TIMEOUT = 30.0
+
+
+class ShRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline().decode("utf-8").strip()
+        ok, output, errors = self.server.execute(line)
+        self.wfile.write((STATUS_OK if ok else STATUS_FAILED) +
+                output.encode("utf-8") + SEPARATOR + errors.encode("utf-8"))
+
+
+class ShServer(socketserver.UnixStreamServer):
+    """Unix domain socket server running command lines in a shell
+
+    Requests are handled one after the other, so the commands of all clients
+    are serialised like in an interactive shell.
+
+    """
+
+    def __init__(self, path, shell, excludes=[]):
+        if os.path.exists(path):
+            if is_running(path):
+                raise ShServer.Error("A daemon is already listening on '%s'!"
+                        % path)
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, ShRequestHandler)
+        self.path = path
+        self.shell = shell
+        self.excludes = excludes
+
+    def execute(self, line):
+        cmd = self.shell.parseline(line)[0]
+        if not cmd or cmd in self.excludes:
+            return False, "", "Command '%s' is not supported!\n" % line
+        _log.debug("Execute: %s.", line)
+        output, errors = io.StringIO(), io.StringIO()
+        stdout, self.shell.stdout = self.shell.stdout, output
+        # Usage errors of the commands are printed by argparse to stderr
+        stderr, sys.stderr = sys.stderr, errors
+        try:
+            ret = self.shell.invoke(line)
+        except pyrailError as ex:
+            _log.error(ex)
+            ret = False
+        finally:
+            self.shell.stdout = stdout
+            sys.stderr = stderr
+        return ret is not False, output.getvalue(), errors.getvalue()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+    class Error(pyrailError):
+        pass
+
+
+def is_running(path):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+        return True
+    except OSError:
+        return False
+
+
+def forward(path, line, timeout=FORWARD_TIMEOUT):
+    """Run a command line in the daemon listening on path
+
+    Returns a tuple of (ok, output, errors) or None, if no daemon is
+    listening. Raises ShServer.Error, if the daemon does not respond within
+    timeout seconds.
+
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sock.sendall(line.encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    except socket.timeout:
+        raise ShServer.Error("No response from the daemon on '%s' within %s "
+                "seconds!" % (path, timeout))
+    finally:
+        sock.close()
+    response = b"".join(chunks)
+    output, _, errors = response[1:].partition(SEPARATOR)
+    return (response[:1] == STATUS_OK, output.decode("utf-8"),
+            errors.decode("utf-8"))
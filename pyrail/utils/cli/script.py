@@ -0,0 +1,120 @@
+import logging
+import time
+
+from pyrail.exc.error import Error as pyrailError
+
+_log = logging.getLogger(__name__)
+
+
+class Script(object):
+    """Pre-parsed command script of a shell
+
+    Every line of a script is a shell command, empty lines and lines starting
+    with '#' are ignored. Additionally the following directives control the
+    timing of the script:
+
+     * sleep SECONDS: Continue SECONDS after the previous step was scheduled.
+       As the delays are not affected by the execution time of the commands,
+       the script does not drift.
+     * wait [SECONDS]: Wait until the shell confirms that all commands were
+       processed (see Sh.script_wait), at most SECONDS.
+
+    The whole script is parsed before it is executed, so at runtime the
+    commands only have to be run. Consecutive batchable commands (see
+    ShCmd.batchable) are run within one context of the shell (see
+    Sh.script_context), e.g. to send them at once. The other commands might
+    wait for a reply, so they are run on their own.
+
+    """
+
+    def __init__(self, shell, name="<script>"):
+        self.shell = shell
+        self.name = name
+        self.steps = []
+        # Commands between two barriers: [(steps, barrier), ...]
+        self._segments = []
+
+    def __len__(self):
+        return len(self.steps)
+
+    def compile(self, lines):
+        for lineno, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                self.steps.append(self.compile_line(line))
+            except (ValueError, Script.Error) as ex:
+                raise Script.Error("%s:%d: %s" % (self.name, lineno, ex))
+        commands = []
+        for step in self.steps:
+            # Directives, plain shell commands and commands, which might wait
+            # for replies, are run outside of the script context
+            if step[0] != self._run_cmd or not step[1][0].batchable:
+                self._segments.append((commands, step))
+                commands = []
+            else:
+                commands.append(step)
+        self._segments.append((commands, None))
+        return self
+
+    def compile_line(self, line):
+        cmd, arg, line = self.shell.parseline(line)
+        if cmd == "sleep":
+            return (self._sleep, float(arg))
+        elif cmd == "wait":
+            return (self._wait, float(arg) if arg else None)
+        sh_cmd = self.shell.commands.get(cmd)
+        if sh_cmd is not None:
+            args = sh_cmd.parse_args(arg)
+            if args is None:
+                raise Script.Error("Invalid arguments: %s" % line)
+            return (self._run_cmd, (sh_cmd, arg, args))
+        if not hasattr(self.shell, "do_%s" % cmd):
+            raise Script.Error("Unknown command: %s" % line)
+        return (self._run_line, line)
+
+    def run(self):
+        self._next = time.perf_counter()
+        self._ok = True
+        for commands, barrier in self._segments:
+            # The commands between two barriers share one script context
+            if commands:
+                with self.shell.script_context():
+                    for func, arg in commands:
+                        func(arg)
+            if barrier is not None:
+                barrier[0](barrier[1])
+        return self._ok
+
+    def _sleep(self, seconds):
+        self._next += seconds
+        delay = self._next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _wait(self, timeout):
+        if not self.shell.script_wait(timeout):
+            _log.warn("Waiting for the commands timed out!")
+            self._ok = False
+        self._next = time.perf_counter()
+
+    def _run_cmd(self, step):
+        sh_cmd, line, args = step
+        try:
+            context = sh_cmd.pre_run(line, args)
+            ret = sh_cmd.run(context, line, args)
+            ret = sh_cmd.post_run(ret, context, line, args)
+        except sh_cmd.Error as error:
+            _log.error(error.message)
+            ret = False
+        if ret is False:
+            self._ok = False
+
+    def _run_line(self, line):
+        if self.shell.onecmd(line) is False:
+            self._ok = False
+
+
+    class Error(pyrailError):
+        pass
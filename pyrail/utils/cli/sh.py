@@ -1,4 +1,7 @@
+import time
+
 from cmd import Cmd
+from contextlib import nullcontext
 
 from pyrail.utils.cli.shcmd import ShCmd
 
@@ -12,6 +15,13 @@ class Sh(Cmd, object):
         self.prompt = "%s>>> " % self.name
         self.parent_shell = None
         self.last_ret = None
+        self.commands = {}
+        self._names = None
+        # Instrumentation is switched off, while metrics is None
+        self.metrics = None
+        # Run the interactive loop on asyncio, see: async_cmdloop
+        self.use_asyncio = False
+        self.async_loop = None
 
     @property
     def root_shell(self):
@@ -31,21 +41,28 @@ class Sh(Cmd, object):
         if not issubclass(cmd_cls, ShCmd):
             raise TypeError("Expected subclass of ShCmd!")
         cmd = cmd_cls(self, name)
+        self._names = None
+        self.commands[cmd.name] = cmd
         setattr(self, "help_%s" % cmd.name, cmd.print_help)
         setattr(self, "do_%s" % cmd.name, cmd.invoke)
         if nick is not None:
-            setattr(self, "do_%s" % nick, cmd.invoke)        
+            self.commands[nick] = cmd
+            setattr(self, "do_%s" % nick, cmd.invoke)
         setattr(self, "abort_%s" % cmd.name, cmd.abort)
 
     def register_subshell(self, shell):
         if not isinstance(shell, Shell):
             raise TypeError("Expected instance of Shell!")
+        self._names = None
         setattr(self, "help_%s" % shell.name, shell.print_help)
         setattr(self, "do_%s" % shell.name, shell.invoke)
         shell.parent_shell = self
 
     def get_names(self):
-        return dir(self)
+        # Walking dir() is expensive, cache it until a command is registered
+        if self._names is None:
+            self._names = dir(self)
+        return self._names
 
     def get_commands(self, excludes=[]):
         cmds = []
@@ -69,10 +86,41 @@ class Sh(Cmd, object):
             line = self.precmd(line)
             ret = self.onecmd(line)
             self.postcmd(ret, line)
+        elif self.use_asyncio:
+            self.async_cmdloop()
         else:
             self.cmdloop()
         return self.last_ret
 
+    def async_cmdloop(self, intro=None):
+        """Interactive loop, which prints events while waiting for input
+
+        Falls back to cmdloop, if the input is no file, e.g. a StringIO.
+        """
+        try:
+            self.stdin.fileno()
+        except (AttributeError, OSError, ValueError):
+            return self.cmdloop(intro)
+        # asyncio is only imported when needed, as it is expensive
+        from pyrail.utils.cli.aiosh import AsyncShLoop
+        AsyncShLoop(self).run(intro)
+
+    def notify(self, text):
+        """Print an event, above the prompt of an asynchronous loop"""
+        async_loop = self.async_loop
+        if async_loop is not None:
+            async_loop.notify(text)
+        else:
+            self.stdout.write("%s\n" % text)
+
+    def script_context(self):
+        """Context of the commands of a script between two directives"""
+        return nullcontext()
+
+    def script_wait(self, timeout=None):
+        """Wait until all commands of a script were processed"""
+        return True
+
     def preloop(self):
         self.exit_shell = False
 
@@ -80,6 +128,22 @@ class Sh(Cmd, object):
         pass
 
     def onecmd(self, line):
+        metrics = self.metrics
+        if metrics is not None:
+            return self._onecmd_measured(metrics, line)
+        return self._onecmd(line)
+
+    def _onecmd_measured(self, metrics, line):
+        start = time.perf_counter()
+        try:
+            return self._onecmd(line)
+        finally:
+            metrics.record("shell.onecmd", time.perf_counter() - start)
+            cmd = self.parseline(line)[0]
+            if cmd:
+                metrics.count("shell.cmd.%s" % cmd)
+
+    def _onecmd(self, line):
         try:
             return Cmd.onecmd(self, line)
         except KeyboardInterrupt:
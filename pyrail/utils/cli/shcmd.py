@@ -1,9 +1,10 @@
 import logging
 import shlex
+import time
 
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
-from inspect import cleandoc
 
+from pyrail.utils.doc import cleandoc
 from pyrail.exc.error import Error as pyrailError
 
 _log = logging.getLogger(__name__)
@@ -11,10 +12,21 @@ _log = logging.getLogger(__name__)
 
 class ShCmd(object):
 
+    # Commands, which do not wait for replies, are run together within the
+    # context of a script (see Sh.script_context), the others on their own
+    batchable = False
+
     def __init__(self, shell, name):
         self.shell = shell
         self.name = name
-        self.argparser = self.define_argparser()
+        self._argparser = None
+
+    @property
+    def argparser(self):
+        # Build the parser on first use, so registering commands is cheap
+        if self._argparser is None:
+            self._argparser = self.define_argparser()
+        return self._argparser
 
     @property
     def stdin(self):
@@ -34,7 +46,7 @@ class ShCmd(object):
 
     def print_help(self):
         if self.argparser is not None:
-            self.argparser.print_help()
+            self.argparser.print_help(self.stdout)
         elif self.__doc__ is not None:
             self.stdout.write(cleandoc(self.__doc__))
         else:
@@ -64,13 +76,28 @@ class ShCmd(object):
         return ret
 
     def invoke(self, line):
+        metrics = self.shell.metrics
+        if metrics is not None:
+            return self._invoke_measured(metrics, line)
+        return self._invoke(self.parse_args(line), line)
+
+    def _invoke_measured(self, metrics, line):
+        start = time.perf_counter()
         args = self.parse_args(line)
+        parsed = time.perf_counter()
+        metrics.record("shell.parse", parsed - start)
+        try:
+            return self._invoke(args, line)
+        finally:
+            metrics.record("shell.run", time.perf_counter() - parsed)
+
+    def _invoke(self, args, line):
         if args is None:
             _log.debug("Parsing arguments failed.")
             return False
         # Check if user wants help, if so print help page and return
         if self.argparser is not None and args.help:
-            self.argparser.print_help()
+            self.argparser.print_help(self.stdout)
             return True
         # Run command 
         try:
@@ -0,0 +1,22 @@
+def cleandoc(doc):
+    """Clean up the indentation of a docstring
+
+    Same as inspect.cleandoc, but without importing the inspect module, which
+    is expensive at startup.
+
+    """
+    lines = doc.expandtabs().split("\n")
+    margin = None
+    for line in lines[1:]:
+        content = len(line.lstrip())
+        if content:
+            indent = len(line) - content
+            margin = indent if margin is None else min(margin, indent)
+    lines[0] = lines[0].lstrip()
+    if margin is not None:
+        lines[1:] = [line[margin:] for line in lines[1:]]
+    while lines and not lines[-1]:
+        lines.pop()
+    while lines and not lines[0]:
+        lines.pop(0)
+    return "\n".join(lines)
@@ -10,6 +10,23 @@ class ColourFormatter(logging.Formatter):
         self.warning_color = "\x1b[38;5;202m%s\x1b[0m"
         self.info_color = "\x1b[38;5;76m%s\x1b[0m"
         self.debug_color = "\x1b[38;5;8m%s\x1b[0m"
+        self.update_colours()
+
+    def update_colours(self):
+        """Rebuild the level to colour table after changing a colour"""
+        colours = []
+        for levelno in range(logging.CRITICAL + 1):
+            if levelno <= logging.DEBUG:
+                colours.append(self.debug_color)
+            elif levelno <= logging.INFO:
+                colours.append(self.info_color)
+            elif levelno <= logging.WARNING:
+                colours.append(self.warning_color)
+            elif levelno <= logging.ERROR:
+                colours.append(self.error_color)
+            else:
+                colours.append(self.critical_color)
+        self._colours = colours
 
     @staticmethod
     def colourise(fmt_msg, ansi_wrapper):
@@ -20,12 +37,8 @@ class ColourFormatter(logging.Formatter):
 
     def format(self, record):
         fmt_msg = super(ColourFormatter, self).format(record)
-        if record.levelno <= logging.DEBUG:
-            return self.colourise(fmt_msg, self.debug_color)
-        elif record.levelno <= logging.INFO:
-            return self.colourise(fmt_msg, self.info_color)
-        elif record.levelno <= logging.WARNING:
-            return self.colourise(fmt_msg, self.warning_color)
-        elif record.levelno <= logging.ERROR:
-            return self.colourise(fmt_msg, self.error_color)
-        return self.colourise(fmt_msg, self.critical_color)
+        try:
+            ansi_wrapper = self._colours[record.levelno]
+        except IndexError:
+            ansi_wrapper = self.critical_color
+        return self.colourise(fmt_msg, ansi_wrapper)
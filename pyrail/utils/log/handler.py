@@ -0,0 +1,47 @@
+import queue
+
+from logging.handlers import QueueHandler, QueueListener
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler which leaves the formatting to the listener thread
+
+    QueueHandler formats every record before it is queued, so it can be
+    pickled. The records of this handler stay within the process, hence the
+    message is only formatted by the handler which finally emits it.
+
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LogListener(object):
+    """Emit the log records of a queue in a separate thread
+
+    The handler of the listener only puts the records into the queue, so the
+    logging thread never blocks on the handlers, e.g. a slow terminal.
+
+    """
+
+    def __init__(self, *handlers):
+        self.queue = queue.SimpleQueue()
+        self.handler = DeferredQueueHandler(self.queue)
+        self._listener = QueueListener(self.queue, *handlers,
+                respect_handler_level=True)
+        self._running = False
+
+    @property
+    def handlers(self):
+        return self._listener.handlers
+
+    def start(self):
+        if not self._running:
+            self._listener.start()
+            self._running = True
+
+    def stop(self):
+        """Stop the thread after all queued records were emitted"""
+        if self._running:
+            self._listener.stop()
+            self._running = False
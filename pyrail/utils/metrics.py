@@ -0,0 +1,136 @@
+import bisect
+import json
+import threading
+import time
+
+
+class Histogram(object):
+    """Latency histogram with fixed buckets
+
+    Values are given in seconds, the buckets are defined by their upper
+    bounds. Recording a value is a bisect and an increment, so the histogram
+    is cheap enough for hot paths.
+
+    """
+
+    # Upper bounds of the buckets in seconds (10us .. 1s)
+    BOUNDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+            0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self, bounds=None):
+        self.bounds = tuple(bounds or Histogram.BOUNDS)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Return the upper bound of the bucket containing the percentile
+
+        The bound is limited to the maximum recorded value.
+
+        """
+        if self.count == 0:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if idx < len(self.bounds):
+                    return min(self.bounds[idx], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        buckets = {}
+        for idx, count in enumerate(self.counts):
+            if count:
+                if idx < len(self.bounds):
+                    label = "<=%gms" % (self.bounds[idx] * 1000)
+                else:
+                    label = ">%gms" % (self.bounds[-1] * 1000)
+                buckets[label] = count
+        return {
+            "count": self.count,
+            "mean_ms": (self.total / self.count * 1000) if self.count else
+                    None,
+            "p50_ms": _ms(self.percentile(50)),
+            "p99_ms": _ms(self.percentile(99)),
+            "max_ms": self.max * 1000,
+            "buckets": buckets,
+        }
+
+
+def _ms(value):
+    return None if value is None else value * 1000
+
+
+class Metrics(object):
+    """Registry of counters, gauges and histograms
+
+    Instrumented code keeps a reference to a Metrics object, which is None
+    while instrumentation is switched off. Like this the switched off
+    instrumentation only costs an attribute check.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self.started = time.time()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def gauge(self, name, func):
+        """Register a function which returns the current value of a gauge"""
+        self._gauges[name] = func
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def histogram(self, name):
+        return self._histograms.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = dict((name, h.snapshot())
+                    for name, h in self._histograms.items())
+        gauges = dict((name, func()) for name, func in self._gauges.items())
+        return {
+            "uptime": time.time() - self.started,
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), sort_keys=True, **kwargs)
@@ -14,13 +14,15 @@ module_metadata = dict(re.findall(r"__(.+)__\s*=\s*['\"](.*?)['\"]", init_file))
 setup(
 	name=PKG_NAME,
 	version=module_metadata["version"],
-	packages=find_packages(),
+	packages=find_packages(exclude=["benchmarks"]),
 	install_requires=[
 		"pyserial>=3.4",
 	],
 	entry_points={
 		"console_scripts": [
-			"dccpp = pyrail.tools.dccpp:main"
+			"dccpp = pyrail.tools.dccpp:main",
+			"dccpp-sim = pyrail.tools.dccppsim:main",
+			"dccpp-log = pyrail.tools.dccpplog:main"
 		]
 }
 )
\ No newline at end of file
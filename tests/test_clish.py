@@ -0,0 +1,18 @@
+import unittest
+
+from pyrail.tools.dccpp import DCCppCli
+
+
+class CliShTest(unittest.TestCase):
+
+    def socket(self, *argv):
+        cli = DCCppCli()
+        cli.cfg.merge_args(cli.define_argparser().parse_args(argv))
+        return cli.socket
+
+    def test_daemon_socket_per_port(self):
+        self.assertEqual(self.socket("off"), self.socket("-p", "auto", "off"))
+        self.assertNotEqual(self.socket("off"),
+                self.socket("-p", "/dev/ttyUSB1", "off"))
+        self.assertEqual(self.socket("--socket", "/tmp/x.sock", "-p",
+                "/dev/ttyUSB1", "off"), "/tmp/x.sock")
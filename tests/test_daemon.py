@@ -0,0 +1,63 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from pyrail.utils.cli.daemon import ShServer, forward
+from pyrail.utils.cli.sh import Sh
+from pyrail.utils.cli.shcmd import ShCmd
+
+
+class EchoCmd(ShCmd):
+    """Print a number"""
+
+    def define_argparser(self):
+        parser = super(EchoCmd, self).define_argparser()
+        parser.add_argument("number", type=int)
+        return parser
+
+    def run(self, context, line, args):
+        if args is None:
+            return False
+        self.stdout.write("%d\n" % args.number)
+        return True
+
+
+class SleepCmd(ShCmd):
+    """Sleep for half a second"""
+
+    def run(self, context, line, args):
+        time.sleep(0.5)
+        return True
+
+
+class ShServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.shell = Sh("test")
+        self.shell.register_command(EchoCmd, "echo")
+        self.shell.register_command(SleepCmd, "sleep")
+        self.path = os.path.join(tempfile.mkdtemp(), "test.sock")
+        self.server = ShServer(self.path, self.shell)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        os.rmdir(os.path.dirname(self.path))
+
+    def test_output(self):
+        self.assertEqual(forward(self.path, "echo 5"), (True, "5\n", ""))
+
+    def test_usage_errors_are_forwarded(self):
+        ok, output, errors = forward(self.path, "echo five")
+        self.assertFalse(ok)
+        self.assertEqual(output, "")
+        self.assertIn("invalid int value: 'five'", errors)
+
+    def test_timeout(self):
+        with self.assertRaises(ShServer.Error):
+            forward(self.path, "sleep", timeout=0.1)
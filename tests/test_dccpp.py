@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.simulator import DCCppSimulator
+
+
+class DCCppTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = DCCppSimulator(None)
+        self.sim.start()
+        self.dcc = DCCpp(self.sim.port, timeout=0.3)
+        self.dcc.connect()
+
+    def tearDown(self):
+        self.dcc.disconnect()
+        self.sim.stop()
+
+    def test_failed_throw_is_sent_again(self):
+        # Turnout 1 is not defined, the station refuses to throw it
+        with self.assertRaises(DCCpp.Error):
+            self.dcc.throw(1, 1).result(2)
+        self.dcc.define_turnout(1, 5, 0).result(2)
+        reply = self.dcc.throw(1, 1).result(2)
+        self.assertIsNotNone(reply)
+        self.assertEqual(reply.state, 1)
+        self.assertEqual(self.sim.turnouts[1], (5, 0, 1))
+
+    def test_unconfirmed_throttle_is_sent_again(self):
+        # The station ignores registers it does not have
+        with self.assertRaises(DCCpp.Error):
+            self.dcc.throttle(13, 3, 20).result(2)
+        self.assertIsNone(self.dcc.layout.cab(3).speed.commanded)
+        self.assertIsNotNone(self.dcc.throttle(1, 3, 20).result(2))
+        self.assertIsNone(self.dcc.throttle(1, 3, 20).result(2))
+
+    def test_refused_delete_fails(self):
+        # Sensor 7 is not defined, the station answers <X>
+        with self.assertRaises(DCCpp.Refused):
+            self.dcc.delete_sensor(7).result(0.2)
+        self.dcc.define_sensor(7, 3).result(2)
+        self.assertIsNotNone(self.dcc.delete_sensor(7).result(2))
+        self.assertNotIn(7, self.sim.sensors)
+
+    def test_refusal_fails_the_oldest_request(self):
+        with self.dcc.batch():
+            refused = self.dcc.delete_sensor(4)
+            defined = self.dcc.define_turnout(2, 6, 1)
+        with self.assertRaises(DCCpp.Refused):
+            refused.result(0.2)
+        self.assertTrue(defined.result(2).ok)
+        self.assertEqual(self.sim.turnouts[2], (6, 1, 0))
+
+    def test_held_sensor_change_is_reported_in_time(self):
+        self.dcc.sensors.debounce = 0.3
+        reported = []
+        done = threading.Event()
+        def _changed(sid, state):
+            reported.append((time.monotonic(), state))
+            if len(reported) == 2:
+                done.set()
+        self.dcc.sensors.add_listener(_changed)
+        self.sim.set_sensor(5, True)
+        time.sleep(0.05)
+        self.sim.set_sensor(5, False)
+        self.assertTrue(done.wait(2))
+        (first, active), (second, inactive) = reported
+        self.assertEqual((active, inactive), (True, False))
+        # Held back for the debounce time, but not until the reader wakes up
+        self.assertGreaterEqual(second - first, 0.3)
+        self.assertLess(second - first, 0.33)
@@ -0,0 +1,37 @@
+import time
+import unittest
+
+from pyrail.drivers.arduino.pool import StationPool
+from pyrail.drivers.arduino.simulator import DCCppSimulator
+
+
+class StationPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sims = dict((name, DCCppSimulator(None)) for name in "ab")
+        self.pool = StationPool("a")
+        for name, sim in self.sims.items():
+            sim.start()
+            self.pool.add_station(name, sim.port)
+        self.pool.connect()
+
+    def tearDown(self):
+        self.pool.close()
+        for sim in self.sims.values():
+            sim.stop()
+
+    def test_sensors_are_routed(self):
+        self.pool.route("sensor", (10, 19), "b")
+        self.pool.define_sensor(12, 3).result(2)
+        self.pool.define_sensor(2, 4).result(2)
+        self.assertEqual(set(self.sims["a"].sensors), {2})
+        self.assertEqual(set(self.sims["b"].sensors), {12})
+        self.assertIsNone(self.pool.sensor(12))
+        self.sims["b"].set_sensor(12, True)
+        deadline = time.monotonic() + 2
+        while self.pool.sensor(12) is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.pool.sensor(12))
+        self.assertIsNone(self.pool.sensor(2))
+        self.pool.delete_sensor(12).result(2)
+        self.assertEqual(set(self.sims["b"].sensors), set())
@@ -0,0 +1,70 @@
+import threading
+import unittest
+
+from contextlib import contextmanager
+
+from pyrail.drivers.arduino.dccpp import DCCpp
+from pyrail.drivers.arduino.ramp import RampEngine
+from pyrail.drivers.arduino.simulator import DCCppSimulator
+
+
+class RampEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = DCCppSimulator(None)
+        self.sim.start()
+        self.dcc = DCCpp(self.sim.port)
+        self.dcc.connect()
+        self.engine = RampEngine(self.dcc)
+
+    def tearDown(self):
+        self.dcc.disconnect()
+        self.sim.stop()
+
+    def _stop_on_batch(self):
+        """Stop cab 3 from another thread, when a tick starts to send"""
+        batch = self.dcc.batch
+
+        @contextmanager
+        def stopping_batch():
+            self.dcc.batch = batch
+            thread = threading.Thread(target=self.engine.emergency_stop,
+                    args=(3,))
+            thread.start()
+            thread.join(1.0)
+            with batch() as dcc:
+                yield dcc
+        self.dcc.batch = stopping_batch
+
+    def test_emergency_stop_during_step(self):
+        self.engine.ramp(None, 3, 126, rate=1000)
+        self.engine.step()
+        self._stop_on_batch()
+        self.engine.step()
+        self.assertTrue(self.dcc.wait_replies(2))
+        self.assertEqual(self.dcc.layout.cab(3).speed.commanded, 0)
+        # Speed -1 is the emergency stop of the station
+        self.assertEqual(self.sim.registers[1], (3, -1, 1))
+        self.assertEqual(self.engine.ramping, 0)
+
+    def test_emergency_stop_concurrent_with_step(self):
+        stopped = threading.Event()
+
+        def stop():
+            while not stopped.is_set():
+                self.engine.emergency_stop(3)
+        self.engine.ramp(None, 3, 126, rate=126)
+        self.engine.step()
+        thread = threading.Thread(target=stop)
+        thread.start()
+        try:
+            for i in range(200):
+                self.engine.ramp(None, 3, 126, rate=126)
+                self.engine.step(0.01)
+        finally:
+            stopped.set()
+            thread.join()
+        self.engine.emergency_stop(3)
+        self.assertTrue(self.dcc.wait_replies(2))
+        self.assertEqual(self.dcc.layout.cab(3).speed.commanded, 0)
+        self.assertEqual(self.sim.registers[1][1], -1)